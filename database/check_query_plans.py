@@ -0,0 +1,197 @@
+"""
+EXPLAIN the hot per-borrower reads and fail if any of them scans or sorts a whole table, or reads
+more monthly partitions of a log table (migration 007) than it should.
+
+    python database/check_query_plans.py
+
+Run it after database/migrate.py. Sequential scans are disabled for the session, so the check
+holds even on a nearly empty database: if the planner still picks a Seq Scan, no usable index exists.
+"""
+import os
+import sys
+import json
+import re
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from migrate import get_connection  # noqa: E402
+
+# Any id works: plans depend on the statistics, not on whether the row exists
+SAMPLE_ID = str(uuid.uuid4())
+# Keyset pages are checked from the start, where the most rows follow the cursor
+FIRST_PAGE_CURSOR = "00000000-0000-0000-0000-000000000000"
+PARTITION_NAME = re.compile(r"^(?P<parent>[a-z_]+)_p\d{6}$")
+
+# name -> (sql, params, tables that must not be read at all)
+CHECKED_QUERIES = {
+    "borrower by id with current decision": (
+        """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u
+        LEFT JOIN current_decision dl ON u.id = dl.borrower_id WHERE id = %s and u.role = %s
+        """,
+        (SAMPLE_ID, "borrower"),
+        ("decision_log",)
+    ),
+    "borrower page after a cursor": (
+        """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u
+        LEFT JOIN current_decision dl ON u.id = dl.borrower_id WHERE u.role = %s AND u.id > %s ORDER BY u.id LIMIT %s
+        """,
+        ("borrower", FIRST_PAGE_CURSOR, 101),
+        ("decision_log",)
+    ),
+    "borrower page filtered by decision": (
+        """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM current_decision dl
+        JOIN users u ON u.id = dl.borrower_id WHERE dl.final_decision = %s AND u.role = %s
+        AND dl.borrower_id > %s ORDER BY dl.borrower_id LIMIT %s
+        """,
+        ("approved", "borrower", FIRST_PAGE_CURSOR, 101),
+        ("decision_log",)
+    ),
+    "underwriter page after a cursor": (
+        "SELECT id, full_name, email, role FROM users WHERE role = %s AND id > %s ORDER BY id LIMIT %s",
+        ("underwriter", FIRST_PAGE_CURSOR, 101),
+        ()
+    ),
+    "current decision for eligibility": (
+        "SELECT final_decision FROM current_decision WHERE borrower_id = %s",
+        (SAMPLE_ID,),
+        ("decision_log",)
+    ),
+    "current decision for explanation and override": (
+        """
+        SELECT decision_id, final_decision, ml_result_id, rule_result_id, fairness_audit_log_id, explanation, type
+        FROM current_decision WHERE borrower_id = %s
+        """,
+        (SAMPLE_ID,),
+        ("decision_log",)
+    ),
+    "duplicate document check": (
+        "SELECT id FROM documents WHERE user_id = %s AND document_name = %s AND document_type = %s",
+        (SAMPLE_ID, "application.docx", "docx"),
+        ()
+    ),
+    "latest document for a borrower": (
+        "SELECT parsed_data FROM documents WHERE user_id = %s ORDER BY uploaded_at DESC LIMIT 1",
+        (SAMPLE_ID,),
+        ()
+    ),
+    "latest decision_log row (current_decision fallback)": (
+        "SELECT id FROM decision_log WHERE borrower_id = %s ORDER BY created_at DESC LIMIT 1",
+        (SAMPLE_ID,),
+        ()
+    ),
+    "ml results for a borrower": (
+        "SELECT id FROM ml_prediction_results WHERE user_id = %s",
+        (SAMPLE_ID,),
+        ()
+    ),
+    "rule evaluations for a borrower": (
+        "SELECT id FROM rule_evaluation_log WHERE user_id = %s",
+        (SAMPLE_ID,),
+        ()
+    ),
+    "decisions for a document": (
+        "SELECT id FROM decision_log WHERE document_id = %s",
+        (SAMPLE_ID,),
+        ()
+    ),
+    "fairness audits for a borrower": (
+        "SELECT id FROM fairness_audit_log WHERE ml_result_id IN (SELECT id FROM ml_prediction_results WHERE user_id = %s)",
+        (SAMPLE_ID,),
+        ()
+    ),
+}
+
+# name -> (sql, params, most partitions of any one log table the query may execute against).
+# Run with EXPLAIN ANALYZE, since partitions chosen from a joined row are only pruned at run time.
+PRUNED_QUERIES = {
+    "shap summary of a fresh ML result": (
+        """
+        SELECT shap_summary FROM ml_prediction_results
+        WHERE id = %s AND evaluated_at BETWEEN LOCALTIMESTAMP - make_interval(secs => %s) AND LOCALTIMESTAMP + make_interval(secs => %s)
+        """,
+        (SAMPLE_ID, 24 * 3600, 24 * 3600),
+        2
+    ),
+    "explanation results near the current decision": (
+        """
+        SELECT r.rule_status, m.predicted_decision, f.bias_detected FROM current_decision cd
+        LEFT JOIN rule_evaluation_log r ON r.id = cd.rule_result_id
+            AND r.evaluated_at BETWEEN cd.created_at - make_interval(secs => %s) AND cd.created_at + make_interval(secs => %s)
+        LEFT JOIN ml_prediction_results m ON m.id = cd.ml_result_id
+            AND m.evaluated_at BETWEEN cd.created_at - make_interval(secs => %s) AND cd.created_at + make_interval(secs => %s)
+        LEFT JOIN fairness_audit_log f ON f.id = cd.fairness_audit_log_id
+            AND f.audited_at BETWEEN cd.created_at - make_interval(secs => %s) AND cd.created_at + make_interval(secs => %s)
+        WHERE cd.borrower_id = (SELECT borrower_id FROM current_decision ORDER BY created_at DESC LIMIT 1)
+        """,
+        (24 * 3600,) * 6,
+        2
+    ),
+}
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_plan(plan: dict, forbidden_tables: tuple) -> list:
+    problems = []
+    for node in plan_nodes(plan):
+        node_type = node["Node Type"]
+        relation = node.get("Relation Name")
+        if node_type == "Seq Scan":
+            problems.append(f"Seq Scan on {relation}")
+        elif node_type in ("Sort", "Incremental Sort"):
+            problems.append(f"{node_type} on {node.get('Sort Key')}")
+        partition = PARTITION_NAME.match(relation or "")
+        if relation in forbidden_tables or (partition and partition["parent"] in forbidden_tables):
+            problems.append(f"reads {relation}")
+    return problems
+
+
+def check_pruning(plan: dict, max_partitions: int) -> list:
+    executed = {}
+    for node in plan_nodes(plan):
+        partition = PARTITION_NAME.match(node.get("Relation Name") or "")
+        if partition and node.get("Actual Loops", 0) > 0:
+            executed.setdefault(partition["parent"], set()).add(node["Relation Name"])
+    return [
+        f"reads {len(partitions)} partitions of {parent}"
+        for parent, partitions in executed.items() if len(partitions) > max_partitions
+    ]
+
+
+def report(name: str, problems: list) -> int:
+    print(f"{'FAIL' if problems else 'ok':<6}{name}" + (f": {', '.join(problems)}" if problems else ""))
+    return int(bool(problems))
+
+
+def main():
+    conn = get_connection()
+    failures = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            for name, (sql, params, forbidden_tables) in CHECKED_QUERIES.items():
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                result = cur.fetchone()[0]
+                plan = (result if isinstance(result, list) else json.loads(result))[0]["Plan"]
+                failures += report(name, check_plan(plan, forbidden_tables))
+            for name, (sql, params, max_partitions) in PRUNED_QUERIES.items():
+                cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+                result = cur.fetchone()[0]
+                plan = (result if isinstance(result, list) else json.loads(result))[0]["Plan"]
+                failures += report(name, check_pruning(plan, max_partitions))
+        conn.rollback()
+    finally:
+        conn.close()
+    if failures:
+        sys.exit(f"{failures} query plan(s) scan, sort or prune badly; see database/migrations/")
+
+
+if __name__ == "__main__":
+    main()
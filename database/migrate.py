@@ -0,0 +1,137 @@
+"""
+Apply the versioned SQL files in database/migrations/ on top of init.sql, in order, once each.
+
+    python database/migrate.py            # apply pending migrations
+    python database/migrate.py --status   # list applied and pending migrations
+
+Applied versions are recorded in schema_migrations. Each file runs in its own transaction,
+and an advisory lock keeps concurrent runners from applying the same file twice.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Arbitrary key for pg_advisory_lock, shared by every runner
+MIGRATION_LOCK_KEY = 72_011_012
+
+
+def get_connection():
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=int(os.getenv("POSTGRES_PORT", 5432)),
+        dbname=os.getenv("POSTGRES_DB", "mortgage_decisioning"),
+        user=os.getenv("POSTGRES_USER", "postgres"),
+        password=os.getenv("POSTGRES_PASSWORD", "postgres")
+    )
+
+
+def connect_with_retry(wait_seconds: float):
+    """Postgres may still be starting (e.g. under docker-compose), so retry until wait_seconds pass."""
+    give_up_at = time.monotonic() + wait_seconds
+    while True:
+        try:
+            return get_connection()
+        except psycopg2.OperationalError as e:
+            if time.monotonic() >= give_up_at:
+                raise
+            print(f"Database not ready ({str(e).strip()}); retrying ...")
+            time.sleep(2)
+
+
+def discover_migrations() -> list:
+    """(version, name, path, checksum) for every NNN_name.sql file, sorted by version."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith(".sql"):
+            continue
+        version, _, name = filename[:-4].partition("_")
+        path = os.path.join(MIGRATIONS_DIR, filename)
+        with open(path, "rb") as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        migrations.append((version, name, path, checksum))
+    return migrations
+
+
+def applied_migrations(cur) -> dict:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+
+def migrate(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        applied = applied_migrations(cur)
+        conn.commit()
+        count = 0
+        for version, name, path, checksum in discover_migrations():
+            if version in applied:
+                if applied[version] != checksum:
+                    print(f"WARNING: {version}_{name} changed after it was applied; write a new migration instead")
+                continue
+            print(f"Applying {version}_{name} ...")
+            with open(path) as f:
+                cur.execute(f.read())
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (version, name, checksum)
+            )
+            conn.commit()
+            count += 1
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        cur.close()
+
+
+def print_status(conn):
+    with conn.cursor() as cur:
+        applied = applied_migrations(cur)
+    conn.commit()
+    for version, name, _, checksum in discover_migrations():
+        if version not in applied:
+            state = "pending"
+        elif applied[version] != checksum:
+            state = "applied (file changed since)"
+        else:
+            state = "applied"
+        print(f"{version}_{name:<40}{state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations without applying them")
+    parser.add_argument("--wait", type=float, default=60.0, help="seconds to wait for the database to accept connections")
+    args = parser.parse_args()
+
+    conn = connect_with_retry(args.wait)
+    try:
+        if args.status:
+            print_status(conn)
+            return
+        count = migrate(conn)
+        print(f"Applied {count} migration(s)" if count else "Database is up to date")
+    except psycopg2.Error as e:
+        sys.exit(f"Migration failed: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
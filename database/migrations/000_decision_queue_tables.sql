@@ -0,0 +1,40 @@
+-- Tables of the decision-coordinator, created here rather than in init.sql so databases initialised
+-- before they existed get them too (006 indexes them).
+
+-- Durable queue of pending decisions; filled on upload, drained by decision-coordinator workers
+CREATE TABLE IF NOT EXISTS decision_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID REFERENCES users(id),
+    document_id UUID REFERENCES documents(id),
+    status TEXT CHECK (status IN ('queued', 'running', 'done', 'failed')) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP NOT NULL DEFAULT NOW(),  -- next time the job may be claimed (retry backoff)
+    locked_by TEXT,
+    locked_until TIMESTAMP,                      -- visibility timeout of the current claim
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_decision_jobs_claimable ON decision_jobs (run_after) WHERE status IN ('queued', 'running');
+
+-- Finished decisions keyed on everything that determines them, reused by repeat requests
+CREATE TABLE IF NOT EXISTS decision_cache (
+    document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
+    rule_set_version TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    user_id UUID REFERENCES users(id),
+    response JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (document_id, rule_set_version, model_version)
+);
+
+-- Responses already returned for a client-supplied Idempotency-Key
+CREATE TABLE IF NOT EXISTS decision_idempotency_keys (
+    idempotency_key TEXT PRIMARY KEY,
+    user_id UUID REFERENCES users(id),
+    document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
+    response JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,19 @@
+-- Secondary indexes for the per-borrower and per-document lookups made by every service.
+-- init.sql only defines primary keys, so each of these reads used to scan (and sort) the whole table.
+
+-- Latest decision per borrower, and the per-borrower deletes
+CREATE INDEX IF NOT EXISTS idx_decision_log_borrower_created ON decision_log (borrower_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_decision_log_document ON decision_log (document_id);
+
+-- Latest document per borrower, and the duplicate-upload check in check-eligibility
+CREATE INDEX IF NOT EXISTS idx_documents_user_uploaded ON documents (user_id, uploaded_at DESC);
+CREATE INDEX IF NOT EXISTS idx_documents_user_name ON documents (user_id, document_name);
+
+CREATE INDEX IF NOT EXISTS idx_ml_prediction_results_user ON ml_prediction_results (user_id);
+CREATE INDEX IF NOT EXISTS idx_ml_prediction_results_document ON ml_prediction_results (document_id);
+
+CREATE INDEX IF NOT EXISTS idx_rule_evaluation_log_user ON rule_evaluation_log (user_id);
+CREATE INDEX IF NOT EXISTS idx_rule_evaluation_log_document ON rule_evaluation_log (document_id);
+
+-- Audit rows are looked up and deleted through their ML result
+CREATE INDEX IF NOT EXISTS idx_fairness_audit_log_ml_result ON fairness_audit_log (ml_result_id);
@@ -0,0 +1,90 @@
+-- One row per borrower holding their latest decision_log entry, kept in step by triggers,
+-- so "what is this borrower's current decision" is a primary-key lookup instead of a sort over decision_log.
+CREATE TABLE IF NOT EXISTS current_decision (
+    borrower_id UUID PRIMARY KEY REFERENCES users(id),
+    decision_id UUID NOT NULL,
+    type TEXT NOT NULL,
+    final_decision TEXT NOT NULL,
+    document_id UUID,
+    underwriter_id UUID,
+    ml_result_id UUID,
+    rule_result_id UUID,
+    fairness_audit_log_id UUID,
+    explanation TEXT,
+    created_at TIMESTAMP
+);
+
+-- A new decision replaces the current one unless it is older (created_at is set by the writer)
+CREATE OR REPLACE FUNCTION current_decision_on_insert() RETURNS trigger AS $$
+BEGIN
+    IF NEW.borrower_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO current_decision (
+        borrower_id, decision_id, type, final_decision, document_id, underwriter_id,
+        ml_result_id, rule_result_id, fairness_audit_log_id, explanation, created_at
+    ) VALUES (
+        NEW.borrower_id, NEW.id, NEW.type, NEW.final_decision, NEW.document_id, NEW.underwriter_id,
+        NEW.ml_result_id, NEW.rule_result_id, NEW.fairness_audit_log_id, NEW.explanation, NEW.created_at
+    )
+    ON CONFLICT (borrower_id) DO UPDATE SET
+        decision_id = EXCLUDED.decision_id,
+        type = EXCLUDED.type,
+        final_decision = EXCLUDED.final_decision,
+        document_id = EXCLUDED.document_id,
+        underwriter_id = EXCLUDED.underwriter_id,
+        ml_result_id = EXCLUDED.ml_result_id,
+        rule_result_id = EXCLUDED.rule_result_id,
+        fairness_audit_log_id = EXCLUDED.fairness_audit_log_id,
+        explanation = EXCLUDED.explanation,
+        created_at = EXCLUDED.created_at
+    WHERE current_decision.created_at IS NULL
+       OR EXCLUDED.created_at IS NULL
+       OR current_decision.created_at <= EXCLUDED.created_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deleting the current decision falls back to the borrower's latest remaining one, if any.
+-- AFTER triggers run once the statement is done, so deleting all of a borrower's rows leaves nothing behind.
+CREATE OR REPLACE FUNCTION current_decision_on_delete() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM current_decision WHERE borrower_id = OLD.borrower_id AND decision_id = OLD.id;
+    IF FOUND THEN
+        INSERT INTO current_decision (
+            borrower_id, decision_id, type, final_decision, document_id, underwriter_id,
+            ml_result_id, rule_result_id, fairness_audit_log_id, explanation, created_at
+        )
+        SELECT borrower_id, id, type, final_decision, document_id, underwriter_id,
+               ml_result_id, rule_result_id, fairness_audit_log_id, explanation, created_at
+        FROM decision_log
+        WHERE borrower_id = OLD.borrower_id
+        ORDER BY created_at DESC
+        LIMIT 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_current_decision_insert ON decision_log;
+CREATE TRIGGER trg_current_decision_insert
+    AFTER INSERT ON decision_log
+    FOR EACH ROW EXECUTE FUNCTION current_decision_on_insert();
+
+DROP TRIGGER IF EXISTS trg_current_decision_delete ON decision_log;
+CREATE TRIGGER trg_current_decision_delete
+    AFTER DELETE ON decision_log
+    FOR EACH ROW EXECUTE FUNCTION current_decision_on_delete();
+
+-- Backfill from the existing log
+INSERT INTO current_decision (
+    borrower_id, decision_id, type, final_decision, document_id, underwriter_id,
+    ml_result_id, rule_result_id, fairness_audit_log_id, explanation, created_at
+)
+SELECT DISTINCT ON (borrower_id)
+       borrower_id, id, type, final_decision, document_id, underwriter_id,
+       ml_result_id, rule_result_id, fairness_audit_log_id, explanation, created_at
+FROM decision_log
+WHERE borrower_id IS NOT NULL
+ORDER BY borrower_id, created_at DESC
+ON CONFLICT (borrower_id) DO NOTHING;
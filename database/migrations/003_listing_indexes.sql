@@ -0,0 +1,4 @@
+-- Keyset-paginated user listings: each page is a range scan that starts at the cursor, in id order
+CREATE INDEX IF NOT EXISTS idx_users_role_id ON users (role, id);
+-- Borrower listings filtered by current decision
+CREATE INDEX IF NOT EXISTS idx_current_decision_status ON current_decision (final_decision, borrower_id);
@@ -0,0 +1,13 @@
+-- Uploaded files move out of documents.document_content into the content-addressed blob store
+-- (borrowers-helper blob_store.py); documents keeps only the SHA-256 key and size.
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_size BIGINT;
+
+-- Key existing rows by their content now; their bytes are copied into the blob store and
+-- document_content cleared by borrowers-helper's export_document_blobs.py
+UPDATE documents
+SET content_sha256 = encode(sha256(document_content), 'hex'),
+    content_size = octet_length(document_content)
+WHERE document_content IS NOT NULL AND content_sha256 IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_documents_content_sha256 ON documents (content_sha256);
@@ -0,0 +1,13 @@
+-- Announce every change to a borrower's current decision on the decision_changed channel
+-- (payload: borrower_id), so services caching per-decision data can evict it
+CREATE OR REPLACE FUNCTION notify_decision_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('decision_changed', COALESCE(NEW.borrower_id, OLD.borrower_id)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_current_decision_notify ON current_decision;
+CREATE TRIGGER trg_current_decision_notify
+    AFTER INSERT OR UPDATE OR DELETE ON current_decision
+    FOR EACH ROW EXECUTE FUNCTION notify_decision_changed();
@@ -0,0 +1,5 @@
+-- Bulk purge deletes per-borrower rows from these tables in batches; without an index on user_id
+-- each batch would scan the whole table
+CREATE INDEX IF NOT EXISTS idx_decision_jobs_user ON decision_jobs (user_id);
+CREATE INDEX IF NOT EXISTS idx_decision_cache_user ON decision_cache (user_id);
+CREATE INDEX IF NOT EXISTS idx_decision_idempotency_keys_user ON decision_idempotency_keys (user_id);
@@ -0,0 +1,149 @@
+-- Range-partition the append-only log tables by month on their timestamp column, so old months can be
+-- detached and archived (database/partition_maintenance.py) and reads bounded in time only visit
+-- recent partitions.
+--
+-- A primary key on a partitioned table must include the partition key, so ids become (id, timestamp)
+-- and the foreign keys between the log tables (which referenced id alone) are dropped. The services
+-- write those rows in dependency order within one transaction (log_writer.py). Foreign keys from the
+-- log tables to users and documents are kept.
+--
+-- Existing rows are copied into the new tables, so this migration holds the log tables for as long as
+-- the copy takes: run it before the services start, as docker-compose's db-migrate does.
+
+-- Create the monthly partition of parent that holds month_start, unless it already exists.
+-- Partitions are named <parent>_pYYYYMM.
+CREATE OR REPLACE FUNCTION create_log_partition(parent TEXT, month_start TIMESTAMP) RETURNS BOOLEAN AS $$
+DECLARE
+    first_day TIMESTAMP := date_trunc('month', month_start);
+    partition_name TEXT := format('%s_p%s', parent, to_char(first_day, 'YYYYMM'));
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, parent, first_day, first_day + INTERVAL '1 month');
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Make sure every partitioned log table has partitions from the current month through months_ahead
+-- months from now. Returns how many partitions were created. Run regularly by partition_maintenance.py.
+CREATE OR REPLACE FUNCTION ensure_log_partitions(months_ahead INTEGER DEFAULT 3) RETURNS INTEGER AS $$
+DECLARE
+    parent TEXT;
+    offset_months INTEGER;
+    created INTEGER := 0;
+BEGIN
+    FOR parent IN
+        SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname IN ('decision_log', 'rule_evaluation_log', 'ml_prediction_results', 'fairness_audit_log')
+    LOOP
+        FOR offset_months IN 0..months_ahead LOOP
+            IF create_log_partition(parent, date_trunc('month', LOCALTIMESTAMP) + make_interval(months => offset_months)) THEN
+                created := created + 1;
+            END IF;
+        END LOOP;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Swap one plain log table for a partitioned copy of it: same columns, defaults, checks and outgoing
+-- foreign keys, primary key (id, ts_column), one partition per month that has rows plus the next few.
+-- Indexes and triggers are recreated below, once the old table (and its index names) is gone.
+CREATE OR REPLACE FUNCTION pg_temp.partition_log_table(tbl TEXT, ts_column TEXT) RETURNS VOID AS $$
+DECLARE
+    old_tbl TEXT := tbl || '_unpartitioned';
+    fk RECORD;
+    first_month TIMESTAMP;
+    month_start TIMESTAMP;
+BEGIN
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, old_tbl);
+    -- Index names are schema-wide: free the primary key's for the new table
+    EXECUTE format('ALTER INDEX %I RENAME TO %I', tbl || '_pkey', old_tbl || '_pkey');
+    -- Every row needs a partition key; the column always had a NOW() default, so this is belt and braces
+    EXECUTE format('UPDATE %I SET %I = COALESCE((SELECT min(%I) FROM %I), LOCALTIMESTAMP) WHERE %I IS NULL',
+                   old_tbl, ts_column, ts_column, old_tbl, ts_column);
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+                   tbl, old_tbl, ts_column);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', tbl, ts_column);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (id, %I)', tbl, tbl || '_pkey', ts_column);
+    FOR fk IN
+        SELECT conname, pg_get_constraintdef(oid) AS definition FROM pg_constraint
+        WHERE conrelid = old_tbl::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I %s', tbl, fk.conname, fk.definition);
+    END LOOP;
+
+    EXECUTE format('SELECT date_trunc(''month'', min(%I)) FROM %I', ts_column, old_tbl) INTO first_month;
+    month_start := COALESCE(first_month, date_trunc('month', LOCALTIMESTAMP));
+    WHILE month_start <= date_trunc('month', LOCALTIMESTAMP) + INTERVAL '3 months' LOOP
+        PERFORM create_log_partition(tbl, month_start);
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    -- Rows dated after the pre-created months (clock skew on a writer) get their own partitions
+    EXECUTE format('SELECT create_log_partition(%L, m) FROM (SELECT DISTINCT date_trunc(''month'', %I) AS m FROM %I) months',
+                   tbl, ts_column, old_tbl);
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', tbl, old_tbl);
+    EXECUTE format('DROP TABLE %I', old_tbl);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Foreign keys that point at a log table's id cannot survive partitioning
+DO $$
+DECLARE
+    fk RECORD;
+BEGIN
+    FOR fk IN
+        SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+        WHERE contype = 'f'
+          AND confrelid IN ('decision_log'::regclass, 'rule_evaluation_log'::regclass,
+                            'ml_prediction_results'::regclass, 'fairness_audit_log'::regclass)
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.tbl, fk.conname);
+    END LOOP;
+END;
+$$;
+
+SELECT pg_temp.partition_log_table('decision_log', 'created_at');
+SELECT pg_temp.partition_log_table('rule_evaluation_log', 'evaluated_at');
+SELECT pg_temp.partition_log_table('ml_prediction_results', 'evaluated_at');
+SELECT pg_temp.partition_log_table('fairness_audit_log', 'audited_at');
+
+-- Secondary indexes from 001, now created on every partition
+CREATE INDEX IF NOT EXISTS idx_decision_log_borrower_created ON decision_log (borrower_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_decision_log_document ON decision_log (document_id);
+CREATE INDEX IF NOT EXISTS idx_ml_prediction_results_user ON ml_prediction_results (user_id);
+CREATE INDEX IF NOT EXISTS idx_ml_prediction_results_document ON ml_prediction_results (document_id);
+CREATE INDEX IF NOT EXISTS idx_rule_evaluation_log_user ON rule_evaluation_log (user_id);
+CREATE INDEX IF NOT EXISTS idx_rule_evaluation_log_document ON rule_evaluation_log (document_id);
+CREATE INDEX IF NOT EXISTS idx_fairness_audit_log_ml_result ON fairness_audit_log (ml_result_id);
+
+-- current_decision triggers from 002
+CREATE TRIGGER trg_current_decision_insert
+    AFTER INSERT ON decision_log
+    FOR EACH ROW EXECUTE FUNCTION current_decision_on_insert();
+CREATE TRIGGER trg_current_decision_delete
+    AFTER DELETE ON decision_log
+    FOR EACH ROW EXECUTE FUNCTION current_decision_on_delete();
+
+-- Partitions detached by partition_maintenance.py: 'detached' until the export is written, then
+-- 'archived' (and the table dropped)
+CREATE TABLE IF NOT EXISTS log_partition_archives (
+    partition_name TEXT PRIMARY KEY,
+    parent_table TEXT NOT NULL,
+    range_start TIMESTAMP NOT NULL,
+    range_end TIMESTAMP NOT NULL,
+    status TEXT CHECK (status IN ('detached', 'archived')) NOT NULL,
+    file_path TEXT,
+    row_count BIGINT,
+    sha256 TEXT,
+    detached_at TIMESTAMP DEFAULT NOW(),
+    archived_at TIMESTAMP
+);
+
+ANALYZE decision_log;
+ANALYZE rule_evaluation_log;
+ANALYZE ml_prediction_results;
+ANALYZE fairness_audit_log;
@@ -0,0 +1,39 @@
+-- The current rule-set version, kept in step with rules_config by a statement trigger, so readers get it
+-- with a primary-key lookup instead of hashing the table. The version is the same fingerprint the
+-- decision coordinator used to compute, so decision_cache keys stay valid. Every change is announced on
+-- the rules_changed channel (payload: the new version) for services that cache compiled rules.
+CREATE TABLE IF NOT EXISTS rule_set_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION rule_set_fingerprint() RETURNS TEXT AS $$
+    SELECT md5(COALESCE(string_agg(concat_ws('|', name, field, operator, value, message), E'\n' ORDER BY id), ''))
+    FROM rules_config;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION rule_set_version_refresh() RETURNS trigger AS $$
+DECLARE
+    new_version TEXT := rule_set_fingerprint();
+BEGIN
+    INSERT INTO rule_set_version (id, version, updated_at) VALUES (TRUE, new_version, NOW())
+    ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at
+    WHERE rule_set_version.version IS DISTINCT FROM EXCLUDED.version;
+    IF FOUND THEN
+        PERFORM pg_notify('rules_changed', new_version);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rule_set_version ON rules_config;
+CREATE TRIGGER trg_rule_set_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON rules_config
+    FOR EACH STATEMENT EXECUTE FUNCTION rule_set_version_refresh();
+
+INSERT INTO rule_set_version (id, version) VALUES (TRUE, rule_set_fingerprint())
+ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version;
+
+-- Which rule set produced each evaluation
+ALTER TABLE rule_evaluation_log ADD COLUMN IF NOT EXISTS rule_set_version TEXT;
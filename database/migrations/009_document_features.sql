@@ -0,0 +1,35 @@
+-- Typed features of each document, extracted once at upload by borrowers-helper (feature_extraction.py)
+-- from the raw parsed_data key/value strings. Columns are kept in step with feature_extraction.FEATURES;
+-- NULL means the document does not have the feature. Documents uploaded before this migration get
+-- their row from borrowers-helper's extract_document_features.py.
+CREATE TABLE IF NOT EXISTS document_features (
+    document_id UUID PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE,
+    salary NUMERIC CHECK (salary >= 0),
+    loan_amount NUMERIC CHECK (loan_amount >= 0),
+    credit_score INTEGER CHECK (credit_score BETWEEN 300 AND 850),
+    employment_years INTEGER CHECK (employment_years >= 0),
+    interest_rate NUMERIC,
+    loan_term_years INTEGER,
+    date_of_birth DATE,
+    application_date DATE,
+    employer TEXT,
+    purpose TEXT,
+    region TEXT,
+    debt_flag BOOLEAN,
+    manual_override BOOLEAN,
+    extracted_at TIMESTAMP DEFAULT NOW()
+);
+
+-- What the rule and ML engines evaluate: the raw parsed_data with the typed features laid over it, so
+-- canonical names (salary, loan_amount, ...) carry typed values and every other extracted key is still
+-- there as text. NULL only when the document has neither.
+CREATE OR REPLACE VIEW document_inputs AS
+SELECT
+    d.id AS document_id,
+    d.user_id,
+    CASE WHEN d.parsed_data IS NULL AND f.document_id IS NULL THEN NULL
+         ELSE COALESCE(d.parsed_data, '{}'::jsonb)
+              || COALESCE(jsonb_strip_nulls(to_jsonb(f) - 'document_id' - 'extracted_at'), '{}'::jsonb)
+    END AS features
+FROM documents d
+LEFT JOIN document_features f ON f.document_id = d.id;
@@ -0,0 +1,47 @@
+-- A DEFAULT partition per log table (migration 007), so a row dated outside every monthly partition
+-- (db-maintenance stopped for longer than PARTITION_MONTHS_AHEAD, or a writer's clock far off) is still
+-- written instead of failing the pipeline with "no partition of relation found for row".
+-- partition_maintenance.py reports any rows that land here; they are moved into their month's
+-- partition when ensure_log_partitions creates it.
+CREATE TABLE IF NOT EXISTS decision_log_default PARTITION OF decision_log DEFAULT;
+CREATE TABLE IF NOT EXISTS rule_evaluation_log_default PARTITION OF rule_evaluation_log DEFAULT;
+CREATE TABLE IF NOT EXISTS ml_prediction_results_default PARTITION OF ml_prediction_results DEFAULT;
+CREATE TABLE IF NOT EXISTS fairness_audit_log_default PARTITION OF fairness_audit_log DEFAULT;
+
+-- As in 007, but Postgres refuses to create a partition whose range has rows in the DEFAULT partition.
+-- When it does, the partition is built as a plain table, the month's rows are moved into it from the
+-- default, and it is attached; attaching adds the parent's indexes, keys and triggers.
+CREATE OR REPLACE FUNCTION create_log_partition(parent TEXT, month_start TIMESTAMP) RETURNS BOOLEAN AS $$
+DECLARE
+    first_day TIMESTAMP := date_trunc('month', month_start);
+    next_month TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    partition_name TEXT := format('%s_p%s', parent, to_char(first_day, 'YYYYMM'));
+    default_name TEXT := parent || '_default';
+    ts_column TEXT;
+    has_rows BOOLEAN := FALSE;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    IF to_regclass(default_name) IS NOT NULL THEN
+        SELECT a.attname INTO ts_column
+        FROM pg_partitioned_table p JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+        WHERE p.partrelid = parent::regclass;
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                       default_name, ts_column, first_day, ts_column, next_month) INTO has_rows;
+    END IF;
+    IF NOT has_rows THEN
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, parent, first_day, next_month);
+        RETURN TRUE;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                   default_name, ts_column, first_day, ts_column, next_month, partition_name);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition_name, first_day, next_month);
+    RAISE NOTICE 'Moved the % rows of % from % into %', to_char(first_day, 'YYYY-MM'), parent, default_name, partition_name;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,43 @@
+-- 010's create_log_partition moved a month's rows out of the DEFAULT partition with a DELETE, which fired
+-- the per-partition copies of the decision_log triggers (002, 007): each moved decision was taken out of
+-- current_decision (with a decision_changed NOTIFY), and attaching the new partition fires no insert
+-- trigger to put it back. The move now runs with the default partition's user triggers disabled; the
+-- ALTER TABLE holds its lock until the transaction ends, so no other write skips them meanwhile.
+-- partition_maintenance.py check exercises this path.
+CREATE OR REPLACE FUNCTION create_log_partition(parent TEXT, month_start TIMESTAMP) RETURNS BOOLEAN AS $$
+DECLARE
+    first_day TIMESTAMP := date_trunc('month', month_start);
+    next_month TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    partition_name TEXT := format('%s_p%s', parent, to_char(first_day, 'YYYYMM'));
+    default_name TEXT := parent || '_default';
+    ts_column TEXT;
+    has_rows BOOLEAN := FALSE;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    IF to_regclass(default_name) IS NOT NULL THEN
+        SELECT a.attname INTO ts_column
+        FROM pg_partitioned_table p JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+        WHERE p.partrelid = parent::regclass;
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                       default_name, ts_column, first_day, ts_column, next_month) INTO has_rows;
+    END IF;
+    IF NOT has_rows THEN
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, parent, first_day, next_month);
+        RETURN TRUE;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+    -- The rows only change partition, so the parent's row triggers must not see them deleted
+    EXECUTE format('ALTER TABLE %I DISABLE TRIGGER USER', default_name);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                   default_name, ts_column, first_day, ts_column, next_month, partition_name);
+    EXECUTE format('ALTER TABLE %I ENABLE TRIGGER USER', default_name);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition_name, first_day, next_month);
+    RAISE NOTICE 'Moved the % rows of % from % into %', to_char(first_day, 'YYYY-MM'), parent, default_name, partition_name;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,252 @@
+"""
+Keep the monthly partitions of the log tables (migration 007) rolling.
+
+    python database/partition_maintenance.py ensure    # create partitions for the coming months
+    python database/partition_maintenance.py archive   # detach, export and drop months past retention
+    python database/partition_maintenance.py run       # both, then again every --interval seconds
+    python database/partition_maintenance.py check     # test moving DEFAULT rows into a new partition
+
+Archiving detaches a partition from its table, writes its rows to
+<archive dir>/<table>/<partition>.csv.gz, records the file in log_partition_archives and drops it.
+The detach is recorded before anything else happens, so a run that stops halfway is finished by the next.
+
+Every command then warns about rows in the tables' DEFAULT partitions (migration 010): they are dated
+outside every monthly partition, which means partitions were not created in time or a writer's clock is
+off. ensure moves them into their month's partition when it creates it; "ensure" and "archive" exit
+with status 2 while any are left. "check" runs that move on a test decision and rolls it back,
+exiting non-zero if the decision's current_decision row did not survive it.
+"""
+import os
+import re
+import sys
+import gzip
+import time
+import hashlib
+import argparse
+from datetime import datetime
+from psycopg2 import sql
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from migrate import connect_with_retry  # noqa: E402
+
+# Partitions kept ready ahead of the current month, and full months kept attached behind it
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", 12))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "/archive")
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", 6 * 3600))
+# DETACH briefly locks the whole table; give up rather than queue writers behind a long-running query
+DETACH_LOCK_TIMEOUT = os.getenv("PARTITION_DETACH_LOCK_TIMEOUT", "5s")
+
+LOG_TABLES = ("decision_log", "rule_evaluation_log", "ml_prediction_results", "fairness_audit_log")
+# Month used by check_default_partition_move; far enough ahead that no partition exists for it
+CHECK_MONTH = datetime(2999, 1, 1)
+PARTITION_NAME = re.compile(r"^(?P<parent>[a-z_]+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def month_range(partition: str) -> tuple:
+    """[start, end) of a <parent>_pYYYYMM partition."""
+    match = PARTITION_NAME.match(partition)
+    year, month = int(match["year"]), int(match["month"])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def ensure_partitions(conn, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT ensure_log_partitions(%s)", (months_ahead,))
+        created = cur.fetchone()[0]
+    conn.commit()
+    return created
+
+
+def default_partition_rows(conn) -> dict:
+    """Rows in each log table's DEFAULT partition, for tables that have any."""
+    counts = {}
+    with conn.cursor() as cur:
+        for table in LOG_TABLES:
+            default = f"{table}_default"
+            cur.execute("SELECT to_regclass(%s)", (default,))
+            if cur.fetchone()[0] is None:
+                continue
+            cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(default)))
+            count = cur.fetchone()[0]
+            if count:
+                counts[default] = count
+    conn.commit()
+    return counts
+
+
+def check_default_partition_move(conn) -> list:
+    """
+    Write a decision for a throwaway borrower into decision_log's DEFAULT partition, create its month's
+    partition so create_log_partition moves it, and check the decision is still the borrower's current
+    decision. Everything is rolled back. Returns the problems found.
+    """
+    problems = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (f"decision_log_p{CHECK_MONTH:%Y%m}",))
+            if cur.fetchone()[0] is not None:
+                return [f"decision_log already has a partition for {CHECK_MONTH:%Y-%m}; cannot run the check"]
+            cur.execute("""
+                INSERT INTO users (full_name, email, password_hash, role)
+                VALUES ('partition check', 'partition-check@invalid', '', 'borrower')
+                RETURNING id
+            """)
+            borrower_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO decision_log (type, borrower_id, final_decision, created_at)
+                VALUES ('auto', %s, 'approved', %s)
+                RETURNING id
+            """, (borrower_id, CHECK_MONTH))
+            decision_id = cur.fetchone()[0]
+            cur.execute("SELECT tableoid::regclass::text FROM decision_log WHERE id = %s", (decision_id,))
+            if cur.fetchone()[0] != "decision_log_default":
+                return ["the test decision did not land in decision_log_default"]
+            cur.execute("SELECT create_log_partition('decision_log', %s)", (CHECK_MONTH,))
+            cur.execute("SELECT tableoid::regclass::text FROM decision_log WHERE id = %s", (decision_id,))
+            row = cur.fetchone()
+            if row is None or row[0] != f"decision_log_p{CHECK_MONTH:%Y%m}":
+                problems.append(f"the test decision was not moved into its month's partition (found in {row and row[0]})")
+            cur.execute("SELECT decision_id FROM current_decision WHERE borrower_id = %s", (borrower_id,))
+            row = cur.fetchone()
+            if row is None or row[0] != decision_id:
+                problems.append("moving the test decision out of decision_log_default changed its borrower's current_decision")
+    finally:
+        # The NOTIFYs of a rolled-back transaction are never sent, so listeners see nothing of this
+        conn.rollback()
+    return problems
+
+
+def expired_partitions(conn, retention_months: int) -> list:
+    """(parent, partition) for attached monthly partitions that end before the retention window starts."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)", (retention_months,))
+        cutoff = cur.fetchone()[0]
+        cur.execute("""
+            SELECT parent.relname, child.relname FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = ANY(%s)
+            ORDER BY child.relname
+        """, (list(LOG_TABLES),))
+        partitions = cur.fetchall()
+    conn.commit()
+    return [
+        (parent, partition) for parent, partition in partitions
+        if PARTITION_NAME.match(partition) and month_range(partition)[1] <= cutoff
+    ]
+
+
+def detach_partition(conn, parent: str, partition: str):
+    start, end = month_range(partition)
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s", (DETACH_LOCK_TIMEOUT,))
+        cur.execute("""
+            INSERT INTO log_partition_archives (partition_name, parent_table, range_start, range_end, status)
+            VALUES (%s, %s, %s, %s, 'detached')
+        """, (partition, parent, start, end))
+        cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(parent), sql.Identifier(partition)))
+    conn.commit()
+
+
+def export_partition(conn, parent: str, partition: str, archive_dir: str) -> tuple:
+    """Write a detached partition to a gzipped CSV. Returns (path, row count, sha256 of the file)."""
+    directory = os.path.join(archive_dir, parent)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{partition}.csv.gz")
+    tmp_path = path + ".tmp"
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(partition)))
+        row_count = cur.fetchone()[0]
+        copy = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(partition))
+        with gzip.open(tmp_path, "wb") as f:
+            cur.copy_expert(copy.as_string(cur), f)
+    conn.commit()
+    digest = hashlib.sha256()
+    with open(tmp_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    os.replace(tmp_path, path)
+    return path, row_count, digest.hexdigest()
+
+
+def drop_partition(conn, partition: str, path: str, row_count: int, sha256: str):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE log_partition_archives
+            SET status = 'archived', file_path = %s, row_count = %s, sha256 = %s, archived_at = NOW()
+            WHERE partition_name = %s
+        """, (path, row_count, sha256, partition))
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+    conn.commit()
+
+
+def archive_partitions(conn, archive_dir: str = LOG_ARCHIVE_DIR,
+                       retention_months: int = PARTITION_RETENTION_MONTHS) -> list:
+    """Archive every partition past retention, after finishing any left detached by an earlier run."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT parent_table, partition_name FROM log_partition_archives WHERE status = 'detached'")
+        unfinished = cur.fetchall()
+    conn.commit()
+    archived = []
+    for parent, partition in unfinished + expired_partitions(conn, retention_months):
+        if (parent, partition) not in unfinished:
+            detach_partition(conn, parent, partition)
+        path, row_count, sha256 = export_partition(conn, parent, partition, archive_dir)
+        drop_partition(conn, partition, path, row_count, sha256)
+        print(f"Archived {partition}: {row_count} rows -> {path}")
+        archived.append(partition)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming log partitions and archive old ones")
+    parser.add_argument("command", choices=("ensure", "archive", "run", "check"))
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--retention-months", type=int, default=PARTITION_RETENTION_MONTHS)
+    parser.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR)
+    parser.add_argument("--interval", type=float, default=PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+                        help="seconds between passes for the run command")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        conn = connect_with_retry(120.0)
+        try:
+            problems = check_default_partition_move(conn)
+        finally:
+            conn.close()
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("Moving DEFAULT partition rows keeps current_decision intact")
+        return
+
+    while True:
+        conn = connect_with_retry(120.0)
+        stray = {}
+        try:
+            if args.command in ("ensure", "run"):
+                print(f"Created {ensure_partitions(conn, args.months_ahead)} partition(s)")
+            if args.command in ("archive", "run"):
+                archived = archive_partitions(conn, args.archive_dir, args.retention_months)
+                print(f"Archived {len(archived)} partition(s)")
+            stray = default_partition_rows(conn)
+            for default, count in stray.items():
+                print(f"ALERT: {default} holds {count} row(s) outside every monthly partition", file=sys.stderr)
+        except Exception as e:
+            if args.command != "run":
+                sys.exit(f"Partition maintenance failed: {e}")
+            # The next pass retries; nothing is dropped before its export is written
+            print(f"Partition maintenance pass failed: {e}")
+        finally:
+            conn.close()
+        if args.command != "run":
+            sys.exit(2 if stray else 0)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
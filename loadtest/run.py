@@ -0,0 +1,228 @@
+"""
+Drive /process-decision and /borrower/{email}/check-eligibility at a target concurrency or RPS
+and report throughput and p50/p95/p99 latency per endpoint.
+
+    python loadtest/run.py process-decision --concurrency 32 --duration 60
+    python loadtest/run.py check-eligibility --rps 20 --requests 500 --json-out results.json
+    python loadtest/run.py process-decision --rps 50 --duration 60 --baseline results.json
+
+Targets come from the manifest written by seed.py.
+"""
+import io
+import os
+import math
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import Counter
+import httpx
+
+DECISION_COORDINATOR_URL = os.getenv("DECISION_COORDINATOR_URL", "http://localhost:8002")
+BORROWERS_HELPER_URL = os.getenv("BORROWERS_HELPER_URL", "http://localhost:8001/borrower-helper-service")
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LOADTEST_REQUEST_TIMEOUT_SECONDS", 60.0))
+
+ENDPOINTS = ("process-decision", "check-eligibility")
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_application_docx(parsed_data: dict) -> bytes:
+    """A .docx application with one 'Key: Value' line per field, as borrowers upload them."""
+    from docx import Document
+
+    document = Document()
+    document.add_paragraph("Mortgage Loan Application")
+    for key, value in parsed_data.items():
+        document.add_paragraph(f"{key.replace('_', ' ').title()}: {value}")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+async def send_process_decision(client: httpx.AsyncClient, target: dict, args) -> str:
+    headers = {"X-Deadline-Budget-Ms": str(args.deadline_ms)} if args.deadline_ms else {}
+    resp = await client.post(
+        f"{args.coordinator_url}/process-decision",
+        json={"user_id": target["user_id"], "document_id": target["document_id"]},
+        headers=headers
+    )
+    if resp.status_code != 200:
+        return f"http_{resp.status_code}"
+    body = resp.json()
+    return body.get("final_decision") or f"error:{body.get('reason')}"
+
+
+async def send_check_eligibility(client: httpx.AsyncClient, target: dict, args) -> str:
+    filename = f"loadtest-{uuid.uuid4().hex[:12]}.docx"
+    resp = await client.post(
+        f"{args.borrowers_url}/borrower/{target['email']}/check-eligibility",
+        files={"file": (filename, target["docx"], DOCX_MEDIA_TYPE)}
+    )
+    if resp.status_code != 200:
+        return f"http_{resp.status_code}"
+    body = resp.json()
+    message = body.get("message")
+    return body.get("status") or (message.get("status") if isinstance(message, dict) else None) or "submitted"
+
+
+async def run_endpoint(endpoint: str, targets: list, args) -> dict:
+    """
+    Closed loop (--concurrency workers back to back) or open loop (--rps arrivals, at most
+    --concurrency in flight). In open-loop mode latency is measured from the scheduled send
+    time, so queueing behind a slow server is counted instead of hidden.
+    """
+    send = send_process_decision if endpoint == "process-decision" else send_check_eligibility
+    latencies = []
+    outcomes = Counter()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    started = time.perf_counter()
+    stop_at = started + args.duration if args.duration else None
+    total = args.requests if args.requests else None
+    issued = 0
+
+    def more() -> bool:
+        if total is not None and issued >= total:
+            return False
+        return stop_at is None or time.perf_counter() < stop_at
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_SECONDS, limits=limits) as client:
+        async def one(index: int, scheduled: float):
+            target = targets[index % len(targets)]
+            try:
+                outcome = await send(client, target, args)
+            except httpx.HTTPError as e:
+                outcome = f"transport_error:{type(e).__name__}"
+            latencies.append(time.perf_counter() - scheduled)
+            outcomes[outcome] += 1
+
+        if args.rps:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            tasks = []
+
+            async def paced(index: int, scheduled: float):
+                async with semaphore:
+                    await one(index, scheduled)
+
+            while more():
+                scheduled = started + issued / args.rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(paced(issued, scheduled)))
+                issued += 1
+            await asyncio.gather(*tasks)
+        else:
+            async def worker():
+                nonlocal issued
+                while more():
+                    index = issued
+                    issued += 1
+                    await one(index, time.perf_counter())
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    errors = sum(count for outcome, count in outcomes.items()
+                 if outcome.startswith(("http_", "transport_error", "error:")))
+    return {
+        "mode": "open" if args.rps else "closed",
+        "requests": len(ordered),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        "outcomes": dict(outcomes.most_common())
+    }
+
+
+def print_report(results: dict):
+    print(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<20}{r['requests']:>10}{r['errors']:>8}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+        print(f"{'':<20}outcomes: {r['outcomes']}")
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    p95/p99 slower than the baseline by more than the tolerance, or lower throughput.
+    Throughput is only compared between closed-loop runs; in open loop it is set by --rps.
+    """
+    regressions = []
+    for endpoint, r in results.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and r[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{endpoint} {key} {base[key]} -> {r[key]}")
+        closed_loop = r["mode"] == base.get("mode") == "closed"
+        if closed_loop and base["throughput_rps"] and r["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint} throughput_rps {base['throughput_rps']} -> {r['throughput_rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the decision endpoints")
+    parser.add_argument("endpoints", nargs="+", choices=ENDPOINTS)
+    parser.add_argument("--manifest", default="loadtest_seed.json", help="targets written by seed.py")
+    parser.add_argument("--concurrency", type=int, default=16, help="workers (closed loop) or max in flight (with --rps)")
+    parser.add_argument("--rps", type=float, default=None, help="target arrival rate; omit for closed-loop mode")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests per endpoint")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds per endpoint")
+    parser.add_argument("--deadline-ms", type=int, default=None, help="send X-Deadline-Budget-Ms with each decision")
+    parser.add_argument("--coordinator-url", default=DECISION_COORDINATOR_URL)
+    parser.add_argument("--borrowers-url", default=BORROWERS_HELPER_URL)
+    parser.add_argument("--json-out", default=None, help="write the results here, e.g. to use as a later baseline")
+    parser.add_argument("--baseline", default=None, help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        args.requests = 1000
+
+    with open(args.manifest) as f:
+        targets = json.load(f)
+    if not targets:
+        sys.exit("Manifest is empty; run loadtest/seed.py first")
+
+    results = {}
+    for endpoint in args.endpoints:
+        if endpoint == "check-eligibility":
+            # Build the uploads up front so document generation is not part of the measured latency
+            for target in targets:
+                target.setdefault("docx", build_application_docx(target["parsed_data"]))
+        print(f"Running {endpoint} against {len(targets)} seeded borrowers ...")
+        results[endpoint] = asyncio.run(run_endpoint(endpoint, targets, args))
+
+    print_report(results)
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("REGRESSIONS against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Seed Postgres with synthetic borrowers, each with one parsed application document, for the load test.
+Borrower figures are drawn from the dataset/generate_synthetic.py distributions.
+
+    python loadtest/seed.py --borrowers 1000
+"""
+import os
+import sys
+import json
+import argparse
+import psycopg2
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "borrowers-helper-service", "app"))
+from generate_synthetic import load_config, generate  # noqa: E402
+from feature_extraction import INSERT_FEATURES_SQL, extract_features, feature_row  # noqa: E402
+
+EMAIL_DOMAIN = "loadtest.example.com"
+# bcrypt hash of 'password', same as the default users in dataset/users.csv
+PASSWORD_HASH = "$2b$12$Z6c3pHL5zdaqlStD25Zp8.G7dkOknuDwRrgQUiVUpjCn9hpoLtMOK"
+EMPLOYERS = ["ABC Corp", "Globex", "Initech", "Umbrella Health", "temp agency", "Stark Industries"]
+DEFAULT_MANIFEST = "loadtest_seed.json"
+
+
+def get_connection():
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=int(os.getenv("POSTGRES_PORT", 5432)),
+        dbname=os.getenv("POSTGRES_DB", "mortgage_decisioning"),
+        user=os.getenv("POSTGRES_USER", "postgres"),
+        password=os.getenv("POSTGRES_PASSWORD", "postgres")
+    )
+
+
+def parsed_data_for(index: int, record) -> dict:
+    """parsed_data in the shape borrowers-helper extracts from an uploaded application."""
+    return {
+        "applicant_name": f"Load Test Borrower {index}",
+        "email": f"borrower{index}@{EMAIL_DOMAIN}",
+        "credit_score": str(int(record.credit_score)),
+        "employer": EMPLOYERS[index % len(EMPLOYERS)],
+        "employment_years": str(int(record.employment_years)),
+        "annual_salary": f"${int(record.salary):,}",
+        "loan_amount": f"${int(record.loan_amount):,}",
+        "loan_term": "30 years",
+        "purpose": "Purchase of Primary Residence"
+    }
+
+
+def remove_previous_seed(cur):
+    """Delete earlier load-test borrowers and everything recorded for them, children first."""
+    cur.execute("SELECT id FROM users WHERE email LIKE %s", (f"%@{EMAIL_DOMAIN}",))
+    user_ids = [row[0] for row in cur.fetchall()]
+    if not user_ids:
+        return 0
+    cur.execute("DELETE FROM decision_log WHERE borrower_id = ANY(%s::uuid[])", (user_ids,))
+    cur.execute("""
+        DELETE FROM fairness_audit_log WHERE ml_result_id IN (
+            SELECT id FROM ml_prediction_results WHERE user_id = ANY(%s::uuid[])
+        )
+    """, (user_ids,))
+    for table in ("ml_prediction_results", "rule_evaluation_log", "decision_jobs", "decision_cache",
+                  "decision_idempotency_keys", "documents"):
+        cur.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s::uuid[])", (user_ids,))
+    cur.execute("DELETE FROM users WHERE id = ANY(%s::uuid[])", (user_ids,))
+    return len(user_ids)
+
+
+def seed(borrowers: int, random_seed: int = None) -> list:
+    records = generate(load_config(), num_samples=borrowers, seed=random_seed)
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        removed = remove_previous_seed(cur)
+        if removed:
+            print(f"Removed {removed} previously seeded borrowers")
+
+        users = [
+            (f"Load Test Borrower {i}", f"borrower{i}@{EMAIL_DOMAIN}", PASSWORD_HASH, "borrower")
+            for i in range(borrowers)
+        ]
+        user_ids = execute_values(
+            cur,
+            "INSERT INTO users (full_name, email, password_hash, role) VALUES %s RETURNING id",
+            users,
+            page_size=1000,
+            fetch=True
+        )
+
+        documents = [
+            (user_id, "loadtest-application", "docx", json.dumps(parsed_data_for(i, record)))
+            for i, ((user_id,), record) in enumerate(zip(user_ids, records.itertuples()))
+        ]
+        document_ids = execute_values(
+            cur,
+            "INSERT INTO documents (user_id, document_name, document_type, parsed_data) VALUES %s RETURNING id",
+            documents,
+            page_size=1000,
+            fetch=True
+        )
+        # Typed features, as borrowers-helper extracts them at upload
+        execute_values(
+            cur,
+            INSERT_FEATURES_SQL,
+            [feature_row(document_id, extract_features(json.loads(parsed))[0])
+             for (document_id,), (_, _, _, parsed) in zip(document_ids, documents)],
+            page_size=1000
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    return [
+        {"user_id": str(user_id), "email": email, "document_id": str(document_id), "parsed_data": json.loads(parsed)}
+        for (user_id,), (document_id,), (_, email, _, _), (_, _, _, parsed) in zip(user_ids, document_ids, users, documents)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic borrowers and documents for the load test")
+    parser.add_argument("--borrowers", type=int, default=1000, help="number of borrowers to create, one document each")
+    parser.add_argument("--seed", type=int, default=None, help="random seed (defaults to generator_config.yaml)")
+    parser.add_argument("--out", default=DEFAULT_MANIFEST, help="where to write the seeded ids for run.py")
+    args = parser.parse_args()
+
+    manifest = seed(args.borrowers, args.seed)
+    with open(args.out, "w") as f:
+        json.dump(manifest, f)
+    print(f"Seeded {len(manifest)} borrowers with documents; manifest written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Configurable-latency stand-in for the rule engine, ML decision and fairness auditor services.
+Point the coordinator's RULE_ENGINE_URL / ML_DECISION_SERVICE_URL / FAIRNESS_AUDITOR_SERVICE_URL at it
+to measure the coordinator on its own. Nothing is written to the database.
+
+    python loadtest/stub_service.py --port 9003 --latency-ms 20 --jitter-ms 5
+"""
+import os
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, Optional
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+# Defaults can also come from the environment (see loadtest/docker-compose.stubs.yml)
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", 20))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", 0))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", 0))
+
+settings = {"latency_ms": STUB_LATENCY_MS, "jitter_ms": STUB_JITTER_MS, "error_rate": STUB_ERROR_RATE}
+
+app = FastAPI(title="Load Test Stub Service", version="1.0")
+
+
+class StubRequest(BaseModel):
+    user_id: str
+    document_id: Optional[str] = None
+    ml_result_id: Optional[str] = None
+    features: Optional[Dict[str, Any]] = None
+    shap_summary: Optional[Dict[str, float]] = None
+
+
+async def simulate():
+    """Sleep for the configured latency (+/- jitter), then fail a configured share of calls with a 503."""
+    delay = settings["latency_ms"] + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+    await asyncio.sleep(max(0.0, delay) / 1000.0)
+    if random.random() < settings["error_rate"]:
+        raise HTTPException(status_code=503, detail="stub failure")
+
+
+@app.post("/evaluate-rules")
+async def evaluate_rules(request: StubRequest):
+    await simulate()
+    return {"status": "pass", "reasons": {}, "rule_result_id": None}
+
+
+@app.post("/evaluate-ml-decision")
+async def evaluate_ml_decision(request: StubRequest):
+    await simulate()
+    return {
+        "status": "accepted",
+        "confidence": "0.9",
+        "ml_result_id": None,
+        "shap_summary": {"salary": 0.1, "credit_score": 0.1, "employment_years": 0.0, "loan_amount": -0.1}
+    }
+
+
+@app.post("/bias-check")
+async def bias_check(request: StubRequest):
+    await simulate()
+    return {"is_biased": False, "flagged_features": {}, "audit_notes": "No significant bias detected.", "audit_result_id": None}
+
+
+@app.get("/model-version")
+def model_version():
+    return {"model_version": "stub"}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a configurable-latency downstream stub")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=STUB_JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=STUB_ERROR_RATE, help="share of calls answered with 503")
+    args = parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
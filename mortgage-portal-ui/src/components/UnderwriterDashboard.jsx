@@ -7,14 +7,19 @@ import DecisionModal from './DecisionModal';
 
 function UnderwriterDashboard({ user, onSwitch }) {
   const [borrowers, setBorrowers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [selected, setSelected] = useState(null);
   const [report, setReport] = useState(null);
   const [letter, setLetter] = useState(null);
   const [showDecisionModal, setShowDecisionModal] = useState(false);
 
-  const fetchBorrowers = async () => {
-    const res = await axios.get('http://localhost:8001/borrower-helper-service/borrowers');
-    setBorrowers(res.data);
+  // Borrowers come a page at a time; X-Next-Cursor points at the next page
+  const fetchBorrowers = async (cursor = null) => {
+    const res = await axios.get('http://localhost:8001/borrower-helper-service/borrowers', {
+      params: cursor ? { cursor } : {}
+    });
+    setBorrowers(cursor ? (prev) => [...prev, ...res.data] : res.data);
+    setNextCursor(res.headers['x-next-cursor'] || null);
   };
 
   useEffect(() => {
@@ -61,6 +66,10 @@ function UnderwriterDashboard({ user, onSwitch }) {
         }}
       />
 
+      {nextCursor && (
+        <button className="mt-2 bg-gray-200 px-4 py-2 rounded" onClick={() => fetchBorrowers(nextCursor)}>Load more</button>
+      )}
+
       {report && <ReportPanel report={report} onClose={() => setReport(null)}/>}
 
       {showDecisionModal && selected && (
@@ -0,0 +1,59 @@
+"""
+Copy document_content of existing documents rows into the blob store and clear the column.
+Run once after migration 004_document_blobs, where the blob store is mounted:
+
+    docker-compose exec borrowers-helper-service python export_document_blobs.py
+
+Rows are handled in batches, each committed on its own, so the script can be stopped and re-run.
+"""
+import io
+import argparse
+from db import get_connection
+from logger import logger
+from blob_store import get_blob_store
+
+EXPORT_BATCH_SIZE = 100
+
+
+def export_batch(conn, blob_store, batch_size: int) -> int:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, document_content FROM documents
+            WHERE document_content IS NOT NULL
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        rows = cur.fetchall()
+        for document_id, content in rows:
+            sha256, size = blob_store.put_stream(io.BytesIO(bytes(content)))
+            cur.execute("""
+                UPDATE documents SET content_sha256 = %s, content_size = %s, document_content = NULL
+                WHERE id = %s
+            """, (sha256, size, document_id))
+    conn.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move inline document_content into the blob store")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    blob_store = get_blob_store()
+    conn = get_connection()
+    total = 0
+    try:
+        while True:
+            count = export_batch(conn, blob_store, args.batch_size)
+            if not count:
+                break
+            total += count
+            logger.info("Exported %d documents to the blob store", total)
+    finally:
+        conn.close()
+    print(f"Exported {total} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Extract typed features (document_features) for documents uploaded before migration 009_document_features:
+
+    docker-compose exec borrowers-helper-service python extract_document_features.py
+
+New uploads get their features at upload time. Old documents were never validated, so a value that
+does not parse is left NULL and reported here instead of failing. Rows are handled in batches, each
+committed on its own, so the script can be stopped and re-run.
+"""
+import argparse
+from psycopg2.extras import execute_values
+from db import get_connection
+from logger import logger
+from feature_extraction import INSERT_FEATURES_SQL, extract_features, feature_row
+
+EXTRACT_BATCH_SIZE = 1000
+
+
+def extract_batch(conn, batch_size: int) -> tuple:
+    """(documents handled, values rejected) for one batch of documents without a features row."""
+    rejected = 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT d.id, d.parsed_data FROM documents d
+            WHERE NOT EXISTS (SELECT 1 FROM document_features f WHERE f.document_id = d.id)
+            ORDER BY d.id
+            LIMIT %s
+            FOR UPDATE OF d SKIP LOCKED
+        """, (batch_size,))
+        documents = cur.fetchall()
+        rows = []
+        for document_id, parsed_data in documents:
+            features, errors = extract_features(parsed_data if isinstance(parsed_data, dict) else {})
+            for name, error in errors.items():
+                logger.warning("Document %s: %s left empty (%s)", document_id, name, error)
+            rejected += len(errors)
+            rows.append(feature_row(document_id, features))
+        if rows:
+            execute_values(cur, INSERT_FEATURES_SQL, rows, page_size=len(rows))
+    conn.commit()
+    return len(documents), rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill document_features for documents that have none")
+    parser.add_argument("--batch-size", type=int, default=EXTRACT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    conn = get_connection()
+    total = rejected = 0
+    try:
+        while True:
+            count, batch_rejected = extract_batch(conn, args.batch_size)
+            if not count:
+                break
+            total += count
+            rejected += batch_rejected
+            logger.info("Extracted features for %d documents", total)
+    finally:
+        conn.close()
+    print(f"Extracted features for {total} documents ({rejected} values rejected and left empty)")
+
+
+if __name__ == "__main__":
+    main()
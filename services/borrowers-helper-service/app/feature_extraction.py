@@ -0,0 +1,136 @@
+"""
+Turn the key/value metadata extracted from an application into typed features, stored in
+document_features (migration 009). Rules, the ML model and override training read these typed values
+instead of re-parsing strings such as "$145,000".
+
+Stdlib only, so loadtest/seed.py can import it as well.
+"""
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+NUMBER = "number"
+INTEGER = "integer"
+BOOLEAN = "boolean"
+CATEGORY = "category"
+DATE = "date"
+
+# Amounts may carry a currency sign, thousands separators and a unit: "$145,000", "6.25%", "30 years"
+NUMBER_PATTERN = re.compile(r"^\$?\s*(?P<number>[-+]?(\d[\d,]*)?\.?\d+)\s*(%|years?|yrs?)?$", re.IGNORECASE)
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d %B %Y", "%B %d, %Y")
+BOOLEAN_VALUES = {
+    "true": True, "yes": True, "y": True, "1": True,
+    "false": False, "no": False, "n": False, "0": False,
+}
+
+
+class Feature:
+    """
+    One document_features column: its type, the metadata keys it may be extracted from (first
+    present wins) and, for numbers, the range a valid value lies in.
+    """
+    __slots__ = ("name", "kind", "aliases", "minimum", "maximum")
+
+    def __init__(self, name: str, kind: str, aliases: tuple = (), minimum=None, maximum=None):
+        self.name = name
+        self.kind = kind
+        self.aliases = (name,) + tuple(alias for alias in aliases if alias != name)
+        self.minimum = minimum
+        self.maximum = maximum
+
+
+# Keep in step with the document_features columns
+FEATURES = (
+    Feature("salary", NUMBER, ("annual_salary", "annual_income", "income"), minimum=0),
+    Feature("loan_amount", NUMBER, ("loan_amount_requested", "requested_loan_amount"), minimum=0),
+    Feature("credit_score", INTEGER, (), minimum=300, maximum=850),
+    Feature("employment_years", INTEGER, ("years_employed", "years_of_employment"), minimum=0, maximum=80),
+    Feature("interest_rate", NUMBER, (), minimum=0, maximum=100),
+    Feature("loan_term_years", INTEGER, ("loan_term",), minimum=1, maximum=50),
+    Feature("date_of_birth", DATE, ("dob",)),
+    Feature("application_date", DATE, ("date",)),
+    Feature("employer", CATEGORY, ("employer_name",)),
+    Feature("purpose", CATEGORY, ("loan_purpose",)),
+    Feature("region", CATEGORY),
+    Feature("debt_flag", BOOLEAN),
+    Feature("manual_override", BOOLEAN),
+)
+FEATURE_COLUMNS = tuple(feature.name for feature in FEATURES)
+
+
+def _parse_number(text: str):
+    match = NUMBER_PATTERN.match(text)
+    if not match:
+        raise ValueError("not a number")
+    try:
+        number = Decimal(match["number"].replace(",", ""))
+    except InvalidOperation:
+        raise ValueError("not a number")
+    # Whole amounts stay integers, so they read back as 145000 rather than 145000.0
+    return int(number) if number == number.to_integral_value() else float(number)
+
+
+def _parse_date(text: str) -> date:
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError("not a date (expected YYYY-MM-DD)")
+
+
+def parse_feature(feature: Feature, value):
+    """The typed value of one feature; raises ValueError when the value does not fit its type."""
+    if isinstance(value, bool) and feature.kind == BOOLEAN:
+        return value
+    text = str(value).strip()
+    if feature.kind == BOOLEAN:
+        if text.lower() not in BOOLEAN_VALUES:
+            raise ValueError("not yes/no or true/false")
+        return BOOLEAN_VALUES[text.lower()]
+    if feature.kind == CATEGORY:
+        return " ".join(text.split()).lower()
+    if feature.kind == DATE:
+        return _parse_date(text)
+
+    number = _parse_number(text)
+    if feature.kind == INTEGER and not isinstance(number, int):
+        raise ValueError("not a whole number")
+    if feature.minimum is not None and number < feature.minimum:
+        raise ValueError(f"below {feature.minimum}")
+    if feature.maximum is not None and number > feature.maximum:
+        raise ValueError(f"above {feature.maximum}")
+    return number
+
+
+def extract_features(metadata: dict) -> tuple:
+    """
+    (features, errors) from extracted metadata. features maps every feature name to its typed value,
+    None when the document does not have it; errors maps feature name to why its value was rejected.
+    """
+    features = {}
+    errors = {}
+    for feature in FEATURES:
+        features[feature.name] = None
+        for key in feature.aliases:
+            value = metadata.get(key)
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            try:
+                features[feature.name] = parse_feature(feature, value)
+            except ValueError as e:
+                errors[feature.name] = f"{key}={value!r}: {e}"
+            break
+    return features, errors
+
+
+# One row per %s: pass (feature_row(...),) to execute, or a list of rows to execute_values
+INSERT_FEATURES_SQL = f"""
+    INSERT INTO document_features (document_id, {', '.join(FEATURE_COLUMNS)}) VALUES %s
+    ON CONFLICT (document_id) DO NOTHING
+"""
+
+
+def feature_row(document_id, features: dict) -> tuple:
+    """A document_features row in INSERT_FEATURES_SQL's column order."""
+    return (document_id,) + tuple(features[name] for name in FEATURE_COLUMNS)
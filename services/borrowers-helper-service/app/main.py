@@ -1,10 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import router
+from metrics import MetricsMiddleware, metrics_router
+from db import close_pools
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the database connection pools
+    await close_pools()
 
 app = FastAPI(
     title="Borrowers Helper Service",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 origins = [
@@ -18,6 +29,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],          # GET, POST, etc.
     allow_headers=["*"],          # all headers including Authorization
+    expose_headers=["X-Next-Cursor"],  # pagination cursor for list endpoints
 )
 
-app.include_router(router)
\ No newline at end of file
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(router)
+app.include_router(metrics_router)
\ No newline at end of file
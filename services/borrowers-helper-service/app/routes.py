@@ -1,12 +1,22 @@
-from fastapi import UploadFile, File, APIRouter, HTTPException
+from fastapi import UploadFile, File, APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from models import UserCreate, UserRead
-from user_service import get_users, get_user_by_id, create_user, verify_user_eligibility
+from user_service import get_users, stream_users, get_user_by_id, create_user, verify_user_eligibility, USER_PAGE_SIZE, USER_PAGE_MAX_SIZE
 
 router = APIRouter(prefix="/borrower-helper-service")
 
 @router.get("/borrowers", response_model=list[UserRead])
-def list_users():
-    return get_users()
+def list_users(response: Response, limit: int = Query(USER_PAGE_SIZE, ge=1, le=USER_PAGE_MAX_SIZE),
+               cursor: Optional[str] = None, status: Optional[str] = None,
+               format: str = Query("json", pattern="^(json|ndjson)$")):
+    # One page per call; X-Next-Cursor is absent on the last page. ndjson streams every match from the cursor on.
+    if format == "ndjson":
+        return StreamingResponse(stream_users(cursor, status), media_type="application/x-ndjson")
+    users, next_cursor = get_users(limit, cursor, status)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
 
 @router.get("/borrower/{user_id}", response_model=UserRead)
 def get_user( user_id: str):
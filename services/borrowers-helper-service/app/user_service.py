@@ -1,46 +1,110 @@
-from db import get_connection
+from db import db_connection, read_db_connection
 from models import UserCreate, UserRead
 import uuid
-from tempfile import NamedTemporaryFile
 from fastapi import UploadFile, HTTPException
 import os
 import json
 import re
-import io
 from docx import Document as DocxDocument
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 import httpx
 from logger import logger
+from metrics import observe_stage
+from blob_store import get_blob_store, lock_blob
+from feature_extraction import INSERT_FEATURES_SQL, extract_features, feature_row
 
 DECISION_COORDINATOR_URL = os.getenv("DECISION_COORDINATOR_URL", "http://decision-coordinator-service:8000")
+DECISION_COORDINATOR_TIMEOUT_SECONDS = float(os.getenv("DECISION_COORDINATOR_TIMEOUT_SECONDS", 30.0))
+# "queue" enqueues a decision_jobs row for the coordinator workers; "sync" calls /process-decision inline
+DECISION_DISPATCH_MODE = os.getenv("DECISION_DISPATCH_MODE", "queue")
+DECISION_JOB_MAX_ATTEMPTS = int(os.getenv("DECISION_JOB_MAX_ATTEMPTS", 5))
 role = "borrower"
 
-def get_users():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
+# Page size for GET /borrowers, the largest page a client may ask for, and rows fetched per round trip when streaming
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", 100))
+USER_PAGE_MAX_SIZE = int(os.getenv("USER_PAGE_MAX_SIZE", 1000))
+USER_STREAM_FETCH_SIZE = int(os.getenv("USER_STREAM_FETCH_SIZE", 2000))
+# status filter value for borrowers with no decision yet
+NO_DECISION_STATUS = "none"
+
+def _decode_cursor(cursor: str):
+    """Cursors are the id of the last borrower on the previous page."""
+    if not cursor:
+        return None
+    try:
+        return str(uuid.UUID(cursor))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _borrowers_query(after: str = None, status: str = None, limit: int = None):
     """
-    SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u 
-    LEFT JOIN (SELECT DISTINCT ON (borrower_id) borrower_id, final_decision FROM decision_log ORDER BY borrower_id, created_at DESC) dl ON u.id = dl.borrower_id WHERE u.role = %s
-    """, (role,))
-    users = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3], status=u[4]) for u in users]
+    Keyset query over borrowers in id order, optionally filtered by current decision.
+    Filtering on a decision walks current_decision's (final_decision, borrower_id) index instead of every user.
+    """
+    params = []
+    if status and status != NO_DECISION_STATUS:
+        sql = """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM current_decision dl
+        JOIN users u ON u.id = dl.borrower_id WHERE dl.final_decision = %s AND u.role = %s
+        """
+        params += [status, role]
+        if after:
+            sql += " AND dl.borrower_id > %s"
+            params.append(after)
+        sql += " ORDER BY dl.borrower_id"
+    else:
+        sql = """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u 
+        LEFT JOIN current_decision dl ON u.id = dl.borrower_id WHERE u.role = %s
+        """
+        params.append(role)
+        if status == NO_DECISION_STATUS:
+            sql += " AND dl.borrower_id IS NULL"
+        if after:
+            sql += " AND u.id > %s"
+            params.append(after)
+        sql += " ORDER BY u.id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
 
-def get_user_by_id(user_id: str):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
+def get_users(limit: int = USER_PAGE_SIZE, cursor: str = None, status: str = None):
+    """One page of borrowers and the cursor for the next page (None on the last page)."""
+    limit = max(1, min(limit, USER_PAGE_MAX_SIZE))
+    # Ask for one extra row to learn whether another page follows
+    sql, params = _borrowers_query(_decode_cursor(cursor), status, limit + 1)
+    with read_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        users = cur.fetchall()
+    next_cursor = str(users[limit - 1][0]) if len(users) > limit else None
+    return [UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3], status=u[4]) for u in users[:limit]], next_cursor
+
+def stream_users(cursor: str = None, status: str = None):
+    """
+    Every matching borrower as NDJSON lines, read through a server-side cursor so memory stays flat
+    however many borrowers there are. The cursor is checked here, before the response starts.
     """
-    SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u 
-    LEFT JOIN (SELECT DISTINCT ON (borrower_id) borrower_id, final_decision FROM decision_log ORDER BY borrower_id, created_at DESC) dl ON u.id = dl.borrower_id WHERE id = %s and u.role = %s
-    """, (user_id, role,))
-    u = cur.fetchone()
-    cur.close()
-    conn.close()
+    sql, params = _borrowers_query(_decode_cursor(cursor), status)
+    return _stream_rows(sql, params)
+
+def _stream_rows(sql: str, params: list):
+    with read_db_connection() as conn, conn.cursor(name=f"borrowers_{uuid.uuid4().hex}") as cur:
+        cur.itersize = USER_STREAM_FETCH_SIZE
+        cur.execute(sql, params)
+        for u in cur:
+            yield json.dumps({"id": str(u[0]), "full_name": u[1], "email": u[2], "role": u[3], "status": u[4]}) + "\n"
+
+def get_user_by_id(user_id: str):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+        """
+        SELECT u.id, u.full_name, u.email, u.role, dl.final_decision AS status FROM users u 
+        LEFT JOIN current_decision dl ON u.id = dl.borrower_id WHERE id = %s and u.role = %s
+        """, (user_id, role,))
+        u = cur.fetchone()
     if not u:
         raise Exception("User not found")
     return UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3], status=u[4])
@@ -48,38 +112,35 @@ def get_user_by_id(user_id: str):
 def create_user(user: UserCreate):
     import bcrypt
     hashed = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode()
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO users (full_name, email, password_hash, role)
-        VALUES (%s, %s, %s, %s)
-        RETURNING id
-    """, (user.full_name, user.email, hashed, role))
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (full_name, email, password_hash, role)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (user.full_name, user.email, hashed, role))
+        new_id = cur.fetchone()[0]
+        conn.commit()
     return UserRead(id=new_id, full_name=user.full_name, email=user.email, role=role)
 
-def extract_metadata_from_file_bytes(filename: str, file_bytes: bytes) -> dict:
+def extract_metadata_from_file(filename: str, path: str) -> dict:
+    """Parse a stored upload from disk; the file type comes from the original filename."""
     ext = os.path.splitext(filename)[1].lower()
     text = ""
 
     try:
         if ext == ".pdf":
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
+            doc = fitz.open(path, filetype="pdf")
             for page in doc:
                 text += page.get_text()
             doc.close()
 
         elif ext in [".docx"]:
-            docx_stream = io.BytesIO(file_bytes)
-            doc = DocxDocument(docx_stream)
+            doc = DocxDocument(path)
             text = "\n".join([para.text for para in doc.paragraphs])
 
         elif ext in [".jpg", ".jpeg", ".png"]:
-            image = Image.open(io.BytesIO(file_bytes))
-            text = pytesseract.image_to_string(image)
+            with Image.open(path) as image:
+                text = pytesseract.image_to_string(image)
 
         else:
             return {"error": f"Unsupported file type: {ext}"}
@@ -98,77 +159,92 @@ def extract_metadata_from_file_bytes(filename: str, file_bytes: bytes) -> dict:
     return metadata or {"note": "No metadata extracted"}
 
 
+def _borrower_id_by_email(cur, email: str):
+    cur.execute("SELECT id FROM users WHERE email = %s AND role = 'borrower'", (email,))
+    user_row = cur.fetchone()
+    return user_row[0] if user_row else None
+
+
 def verify_user_eligibility(email: str, file: UploadFile):
     document_name = os.path.splitext(file.filename)[0]
     document_type = os.path.splitext(file.filename)[1][1:]
 
-    conn = get_connection()
-    cur = conn.cursor()
+    # Steps 1-4 decide whether the upload is accepted, so they read the primary: a lagging replica
+    # could miss a document or decision written moments ago and let a duplicate through
+    with db_connection() as conn, conn.cursor() as cur:
+        # Step 1: Get user ID
+        user_id = _borrower_id_by_email(cur, email)
+        if not user_id:
+            raise HTTPException(status_code=404, detail="Borrower with provided email not found.")
 
-    # Step 1: Get user ID
-    cur.execute("SELECT id FROM users WHERE email = %s AND role = 'borrower'", (email,))
-    user_row = cur.fetchone()
-    if not user_row:
-        raise HTTPException(status_code=404, detail="Borrower with provided email not found.")
-    user_id = user_row[0]
+        logger.info("Checking eligibility for user_id: %s, document: %s", user_id, document_name)
 
-    logger.info("Checking eligibility for user_id: %s, document: %s", user_id, document_name)
+        # Step 2: Get latest decision
+        cur.execute("SELECT final_decision FROM current_decision WHERE borrower_id = %s", (user_id,))
+        decision_row = cur.fetchone()
+        latest_decision = decision_row[0] if decision_row else None
 
-    # Step 2: Get latest decision
-    cur.execute("""
-        SELECT final_decision FROM decision_log
-        WHERE borrower_id = %s
-        ORDER BY created_at DESC
-        LIMIT 1
-    """, (user_id,))
-    decision_row = cur.fetchone()
-    latest_decision = decision_row[0] if decision_row else None
-
-    logger.info("Latest decision for user_id %s: %s", user_id, latest_decision)
-
-    # Step 3: If approved, exit early
-    if latest_decision == "approved":
-        cur.close()
-        conn.close()
-        return {"status": "approved", "message": "Loan already approved."}
+        logger.info("Latest decision for user_id %s: %s", user_id, latest_decision)
+
+        # Step 3: If approved, exit early
+        if latest_decision == "approved":
+            return {"status": "approved", "message": "Loan already approved."}
     
-    logger.info("Proceeding to document submission for user_id %s", user_id)
+        logger.info("Proceeding to document submission for user_id %s", user_id)
 
-    # Step 4: Check if document already exists
-    cur.execute("""
-        SELECT id FROM documents
-        WHERE user_id = %s AND document_name = %s AND document_type = %s
-    """, (user_id, document_name, document_type))
-    doc_exists = cur.fetchone()
-
-    logger.info("Document exists check for user_id %s, latest_decision %s, document %s: %s", user_id, latest_decision, document_name, bool(doc_exists))
-
-    if doc_exists:
-        if latest_decision == "rejected":
-            cur.close()
-            conn.close()
-            return {"status": "rejected", "message": "Application rejected. No more documents accepted."}
-        return {"status": latest_decision or "unknown", "message": "Document already submitted."}
-
-    if latest_decision and latest_decision != "request_evidence":
-        cur.close()
-        conn.close()
-        return {"status": latest_decision, "message": f"Cannot accept documents. Last decision: {latest_decision}"}
-
-    # Step 5: Read and extract metadata
-    contents = file.file.read()
-    metadata = extract_metadata_from_file_bytes(file.filename, contents)
-
-    # Step 6: Insert document
-    cur.execute("""
-        INSERT INTO documents (user_id, document_name, document_content, document_type, parsed_data)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING id
-    """, (user_id, document_name, contents, document_type, json.dumps(metadata)))
-    doc_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
+        # Step 4: Check if document already exists
+        cur.execute("""
+            SELECT id FROM documents
+            WHERE user_id = %s AND document_name = %s AND document_type = %s
+        """, (user_id, document_name, document_type))
+        doc_exists = cur.fetchone()
+
+        logger.info("Document exists check for user_id %s, latest_decision %s, document %s: %s", user_id, latest_decision, document_name, bool(doc_exists))
+
+        if doc_exists:
+            if latest_decision == "rejected":
+                return {"status": "rejected", "message": "Application rejected. No more documents accepted."}
+            return {"status": latest_decision or "unknown", "message": "Document already submitted."}
+
+        if latest_decision and latest_decision != "request_evidence":
+            return {"status": latest_decision, "message": f"Cannot accept documents. Last decision: {latest_decision}"}
+
+    # Step 5: Write the upload once, into the blob store's staging area, and extract and validate its
+    # metadata there; only a valid document is committed to the store, a rejected one is discarded
+    # (text extraction and OCR can be slow, so no connection is held)
+    with observe_stage("document_store"):
+        staged = get_blob_store().stage(file.file, suffix=os.path.splitext(file.filename)[1])
+    with staged:
+        with observe_stage("document_parse"):
+            metadata = extract_metadata_from_file(file.filename, staged.path)
+            # Type and validate the features once here, so no consumer parses strings again
+            features, feature_errors = extract_features(metadata)
+        if feature_errors:
+            raise HTTPException(status_code=422, detail={"message": "Invalid values in document.", "errors": feature_errors})
+
+        with db_connection() as conn, conn.cursor() as cur:
+            # Step 6: Store the blob and insert the document and its typed features. The blob lock is
+            # held until the row commits, so a purge cannot delete an identical blob in between
+            with observe_stage("documents_insert"):
+                lock_blob(cur, staged.sha256, shared=True)
+                staged.commit()
+                cur.execute("""
+                    INSERT INTO documents (user_id, document_name, content_sha256, content_size, document_type, parsed_data)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                """, (user_id, document_name, staged.sha256, staged.size, document_type, json.dumps(metadata)))
+                doc_id = cur.fetchone()[0]
+                cur.execute(INSERT_FEATURES_SQL, (feature_row(doc_id, features),))
+
+            if DECISION_DISPATCH_MODE == "queue":
+                # Step 7: Enqueue the decision in the same transaction as the document, so neither is lost
+                with observe_stage("decision_jobs_insert"):
+                    job_id = enqueue_decision_job(cur, user_id, doc_id)
+                    conn.commit()
+                logger.info("Queued decision job %s for user_id %s, document_id %s", job_id, user_id, doc_id)
+                return {"message": {"status": "queued", "job_id": job_id}, "document_id": doc_id, "user_id": user_id, "job_id": job_id}
+
+            conn.commit()
 
     # Step 7: Notify coordinator
     notify_response = call_decision_coordinator(user_id, doc_id)
@@ -177,6 +253,16 @@ def verify_user_eligibility(email: str, file: UploadFile):
     return {"message": notify_response, "document_id": doc_id, "user_id": user_id}
 
 
+def enqueue_decision_job(cur, user_id: str, document_id: str) -> str:
+    """Insert a decision_jobs row on the caller's cursor; the caller commits."""
+    cur.execute("""
+        INSERT INTO decision_jobs (user_id, document_id, max_attempts)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    """, (user_id, document_id, DECISION_JOB_MAX_ATTEMPTS))
+    return cur.fetchone()[0]
+
+
 def call_decision_coordinator(user_id: str, document_id: str):
     payload = {
         "user_id": user_id,
@@ -184,7 +270,9 @@ def call_decision_coordinator(user_id: str, document_id: str):
     }
 
     try:
-        response = httpx.post(f"{DECISION_COORDINATOR_URL}/process-decision", json=payload)
+        with observe_stage("http_decision_coordinator"):
+            response = httpx.post(f"{DECISION_COORDINATOR_URL}/process-decision", json=payload,
+                                  timeout=DECISION_COORDINATOR_TIMEOUT_SECONDS)
         response.raise_for_status()
         return response.json()
     except httpx.RequestError as exc:
@@ -0,0 +1,37 @@
+from logger import logger
+import os
+import json
+import asyncio
+from decision_cache import decide
+
+# Default and upper bound for how many decisions a batch runs at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+
+
+async def stream_batch_decisions(items: list, concurrency: int = None):
+    """
+    Run the decision pipeline for many (user_id, document_id) pairs with bounded concurrency.
+    Yields one NDJSON line per item in completion order; the log writer group-commits the
+    decision_log rows of concurrently running items.
+    """
+    limit = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+    logger.info("Starting batch decision run for %d items, concurrency %d", len(items), limit)
+
+    async def run(item):
+        async with semaphore:
+            result = await decide(item.user_id, item.document_id)
+        return {"user_id": item.user_id, "document_id": item.document_id, **result}
+
+    tasks = [asyncio.create_task(run(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            yield json.dumps(result, default=str) + "\n"
+    finally:
+        # Client went away or the run finished: stop outstanding work
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        logger.info("Batch decision run finished for %d items", len(items))
@@ -0,0 +1,143 @@
+from logger import logger
+import os
+import time
+import asyncio
+from collections import deque
+from datetime import datetime
+
+# Circuit breaker: open when the error rate over the window crosses the threshold
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", 30.0))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 20))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 15.0))
+BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv("BREAKER_HALF_OPEN_MAX_CALLS", 1))
+
+# Bulkhead: cap concurrent calls per downstream service, and how long a call may wait for a slot
+BULKHEAD_MAX_CONCURRENT = int(os.getenv("BULKHEAD_MAX_CONCURRENT", 50))
+BULKHEAD_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BULKHEAD_QUEUE_TIMEOUT_SECONDS", 0.05))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class DownstreamUnavailable(Exception):
+    """Raised without calling the service, because its breaker is open or its bulkhead is full."""
+
+    def __init__(self, service: str, reason: str):
+        super().__init__(f"{service} service unavailable: {reason}")
+        self.service = service
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding time window of call outcomes."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = None
+        self.outcomes = deque()  # (monotonic timestamp, succeeded)
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        self.rejected = 0
+        self.transitions = deque(maxlen=20)
+
+    def _transition(self, state: str, reason: str):
+        logger.warning("Circuit breaker %s: %s -> %s (%s)", self.name, self.state, state, reason)
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": datetime.now().isoformat()})
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state != CLOSED:
+            self.half_open_calls = 0
+            self.half_open_successes = 0
+        if state == CLOSED:
+            self.outcomes.clear()
+
+    def _prune(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > BREAKER_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def before_call(self):
+        """Admit a call or raise DownstreamUnavailable straight away."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                self.rejected += 1
+                raise DownstreamUnavailable(self.name, "circuit_open")
+            self._transition(HALF_OPEN, "open period elapsed")
+        if self.state == HALF_OPEN:
+            if self.half_open_calls >= BREAKER_HALF_OPEN_MAX_CALLS:
+                self.rejected += 1
+                raise DownstreamUnavailable(self.name, "circuit_open")
+            self.half_open_calls += 1
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self.half_open_successes += 1
+            if self.half_open_successes >= BREAKER_HALF_OPEN_MAX_CALLS:
+                self._transition(CLOSED, "trial calls succeeded")
+            return
+        now = time.monotonic()
+        self.outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._transition(OPEN, "trial call failed")
+            return
+        now = time.monotonic()
+        self.outcomes.append((now, False))
+        self._prune(now)
+        if self.state == CLOSED and len(self.outcomes) >= BREAKER_MIN_CALLS:
+            failures = sum(1 for _, ok in self.outcomes if not ok)
+            error_rate = failures / len(self.outcomes)
+            if error_rate >= BREAKER_ERROR_RATE:
+                self._transition(OPEN, f"error rate {error_rate:.2f} over {len(self.outcomes)} calls")
+
+    def record_cancelled(self):
+        """A call was cancelled before it finished (hedge loser, deadline); free its trial slot."""
+        if self.state == HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def snapshot(self) -> dict:
+        self._prune(time.monotonic())
+        failures = sum(1 for _, ok in self.outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_calls": len(self.outcomes),
+            "window_failures": failures,
+            "error_rate": round(failures / len(self.outcomes), 4) if self.outcomes else 0.0,
+            "rejected": self.rejected,
+            "transitions": list(self.transitions)
+        }
+
+
+class Bulkhead:
+    """Caps concurrent in-flight calls to one downstream service; excess calls fail fast."""
+
+    def __init__(self, name: str, limit: int = BULKHEAD_MAX_CONCURRENT):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=BULKHEAD_QUEUE_TIMEOUT_SECONDS)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise DownstreamUnavailable(self.name, "bulkhead_full")
+        self.in_use += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_use -= 1
+        self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "in_use": self.in_use, "rejected": self.rejected}
\ No newline at end of file
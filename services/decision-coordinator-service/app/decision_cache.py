@@ -0,0 +1,158 @@
+from logger import logger
+import os
+import json
+import time
+import asyncio
+from db import db_connection, async_db_connection
+from decision_service import handle_decision_request, get_client, ML_DECISION_SERVICE_URL
+from metrics import observe_stage, count_outcome
+
+# How long the rule-set and model versions are reused before they are looked up again
+VERSION_CACHE_SECONDS = float(os.getenv("VERSION_CACHE_SECONDS", 10.0))
+VERSION_LOOKUP_TIMEOUT_SECONDS = float(os.getenv("VERSION_LOOKUP_TIMEOUT_SECONDS", 1.0))
+
+_versions = {"value": None, "expires_at": 0.0}
+# In-flight computations keyed like the cache, so concurrent duplicates share one pipeline run
+_in_flight: dict = {}
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused for a different (user_id, document_id)."""
+
+
+def _load_rule_set_version() -> str:
+    """Fingerprint of the current rules_config contents, kept up to date by a trigger (migration 008)."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT version FROM rule_set_version")
+        return cur.fetchone()[0]
+
+
+async def _load_model_version() -> str:
+    resp = await get_client(ML_DECISION_SERVICE_URL).get("/model-version", timeout=VERSION_LOOKUP_TIMEOUT_SECONDS)
+    resp.raise_for_status()
+    return resp.json()["model_version"]
+
+
+async def current_versions():
+    """(rule_set_version, model_version), cached for VERSION_CACHE_SECONDS; None if either is unavailable."""
+    if _versions["value"] is not None and time.monotonic() < _versions["expires_at"]:
+        return _versions["value"]
+    try:
+        rule_set_version, model_version = await asyncio.gather(
+            asyncio.to_thread(_load_rule_set_version), _load_model_version()
+        )
+    except Exception as e:
+        logger.warning("Could not resolve rule/model versions, decision cache bypassed: %s", e)
+        return None
+    _versions["value"] = (rule_set_version, model_version)
+    _versions["expires_at"] = time.monotonic() + VERSION_CACHE_SECONDS
+    return _versions["value"]
+
+
+async def load_cached_decision(user_id: str, document_id: str, rule_set_version: str, model_version: str):
+    try:
+        async with async_db_connection() as conn:
+            with observe_stage("decision_cache_fetch"):
+                cur = await conn.execute("""
+                    SELECT response FROM decision_cache
+                    WHERE document_id = %s AND rule_set_version = %s AND model_version = %s AND user_id = %s
+                """, (document_id, rule_set_version, model_version, user_id))
+                row = await cur.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        # A bad id or a lookup failure just means "not cached"; the pipeline reports real errors
+        logger.warning("load_cached_decision failed: %s", e)
+        return None
+
+
+def store_cached_decision(user_id: str, document_id: str, rule_set_version: str, model_version: str, response: dict):
+    with db_connection() as conn, conn.cursor() as cur:
+        try:
+            cur.execute("""
+                INSERT INTO decision_cache (document_id, rule_set_version, model_version, user_id, response)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT DO NOTHING
+            """, (document_id, rule_set_version, model_version, user_id, json.dumps(response)))
+            conn.commit()
+        except Exception as e:
+            logger.exception("Failed to store decision cache entry: %s", e)
+            conn.rollback()
+
+
+async def load_idempotent_response(idempotency_key: str):
+    try:
+        async with async_db_connection() as conn:
+            cur = await conn.execute("""
+                SELECT user_id, document_id, response FROM decision_idempotency_keys
+                WHERE idempotency_key = %s
+            """, (idempotency_key,))
+            return await cur.fetchone()
+    except Exception as e:
+        # A lookup failure just means "not stored"; the pipeline reports real errors
+        logger.warning("load_idempotent_response failed: %s", e)
+        return None
+
+
+def store_idempotent_response(idempotency_key: str, user_id: str, document_id: str, response: dict):
+    with db_connection() as conn, conn.cursor() as cur:
+        try:
+            cur.execute("""
+                INSERT INTO decision_idempotency_keys (idempotency_key, user_id, document_id, response)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT DO NOTHING
+            """, (idempotency_key, user_id, document_id, json.dumps(response)))
+            conn.commit()
+        except Exception as e:
+            logger.exception("Failed to store idempotency key %s: %s", idempotency_key, e)
+            conn.rollback()
+
+
+async def decide(user_id: str, document_id: str, idempotency_key: str = None, deadline=None):
+    """
+    Idempotent front door to handle_decision_request.
+    1. A known Idempotency-Key returns the response stored for it.
+    2. A decision for the same document, rule-set version and model version is returned from decision_cache.
+    3. Concurrent requests for the same key share one in-flight pipeline run.
+    Only successful decisions are cached, so errors stay retryable.
+    """
+    if idempotency_key:
+        stored = await load_idempotent_response(idempotency_key)
+        if stored:
+            stored_user_id, stored_document_id, response = stored
+            if (str(stored_user_id), str(stored_document_id)) != (str(user_id), str(document_id)):
+                raise IdempotencyConflict(f"Idempotency-Key {idempotency_key} was used for a different document")
+            logger.info("Replaying stored response for idempotency key %s", idempotency_key)
+            count_outcome("decision_cache", "idempotent_replay")
+            return response
+
+    versions = await current_versions()
+    result = None
+    if versions:
+        result = await load_cached_decision(user_id, document_id, *versions)
+        if result:
+            logger.info("Decision cache hit for document %s", document_id)
+            count_outcome("decision_cache", "hit")
+
+    if result is None:
+        flight_key = (str(user_id), str(document_id), versions)
+        task = _in_flight.get(flight_key)
+        leader = task is None
+        count_outcome("decision_cache", "miss" if leader else "joined")
+        if leader:
+            task = asyncio.create_task(
+                handle_decision_request(user_id, document_id, deadline=deadline)
+            )
+            _in_flight[flight_key] = task
+            task.add_done_callback(lambda _: _in_flight.pop(flight_key, None))
+        else:
+            logger.info("Joining in-flight decision for document %s", document_id)
+        # Shield so one caller going away does not cancel the run the others are waiting on
+        result = await asyncio.shield(task)
+        if leader:
+            count_outcome("decision", result.get("final_decision") or result.get("reason", "unknown"))
+        if leader and versions and result.get("status") == "ok":
+            await asyncio.to_thread(store_cached_decision, user_id, document_id, *versions, result)
+
+    if idempotency_key and result.get("status") == "ok":
+        await asyncio.to_thread(store_idempotent_response, idempotency_key, user_id, document_id, result)
+    return result
\ No newline at end of file
@@ -1,106 +1,250 @@
 from logger import logger
 import os
 import json
+import asyncio
+import uuid
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import httpx
-from db import get_connection  # your DB helper that returns psycopg2 connection
+from db import async_db_connection
+from log_writer import write_log_rows_async
+from fairness_check import assess_bias
+from deadline import Deadline
+from hedging import LatencyTracker, hedged_call
+from circuit_breaker import CircuitBreaker, Bulkhead, DownstreamUnavailable
+from metrics import observe_stage, count_outcome
 
 
 RULE_ENGINE_URL = os.getenv("RULE_ENGINE_URL", "http://rule-engine-service:8000")
-ML_DECISION_SERVICE_URL = os.getenv("ML_DECISION_SERVICE_URL", "http://ml-decision-service:8000")  
+ML_DECISION_SERVICE_URL = os.getenv("ML_DECISION_SERVICE_URL", "http://ml-decision-service:8000")
 FIARNESS_AUDITOR_SERVICE_URL = os.getenv("FAIRNESS_AUDITOR_SERVICE_URL", "http://fairness-auditor-service:8000")
-CALL_TIMEOUT_SECONDS = 5.0
-MAX_WORKERS = 2
+# Per-call cap, and the end-to-end budget shared by every stage of one decision
+CALL_TIMEOUT_SECONDS = float(os.getenv("CALL_TIMEOUT_SECONDS", 5.0))
+DECISION_DEADLINE_SECONDS = float(os.getenv("DECISION_DEADLINE_SECONDS", 8.0))
+# "remote" calls the fairness auditor with the SHAP summary inline; "inline" runs the check in-process
+FAIRNESS_MODE = os.getenv("FAIRNESS_MODE", "remote")
 
+# Connection pool limits for each downstream client (one long-lived client per service)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", 30.0))
 
-def call_rule_engine_sync(user_id: str, document_id: str) -> dict:
-    """Sync HTTP call to rule engine. Returns parsed JSON or raises."""
+_clients: dict = {}
+_latency = {"rule": LatencyTracker(), "ml": LatencyTracker()}
+_breakers = {name: CircuitBreaker(name) for name in ("rule", "ml", "fairness")}
+_bulkheads = {name: Bulkhead(name) for name in ("rule", "ml", "fairness")}
+
+
+def get_client(base_url: str) -> httpx.AsyncClient:
+    """Return the shared keep-alive client for a downstream service, creating it on first use."""
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=CALL_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+        _clients[base_url] = client
+    return client
+
+
+async def guarded_call(name: str, call):
+    """
+    Run one downstream call behind that service's circuit breaker and bulkhead.
+    Raises DownstreamUnavailable immediately when the breaker is open or the bulkhead is full.
+    """
+    breaker = _breakers[name]
     try:
-        with httpx.Client(timeout=CALL_TIMEOUT_SECONDS) as client:
-            resp = client.post(
-                f"{RULE_ENGINE_URL}/evaluate-rules",
-                json={"user_id": user_id, "document_id": document_id},
-                timeout=CALL_TIMEOUT_SECONDS
+        breaker.before_call()
+    except DownstreamUnavailable as e:
+        count_outcome(f"{name}_call", e.reason)
+        raise
+    try:
+        async with _bulkheads[name]:
+            result = await call()
+    except (asyncio.CancelledError, DownstreamUnavailable) as e:
+        # Never reached the service or never finished: no verdict on its health
+        breaker.record_cancelled()
+        count_outcome(f"{name}_call", getattr(e, "reason", "cancelled"))
+        raise
+    except httpx.HTTPStatusError as e:
+        # 4xx means the service is up and answered; only 5xx counts against it
+        if e.response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        count_outcome(f"{name}_call", f"http_{e.response.status_code}")
+        raise
+    except Exception:
+        breaker.record_failure()
+        count_outcome(f"{name}_call", "error")
+        raise
+    breaker.record_success()
+    count_outcome(f"{name}_call", "success")
+    return result
+
+
+def resilience_status() -> dict:
+    """Breaker state, recent transitions and bulkhead usage for every downstream service."""
+    return {
+        name: {**_breakers[name].snapshot(), "bulkhead": _bulkheads[name].snapshot()}
+        for name in _breakers
+    }
+
+
+async def close_clients():
+    """Close every shared downstream client. Called on application shutdown."""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+
+async def call_rule_engine(user_id: str, document_id: str, features: dict = None, deadline: Deadline = None) -> dict:
+    """Async HTTP call to rule engine, hedged when enabled. Returns parsed JSON or raises."""
+    deadline = deadline or Deadline()
+
+    async def attempt():
+        with observe_stage("http_rule_engine"):
+            resp = await get_client(RULE_ENGINE_URL).post(
+                "/evaluate-rules",
+                json={"user_id": user_id, "document_id": document_id, "features": features},
+                headers=deadline.headers(),
+                timeout=deadline.timeout(CALL_TIMEOUT_SECONDS)
             )
             resp.raise_for_status()
             return resp.json()
+
+    try:
+        return await hedged_call("rule", lambda: guarded_call("rule", attempt), _latency["rule"], deadline)
+    except DownstreamUnavailable:
+        raise
     except Exception as e:
         logger.exception("Rule engine call failed")
         raise
 
 
-def call_ml_engine_sync(user_id: str, document_id: str) -> dict:
-    """Sync call to ML engine (currently a placeholder). Replace with actual call if available."""
-    try:
-        with httpx.Client(timeout=CALL_TIMEOUT_SECONDS) as client:
-            resp = client.post(
-                f"{ML_DECISION_SERVICE_URL}/evaluate-ml-decision",
-                json={"user_id": user_id, "document_id": document_id},
-                timeout=CALL_TIMEOUT_SECONDS
+async def call_ml_engine(user_id: str, document_id: str, features: dict = None, deadline: Deadline = None) -> dict:
+    """Async HTTP call to ML engine, hedged when enabled. Returns parsed JSON or raises."""
+    deadline = deadline or Deadline()
+
+    async def attempt():
+        with observe_stage("http_ml_service"):
+            resp = await get_client(ML_DECISION_SERVICE_URL).post(
+                "/evaluate-ml-decision",
+                json={"user_id": user_id, "document_id": document_id, "features": features},
+                headers=deadline.headers(),
+                timeout=deadline.timeout(CALL_TIMEOUT_SECONDS)
             )
             resp.raise_for_status()
             return resp.json()
+
+    try:
+        return await hedged_call("ml", lambda: guarded_call("ml", attempt), _latency["ml"], deadline)
+    except DownstreamUnavailable:
+        raise
     except Exception as e:
         logger.exception("ML decision api call failed")
         raise
 
-def call_fairness_auditor(user_id: str, ml_result_id: str) -> dict:
-    """Sync call to Fairness Auditor"""
-    try:
-        with httpx.Client(timeout=CALL_TIMEOUT_SECONDS) as client:
-            resp = client.post(
-                f"{FIARNESS_AUDITOR_SERVICE_URL}/bias-check",
-                json={"user_id": user_id, "ml_result_id": ml_result_id},
-                timeout=CALL_TIMEOUT_SECONDS
+async def call_fairness_auditor(user_id: str, ml_result_id: str, shap_summary: dict = None, deadline: Deadline = None) -> dict:
+    """Async HTTP call to Fairness Auditor"""
+    deadline = deadline or Deadline()
+
+    async def attempt():
+        with observe_stage("http_fairness_auditor"):
+            resp = await get_client(FIARNESS_AUDITOR_SERVICE_URL).post(
+                "/bias-check",
+                json={"user_id": user_id, "ml_result_id": ml_result_id, "shap_summary": shap_summary},
+                headers=deadline.headers(),
+                timeout=deadline.timeout(CALL_TIMEOUT_SECONDS)
             )
             resp.raise_for_status()
             return resp.json()
+
+    try:
+        return await guarded_call("fairness", attempt)
+    except DownstreamUnavailable:
+        raise
     except Exception as e:
         logger.exception("fairness auditor api call failed")
-        raise    
-    
-
-def _insert_decision(borrower_id: str, document_id: str, final_decision: str, explanation: str, rule_result_id: str = None,
-    ml_result_id: str = None, audit_result_id: str = None):
-    """Insert a record into decision_log. Adjust columns to match your DB schema if needed."""
-    conn = None
-    cur = None
-    logger.info("Inserting decision log: %s / %s / %s", borrower_id, rule_result_id, ml_result_id)
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO decision_log (
-                type, borrower_id, document_id, final_decision, explanation, rule_result_id, ml_result_id, fairness_audit_log_id, created_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                "auto",
-                borrower_id,
-                document_id,
-                final_decision,
-                explanation,
-                rule_result_id,
-                ml_result_id,
-                audit_result_id,
-                datetime.now()
-            )
+        raise
+
+
+async def evaluate_fairness(user_id: str, ml_result: dict, deadline: Deadline = None):
+    """
+    Run the fairness check for an ML result. Returns (fairness_result, audit_row).
+    In inline mode the check runs in-process and audit_row is the fairness_audit_log row to
+    persist together with the decision; otherwise the auditor service stores it and audit_row is None.
+    """
+    ml_result_id = ml_result.get("ml_result_id")
+    shap_summary = ml_result.get("shap_summary")
+    if FAIRNESS_MODE == "inline" and shap_summary is not None:
+        with observe_stage("fairness_check"):
+            fairness_result = assess_bias(shap_summary)
+        audit_result_id = str(uuid.uuid4())
+        audit_row = (
+            audit_result_id,
+            ml_result_id,
+            fairness_result["is_biased"],
+            json.dumps(fairness_result["flagged_features"]),
+            fairness_result["audit_notes"],
+            datetime.now()
         )
-        conn.commit()
-        logger.info("Decision log inserted: %s / %s", borrower_id, final_decision)
+        logger.info("Inline fairness check for ml_result %s: is_biased=%s", ml_result_id, fairness_result["is_biased"])
+        return {**fairness_result, "audit_result_id": audit_result_id}, audit_row
+    return await call_fairness_auditor(user_id, ml_result_id, shap_summary, deadline), None
+
+
+async def _fetch_features(user_id: str, document_id: str):
+    """Load a document's typed features once so they can be sent inline to the rule and ML engines."""
+    async with async_db_connection() as conn:
+        with observe_stage("document_fetch"):
+            cur = await conn.execute("""
+                SELECT features FROM document_inputs
+                WHERE document_id = %s AND user_id = %s
+            """, (document_id, user_id))
+            row = await cur.fetchone()
+    return row[0] if row else None
+
+
+def _decision_row(borrower_id: str, document_id: str, final_decision: str, explanation: str, rule_result_id: str = None,
+    ml_result_id: str = None, audit_result_id: str = None) -> tuple:
+    """Build a decision_log row tuple in the column order of log_writer.LOG_TABLE_COLUMNS."""
+    return (
+        "auto",
+        borrower_id,
+        document_id,
+        final_decision,
+        explanation,
+        rule_result_id,
+        ml_result_id,
+        audit_result_id,
+        datetime.now()
+    )
+
+
+async def _record_decision(*args, audit_row: tuple = None, **kwargs):
+    """
+    Persist a decision_log row, and the inline fairness audit row it references, through the shared
+    log writer. Concurrent decisions (including a whole batch) are group-committed together;
+    this returns once the rows are durable.
+    """
+    decision_row = _decision_row(*args, **kwargs)
+    logger.info("Inserting decision log: %s / %s / %s", decision_row[1], decision_row[5], decision_row[6])
+    rows = [("fairness_audit_log", audit_row)] if audit_row else []
+    rows.append(("decision_log", decision_row))
+    try:
+        with observe_stage("decision_log_insert"):
+            await write_log_rows_async(rows)
     except Exception as e:
         logger.exception("Failed to insert decision_log: %s", e)
-        if conn:
-            conn.rollback()
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
 
-def _handle_both_results_and_persist(user_id: str, document_id: str, rule_result: dict, ml_result: dict, fairness_result: dict) -> dict:
+
+async def _handle_both_results_and_persist(user_id: str, document_id: str, rule_result: dict, ml_result: dict, fairness_result: dict,
+    audit_row: tuple = None) -> dict:
     """Decision logic and store final decision."""
     logger.info("rule_result is %s", rule_result)
     rule_status = (rule_result or {}).get("status")  # expect 'pass'/'fail'
@@ -124,64 +268,98 @@ def _handle_both_results_and_persist(user_id: str, document_id: str, rule_result
 
     explanation = json.dumps({"rule": rule_result, "ml": ml_result})
     logger.info("explanation: %s", explanation)
-    _insert_decision(user_id, document_id, final, explanation, rule_result_id, ml_result_id, audit_result_id)
+    await _record_decision(user_id, document_id, final, explanation, rule_result_id, ml_result_id, audit_result_id,
+                           audit_row=audit_row)
     return {"final_decision": final}
 
-def handle_decision_request(user_id: str, document_id: str):
+async def handle_decision_request(user_id: str, document_id: str, deadline: Deadline = None):
     """
-    Main synchronous entry point.
-    Runs rule and ML calls in parallel using ThreadPoolExecutor and waits for both (with timeout).
-    On timeout or error, inserts an 'error' decision log.
+    Main asynchronous entry point.
+    Runs rule and ML calls concurrently on the shared clients and waits for both, all within one
+    end-to-end deadline (DECISION_DEADLINE_SECONDS, or the caller's deadline if that is sooner).
+    On timeout or error, inserts an 'error' decision log; when a downstream breaker is open or its
+    bulkhead is full it returns straight away without one.
     """
     logger.info("Starting decision pipeline for user %s, document %s", user_id, document_id)
+    deadline = Deadline(DECISION_DEADLINE_SECONDS).earliest(deadline)
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_name = {
-            executor.submit(call_rule_engine_sync, user_id, document_id): "rule",
-            executor.submit(call_ml_engine_sync, user_id, document_id): "ml"
+    task_to_name = {}
+    rule_result = None
+    ml_result = None
+
+    try:
+        # Read the document once; when it is missing the engines do their own lookup and report it
+        features = await _fetch_features(user_id, document_id)
+        task_to_name = {
+            asyncio.create_task(call_rule_engine(user_id, document_id, features, deadline)): "rule",
+            asyncio.create_task(call_ml_engine(user_id, document_id, features, deadline)): "ml"
         }
 
-        rule_result = None
-        ml_result = None
-
-        try:
-            # Wait for both futures to complete, enforce total timeout by joining with timeout
-            for future in as_completed(future_to_name.keys(), timeout=CALL_TIMEOUT_SECONDS):
-                name = future_to_name[future]
-                try:
-                    result = future.result()  # may raise exception from call
-                    if name == "rule":
-                        rule_result = result
-                    elif name == "ml":
-                        ml_result = result
-                except Exception as exc:
-                    # If one of the calls raises, log and persist error decision
-                    logger.exception("%s task failed: %s", name, exc)
-                    _insert_decision(user_id, document_id, final_decision="error",
-                                     explanation=f"{name} service error: {str(exc)}")
-                    return {"status": "error", "reason": f"{name} service error", "detail": str(exc)}
-
-            # After as_completed loop, check if both results collected
-            if rule_result is None or ml_result is None:
-                # Either timed out or not produced both results
-                logger.error("Timeout or missing result - rule: %s, ml: %s", bool(rule_result), bool(ml_result))
-                _insert_decision(user_id, document_id, final_decision="error",
-                                 explanation="server error: timedout or missing response")
-                return {"status": "error", "reason": "timeout_or_missing", "rule_result": rule_result, "ml_result": ml_result}
-
-            # Both results present — perform decision logic and persist
-            fairness_result = call_fairness_auditor(user_id, ml_result.get("ml_result_id"))
-            decision_summary = _handle_both_results_and_persist(user_id, document_id, rule_result, ml_result, fairness_result)
-            logger.info("Final decision recorded: %s", decision_summary["final_decision"])
-            return {"status": "ok", **decision_summary}
-
-        except FuturesTimeoutError:
-            logger.exception("⏰ Overall timeout waiting for services")
-            _insert_decision(user_id, document_id, final_decision="error",
-                             explanation="server error: timedout")
+        # Wait for both tasks, returning early if either one fails
+        done, pending = await asyncio.wait(
+            task_to_name.keys(), timeout=deadline.remaining(), return_when=asyncio.FIRST_EXCEPTION
+        )
+
+        for task in done:
+            name = task_to_name[task]
+            exc = task.exception()
+            if isinstance(exc, DownstreamUnavailable):
+                # Breaker open or bulkhead full: fail fast, nothing was evaluated so nothing is logged
+                for other in pending:
+                    other.cancel()
+                return {"status": "error", "reason": exc.reason, "service": exc.service}
+            if exc is not None:
+                # If one of the calls raises, log and persist error decision
+                logger.error("%s task failed: %s", name, exc)
+                for other in pending:
+                    other.cancel()
+                await _record_decision(user_id, document_id, final_decision="error",
+                                       explanation=f"{name} service error: {str(exc)}")
+                return {"status": "error", "reason": f"{name} service error", "detail": str(exc)}
+            if name == "rule":
+                rule_result = task.result()
+            elif name == "ml":
+                ml_result = task.result()
+
+        if pending:
+            for task in pending:
+                task.cancel()
+            logger.error("⏰ Overall timeout waiting for services: %s", [task_to_name[t] for t in pending])
+            await _record_decision(user_id, document_id, final_decision="error",
+                                   explanation="server error: timedout")
             return {"status": "error", "reason": "timeout"}
-        except Exception as e:
-            logger.exception("Unexpected exception in handle_decision_request: %s", e)
-            _insert_decision(user_id, document_id, final_decision="error",
-                             explanation=f"server error: {str(e)}")
-            return {"status": "error", "reason": "exception", "detail": str(e)}       
\ No newline at end of file
+
+        # After the wait, check if both results collected
+        if rule_result is None or ml_result is None:
+            # Services answered but did not produce both results
+            logger.error("Timeout or missing result - rule: %s, ml: %s", bool(rule_result), bool(ml_result))
+            await _record_decision(user_id, document_id, final_decision="error",
+                                   explanation="server error: timedout or missing response")
+            return {"status": "error", "reason": "timeout_or_missing", "rule_result": rule_result, "ml_result": ml_result}
+
+        # Both results present — the fairness check gets whatever budget is left
+        if deadline.expired():
+            raise asyncio.TimeoutError("decision deadline exceeded before fairness check")
+        fairness_result, audit_row = await evaluate_fairness(user_id, ml_result, deadline)
+        decision_summary = await _handle_both_results_and_persist(
+            user_id, document_id, rule_result, ml_result, fairness_result, audit_row
+        )
+        logger.info("Final decision recorded: %s", decision_summary["final_decision"])
+        return {"status": "ok", **decision_summary}
+
+    except DownstreamUnavailable as e:
+        return {"status": "error", "reason": e.reason, "service": e.service}
+    except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+        logger.error("⏰ Decision deadline exceeded: %s", e)
+        await _record_decision(user_id, document_id, final_decision="error",
+                               explanation="server error: timedout")
+        return {"status": "error", "reason": "timeout"}
+    except Exception as e:
+        logger.exception("Unexpected exception in handle_decision_request: %s", e)
+        await _record_decision(user_id, document_id, final_decision="error",
+                               explanation=f"server error: {str(e)}")
+        return {"status": "error", "reason": "exception", "detail": str(e)}
+    finally:
+        for task in task_to_name:
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,20 @@
+import os
+
+# Same threshold the fairness-auditor-service uses; keep FAIRNESS_BIAS_THRESHOLD in sync across both
+BIAS_THRESHOLD = float(os.getenv("FAIRNESS_BIAS_THRESHOLD", 0.3))
+
+
+def assess_bias(shap_summary: dict) -> dict:
+    """Flag every feature whose SHAP impact exceeds the bias threshold (library version of /bias-check)."""
+    biased_features = {}
+    for feature, impact in shap_summary.items():
+        if abs(impact) > BIAS_THRESHOLD:
+            biased_features[feature] = f"Impact: {impact}"
+
+    is_biased = len(biased_features) > 0
+    audit_notes = "Bias detected in features." if is_biased else "No significant bias detected."
+    return {
+        "is_biased": is_biased,
+        "flagged_features": biased_features,
+        "audit_notes": audit_notes
+    }
\ No newline at end of file
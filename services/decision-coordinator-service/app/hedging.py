@@ -0,0 +1,59 @@
+from logger import logger
+import os
+import time
+import asyncio
+from collections import deque
+
+# Hedged requests: once a call is slower than the tracked latency percentile, send one duplicate
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 50))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 500))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one downstream service."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float):
+        """Latency at the given percentile, or None until HEDGE_MIN_SAMPLES calls were seen."""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+async def hedged_call(name: str, call, tracker: LatencyTracker, deadline):
+    """
+    Await call(). When hedging is enabled and the call is still running after the tracked
+    HEDGE_PERCENTILE latency, start one duplicate and return whichever succeeds first.
+    The slower attempt is cancelled, but the downstream service may still finish it and log a row.
+    """
+    started = time.monotonic()
+    delay = tracker.percentile(HEDGE_PERCENTILE) if HEDGE_ENABLED else None
+    remaining = deadline.remaining()
+    pending = {asyncio.create_task(call())}
+    error = None
+    try:
+        if delay is not None and (remaining is None or delay < remaining):
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                logger.info("Hedging %s call after %.3fs", name, delay)
+                pending.add(asyncio.create_task(call()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    tracker.record(time.monotonic() - started)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
\ No newline at end of file
@@ -0,0 +1,142 @@
+from logger import logger
+import os
+import json
+import uuid
+import socket
+import asyncio
+from db import db_connection
+from decision_cache import decide
+
+DECISION_WORKER_COUNT = int(os.getenv("DECISION_WORKER_COUNT", 2))
+DECISION_WORKER_POLL_SECONDS = float(os.getenv("DECISION_WORKER_POLL_SECONDS", 1.0))
+# How long a claimed job stays invisible to other workers before it can be reclaimed
+DECISION_JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("DECISION_JOB_VISIBILITY_TIMEOUT_SECONDS", 60))
+DECISION_JOB_BACKOFF_BASE_SECONDS = float(os.getenv("DECISION_JOB_BACKOFF_BASE_SECONDS", 2.0))
+DECISION_JOB_BACKOFF_MAX_SECONDS = float(os.getenv("DECISION_JOB_BACKOFF_MAX_SECONDS", 300.0))
+
+JOB_COLUMNS = ["id", "user_id", "document_id", "status", "attempts", "max_attempts", "run_after",
+               "last_error", "result", "created_at", "updated_at"]
+
+
+def claim_job(worker_id: str):
+    """Claim the next runnable job (queued, or running with an expired lease) with FOR UPDATE SKIP LOCKED."""
+    with db_connection() as conn, conn.cursor() as cur:
+        try:
+            cur.execute("""
+                UPDATE decision_jobs j
+                SET status = 'running',
+                    attempts = j.attempts + 1,
+                    locked_by = %s,
+                    locked_until = NOW() + make_interval(secs => %s),
+                    updated_at = NOW()
+                WHERE j.id = (
+                    SELECT id FROM decision_jobs
+                    WHERE ((status = 'queued' AND run_after <= NOW())
+                           OR (status = 'running' AND locked_until < NOW()))
+                      AND attempts < max_attempts
+                    ORDER BY run_after
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING j.id, j.user_id, j.document_id, j.attempts, j.max_attempts
+            """, (worker_id, DECISION_JOB_VISIBILITY_TIMEOUT_SECONDS))
+            row = cur.fetchone()
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def complete_job(job_id: str, worker_id: str, result: dict):
+    """Mark a claimed job done and store the decision result."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE decision_jobs
+            SET status = 'done', result = %s, last_error = NULL, locked_by = NULL, locked_until = NULL, updated_at = NOW()
+            WHERE id = %s AND locked_by = %s
+        """, (json.dumps(result), job_id, worker_id))
+        conn.commit()
+
+
+def fail_job(job_id: str, worker_id: str, attempts: int, max_attempts: int, error: str, result: dict = None):
+    """Requeue a failed job with exponential backoff, or mark it failed once attempts are exhausted."""
+    backoff = min(DECISION_JOB_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), DECISION_JOB_BACKOFF_MAX_SECONDS)
+    status = "queued" if attempts < max_attempts else "failed"
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE decision_jobs
+            SET status = %s, last_error = %s, result = %s,
+                run_after = NOW() + make_interval(secs => %s),
+                locked_by = NULL, locked_until = NULL, updated_at = NOW()
+            WHERE id = %s AND locked_by = %s
+        """, (status, error, json.dumps(result) if result else None, backoff, job_id, worker_id))
+        conn.commit()
+    return status
+
+
+def expire_abandoned_jobs():
+    """Fail jobs whose lease expired on their last allowed attempt, so they do not stay 'running' forever."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE decision_jobs
+            SET status = 'failed', last_error = COALESCE(last_error, 'visibility timeout exceeded'),
+                locked_by = NULL, locked_until = NULL, updated_at = NOW()
+            WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+        """)
+        conn.commit()
+        return cur.rowcount
+
+
+def get_job(job_id: str):
+    """Fetch a job's status row as a dict, or None if it does not exist."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM decision_jobs WHERE id = %s", (job_id,))
+        row = cur.fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+
+async def run_worker(worker_id: str, stop_event: asyncio.Event):
+    """Claim and process decision jobs until stop_event is set."""
+    logger.info("Decision job worker %s started", worker_id)
+    while not stop_event.is_set():
+        try:
+            job = await asyncio.to_thread(claim_job, worker_id)
+            if job is None:
+                await asyncio.to_thread(expire_abandoned_jobs)
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=DECISION_WORKER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, user_id, document_id, attempts, max_attempts = job
+            logger.info("Worker %s processing job %s (attempt %d/%d)", worker_id, job_id, attempts, max_attempts)
+            # The job id doubles as idempotency key, so a job re-run after a lost lease is not decided twice
+            result = await decide(str(user_id), str(document_id), idempotency_key=f"decision-job:{job_id}")
+
+            if result.get("status") == "ok":
+                await asyncio.to_thread(complete_job, job_id, worker_id, result)
+                logger.info("Job %s done: %s", job_id, result.get("final_decision"))
+            else:
+                error = result.get("detail") or result.get("reason") or "decision error"
+                status = await asyncio.to_thread(fail_job, job_id, worker_id, attempts, max_attempts, error, result)
+                logger.warning("Job %s attempt %d failed (%s), now %s", job_id, attempts, error, status)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Decision job worker %s error: %s", worker_id, e)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=DECISION_WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    logger.info("Decision job worker %s stopped", worker_id)
+
+
+def start_workers(stop_event: asyncio.Event) -> list:
+    """Start DECISION_WORKER_COUNT worker tasks on the running event loop."""
+    prefix = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+    return [
+        asyncio.create_task(run_worker(f"{prefix}-{i}", stop_event))
+        for i in range(DECISION_WORKER_COUNT)
+    ]
\ No newline at end of file
@@ -1,9 +1,34 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routes import router
+from metrics import MetricsMiddleware, metrics_router
+from decision_service import close_clients
+from db import close_pools
+from log_writer import stop_log_writer
+from job_worker import start_workers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the decision job workers that drain the decision_jobs queue
+    stop_event = asyncio.Event()
+    workers = start_workers(stop_event)
+    yield
+    stop_event.set()
+    await asyncio.gather(*workers, return_exceptions=True)
+    # Commit any buffered log rows, then release the shared downstream and database connection pools
+    await asyncio.to_thread(stop_log_writer)
+    await close_clients()
+    await close_pools()
 
 app = FastAPI(
     title="Decision Coordinator Service",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
-app.include_router(router)
\ No newline at end of file
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(router)
+app.include_router(metrics_router)
\ No newline at end of file
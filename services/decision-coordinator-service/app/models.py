@@ -1,5 +1,24 @@
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 
 class DecisionRequest(BaseModel):
     user_id: str
-    document_id: str
\ No newline at end of file
+    document_id: str
+
+class DecisionBatchRequest(BaseModel):
+    items: List[DecisionRequest]
+    concurrency: Optional[int] = None  # capped by BATCH_MAX_CONCURRENCY
+
+class DecisionJobStatus(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    document_id: Optional[str] = None
+    status: str  # queued / running / done / failed
+    attempts: int
+    max_attempts: int
+    run_after: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
\ No newline at end of file
@@ -1,12 +1,43 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
 import asyncio
-from models import DecisionRequest
-from decision_service import handle_decision_request
+from fastapi.responses import StreamingResponse
+from models import DecisionRequest, DecisionBatchRequest, DecisionJobStatus
+from decision_service import resilience_status
+from decision_cache import decide, IdempotencyConflict
+from batch_service import stream_batch_decisions
+from job_worker import get_job
+from deadline import Deadline
 from logger import logger
 
 router = APIRouter()
 
 @router.post("/process-decision")
-def process_decision(request: DecisionRequest):
-    # Launch entire handling pipeline as a background task
-    return handle_decision_request(request.user_id, request.document_id)
\ No newline at end of file
+async def process_decision(request: DecisionRequest, x_deadline_budget_ms: Optional[str] = Header(None),
+                           idempotency_key: Optional[str] = Header(None)):
+    # Run the whole pipeline on the event loop; downstream calls share pooled clients
+    try:
+        return await decide(request.user_id, request.document_id, idempotency_key=idempotency_key,
+                            deadline=Deadline.from_header(x_deadline_budget_ms))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/process-decisions")
+async def process_decisions(request: DecisionBatchRequest):
+    # Stream one JSON line per item as soon as its decision is made
+    return StreamingResponse(
+        stream_batch_decisions(request.items, request.concurrency),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/decision-jobs/{job_id}", response_model=DecisionJobStatus)
+async def decision_job_status(job_id: str):
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Decision job not found")
+    return job
+
+@router.get("/circuit-breakers")
+async def circuit_breakers():
+    # Breaker state, recent transitions and bulkhead usage per downstream service
+    return resilience_status()
\ No newline at end of file
@@ -1,26 +1,279 @@
 import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
+from logger import logger
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Pool sizing per process (for the primary and, if configured, the replica), how long a caller may wait
+# for a free connection, and how long a connection may sit idle before it is checked with SELECT 1 on checkout
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", 5.0))
+DB_POOL_CHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_CHECK_IDLE_SECONDS", 30.0))
+
+# Optional read replica for read_db_connection, as a libpq DSN; empty sends every read to the primary.
+# Reads fall back to the primary while the replica is more than REPLICA_MAX_LAG_SECONDS behind, and
+# the lag is re-measured at most every REPLICA_LAG_CHECK_SECONDS
+POSTGRES_READ_DSN = os.getenv("POSTGRES_READ_DSN", "")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5.0))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", 2.0))
+
+# Seconds the replica is behind the primary: zero when it has replayed everything it received
+# (or is not a standby at all), NULL when it cannot tell
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+_replica_state = {"usable": False, "checked_at": None}
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_TIMEOUT_SECONDS."""
+
+
+class ReplicaConnection(psycopg2.extensions.connection):
+    """Connections to the read replica, so callers can tell where a read was served from."""
+
+
+def _connect_kwargs() -> dict:
+    return {
+        "host": os.getenv("POSTGRES_HOST", "localhost"),
+        "port": int(os.getenv("POSTGRES_PORT", 5432)),
+        "dbname": os.getenv("POSTGRES_DB", "mortgage_decisioning"),
+        "user": os.getenv("POSTGRES_USER", "postgres"),
+        "password": os.getenv("POSTGRES_PASSWORD", "postgres")
+    }
+
+
+def _replica_connect_kwargs() -> dict:
+    return {"dsn": POSTGRES_READ_DSN, "connection_factory": ReplicaConnection}
+
+
 # Create a function to get a PostgreSQL connection
 def get_connection():
+    """A dedicated, unpooled connection for scripts and long-lived listeners. The caller closes it."""
     try:
-        connection = psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST", "localhost"),
-            port=int(os.getenv("POSTGRES_PORT", 5432)),
-            dbname=os.getenv("POSTGRES_DB", "mortgage_decisioning"),
-            user=os.getenv("POSTGRES_USER", "postgres"),
-            password=os.getenv("POSTGRES_PASSWORD", "postgres")
-        )
-        return connection
+        return psycopg2.connect(**_connect_kwargs())
     except Exception as e:
-        print("Failed to connect to the database:", e)
+        logger.error("Failed to connect to the database: %s", e)
+        raise
+
+
+class _Pool:
+    """A ThreadedConnectionPool, created on first use, with the bookkeeping checkout and release need."""
+
+    def __init__(self, connect_kwargs):
+        self.connect_kwargs = connect_kwargs
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+        self.last_used = {}
+
+    def get(self) -> ThreadedConnectionPool:
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, **self.connect_kwargs())
+        return self.pool
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+                self.last_used.clear()
+
+
+_primary = _Pool(_connect_kwargs)
+_replica = _Pool(_replica_connect_kwargs)
+
+
+def _healthy(pool: _Pool, conn) -> bool:
+    """Connections idle for a while are pinged before reuse, so a restarted server is noticed here."""
+    if conn.closed:
+        return False
+    if time.monotonic() - pool.last_used.get(id(conn), 0.0) < DB_POOL_CHECK_IDLE_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool: _Pool):
+    if not pool.slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS):
+        raise PoolTimeout(f"No database connection free after {DB_POOL_TIMEOUT_SECONDS}s")
+    try:
+        conn = pool.get().getconn()
+        if not _healthy(pool, conn):
+            logger.warning("Discarding broken pooled database connection")
+            pool.last_used.pop(id(conn), None)
+            pool.get().putconn(conn, close=True)
+            conn = pool.get().getconn()
+        return conn
+    except Exception:
+        pool.slots.release()
         raise
 
+
+def _release(pool: _Pool, conn):
+    try:
+        broken = conn.closed or conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN
+        if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # Left mid-transaction (early return or exception): never hand that state to the next caller
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            pool.last_used.pop(id(conn), None)
+        else:
+            pool.last_used[id(conn)] = time.monotonic()
+        pool.get().putconn(conn, close=broken)
+    finally:
+        pool.slots.release()
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a pooled connection for the duration of the with-block.
+    The caller commits; anything left uncommitted is rolled back when the connection is returned,
+    which happens on every exit path, including early returns and exceptions.
+    """
+    conn = _checkout(_primary)
+    try:
+        yield conn
+    finally:
+        _release(_primary, conn)
+
+
+def _set_replica_usable(usable: bool, reason: str):
+    if usable != _replica_state["usable"]:
+        if usable:
+            logger.info("Read replica in use (%s)", reason)
+        else:
+            logger.warning("Read replica not used, reads go to the primary (%s)", reason)
+    _replica_state["usable"] = usable
+    _replica_state["checked_at"] = time.monotonic()
+
+
+def _checkout_replica():
+    """A replica connection, or None when there is no replica or it is down or lagging."""
+    if not POSTGRES_READ_DSN:
+        return None
+    checked_at = _replica_state["checked_at"]
+    due = checked_at is None or time.monotonic() - checked_at >= REPLICA_LAG_CHECK_SECONDS
+    if not due and not _replica_state["usable"]:
+        return None
+    try:
+        conn = _checkout(_replica)
+    except PoolTimeout:
+        # A busy replica is not a broken one; queueing there is what keeps the load off the primary
+        raise
+    except Exception as e:
+        _set_replica_usable(False, f"connection failed: {e}")
+        return None
+    if due:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_SQL)
+                lag = cur.fetchone()[0]
+            conn.rollback()
+        except psycopg2.Error as e:
+            lag = None
+            logger.warning("Read replica lag check failed: %s", e)
+        usable = lag is not None and float(lag) <= REPLICA_MAX_LAG_SECONDS
+        _set_replica_usable(usable, f"lag {lag}s, limit {REPLICA_MAX_LAG_SECONDS}s")
+        if not usable:
+            _release(_replica, conn)
+            return None
+    return conn
+
+
+@contextmanager
+def read_db_connection():
+    """
+    Like db_connection, for read-only work that tolerates slightly stale data: served from the read
+    replica when one is configured and within REPLICA_MAX_LAG_SECONDS, otherwise from the primary.
+    Never use it to read back a write made just before.
+    """
+    pool, conn = _replica, _checkout_replica()
+    if conn is None:
+        pool, conn = _primary, _checkout(_primary)
+    try:
+        yield conn
+    finally:
+        _release(pool, conn)
+
+
+def max_staleness(conn) -> float:
+    """Upper bound, in seconds, on how far behind the primary reads on this connection may be."""
+    if isinstance(conn, ReplicaConnection):
+        return REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS
+    return 0.0
+
+
+def _async_conninfo() -> str:
+    # make_conninfo quotes and escapes values, so passwords and hosts may contain spaces, quotes or backslashes
+    from psycopg.conninfo import make_conninfo
+
+    return make_conninfo(**_connect_kwargs())
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """
+    Borrow a connection from the async (psycopg 3) pool, for code running on the event loop.
+    Needs psycopg[binary,pool]; the pool is opened on first use and health-checked on checkout.
+    """
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                from psycopg_pool import AsyncConnectionPool
+
+                pool = AsyncConnectionPool(
+                    _async_conninfo(),
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT_SECONDS,
+                    check=AsyncConnectionPool.check_connection,
+                    open=False
+                )
+                await pool.open()
+                _async_pool = pool
+    async with _async_pool.connection() as conn:
+        yield conn
+
+
+async def close_pools():
+    """Close all pools. Called on application shutdown."""
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    _primary.close()
+    _replica.close()
+
+
 if __name__ == "__main__":
-    conn = get_connection()
-    print("Connection established:", conn)
-    conn.close()
\ No newline at end of file
+    with db_connection() as conn:
+        print("Connection established:", conn)
@@ -1,57 +1,89 @@
-from db import get_connection
+from db import db_connection
 from models import FARequest
 from logger import logger
+from deadline import Deadline
+from metrics import observe_stage, count_outcome
+from log_writer import write_log_rows
 import json
 from datetime import datetime
 import uuid
+import os
 
-def evaluate_fairness(request: FARequest) -> dict:
-    logger.info(f"Evaluating Fairness user {request.user_id}, ml_result_id {request.ml_result_id}")
-    conn = get_connection()
-    cur = conn.cursor()
+BIAS_THRESHOLD = float(os.getenv("FAIRNESS_BIAS_THRESHOLD", 0.3))
+# ML results are audited right after they are written, so they are first looked up in the partitions
+# within this many hours of now, either way to allow for clock skew (ml_prediction_results is
+# partitioned by month, migration 007)
+ML_RESULT_LOOKBACK_HOURS = float(os.getenv("ML_RESULT_LOOKBACK_HOURS", 24))
 
-    try:
-        # Step 1: Fetch shap_summary from ml_prediction_results
-        cur.execute("""
-            SELECT shap_summary FROM ml_prediction_results  
-            WHERE id = %s
-        """, (request.ml_result_id,))
 
+def fetch_shap_summary(cur, ml_result_id: str):
+    """shap_summary of an ML result: recent partitions first, then the whole table."""
+    cur.execute("""
+        SELECT shap_summary FROM ml_prediction_results
+        WHERE id = %s
+          AND evaluated_at BETWEEN LOCALTIMESTAMP - make_interval(secs => %s) AND LOCALTIMESTAMP + make_interval(secs => %s)
+    """, (ml_result_id, ML_RESULT_LOOKBACK_HOURS * 3600, ML_RESULT_LOOKBACK_HOURS * 3600))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("SELECT shap_summary FROM ml_prediction_results WHERE id = %s", (ml_result_id,))
         row = cur.fetchone()
-        if not row:
-            raise Exception("result not found.")
+    return row
+
+
+def assess_bias(shap_summary: dict) -> dict:
+    """Flag every feature whose SHAP impact exceeds the bias threshold."""
+    biased_features = {}
+    for feature, impact in shap_summary.items():
+        if abs(impact) > BIAS_THRESHOLD:
+            biased_features[feature] = f"Impact: {impact}"
+
+    is_biased = len(biased_features) > 0
+    audit_notes = "Bias detected in features." if is_biased else "No significant bias detected."
+    return {
+        "is_biased": is_biased,
+        "flagged_features": biased_features,
+        "audit_notes": audit_notes
+    }
+
 
-        shap_summary = row[0]  # JSONB from Postgres
-        logger.info(f"kkkkk")
+def evaluate_fairness(request: FARequest, deadline: Deadline = None) -> dict:
+    deadline = deadline or Deadline()
+    logger.info(f"Evaluating Fairness user {request.user_id}, ml_result_id {request.ml_result_id}")
+    try:
+        # Step 1: Use the inline shap_summary, or fetch it from ml_prediction_results
+        deadline.check("fairness evaluation")
+        shap_summary = request.shap_summary
+        if shap_summary is None:
+            with observe_stage("shap_summary_fetch"), db_connection() as conn, conn.cursor() as cur:
+                row = fetch_shap_summary(cur, request.ml_result_id)
+            if not row:
+                raise Exception("result not found.")
+
+            shap_summary = row[0]  # JSONB from Postgres
         logger.info(f"Fetched shap_summary for fairness audit: {shap_summary}")
 
         # Step 2: Based on the SHAP summary, Evaluate Fairness
-        biased_features = {}
-        bias_threshold = 0.3  # Example threshold
-        for feature, impact in shap_summary.items():
-            if abs(impact) > bias_threshold:
-                biased_features[feature] = f"Impact: {impact}"
-        
-        is_biased = len(biased_features) > 0
-        audit_notes = "Bias detected in features." if is_biased else "No significant bias detected."
+        with observe_stage("fairness_check"):
+            assessment = assess_bias(shap_summary)
+        is_biased = assessment["is_biased"]
+        biased_features = assessment["flagged_features"]
+        audit_notes = assessment["audit_notes"]
         logger.info(f"Fairness Audit Result: is_biased={is_biased}, flagged_features={biased_features}")
-        
-        # Step 3: Insert into fairness_audit_log
+
+        # Step 3: Write the fairness_audit_log row. The log writer commits it with other requests' rows;
+        # wait for that, since the decision_log row written next refers to it by id
+        deadline.check("fairness_audit_log insert")
         audit_result_id = str(uuid.uuid4())
         audited_at = datetime.now()
-        cur.execute("""
-            INSERT INTO fairness_audit_log (id, ml_result_id, bias_detected, flagged_fields, audit_summary, audited_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (
+        write_log_rows([("fairness_audit_log", (
             audit_result_id,
             request.ml_result_id,
             is_biased,
             json.dumps(biased_features),
             audit_notes,
             audited_at
-        ))
-        
-        conn.commit()
+        ))])
+        count_outcome("fairness", "biased" if is_biased else "unbiased")
         logger.info(f"Inserted Fairness Audit log {audit_result_id}")
 
         return {
@@ -64,7 +96,3 @@ def evaluate_fairness(request: FARequest) -> dict:
     except Exception as e:
         logger.error(f"Error in evaluate_ml: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
-
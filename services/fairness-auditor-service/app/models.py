@@ -4,6 +4,7 @@ from typing import Dict, Optional
 class FARequest(BaseModel):
     user_id: str
     ml_result_id: str
+    shap_summary: Optional[Dict[str, float]] = None  # sent inline by the coordinator; skips the DB read
 
 class FAResult(BaseModel):
     is_biased: bool  
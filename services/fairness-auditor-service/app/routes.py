@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
 from models import FARequest, FAResult
 from fairness_evaluator import evaluate_fairness
+from deadline import Deadline
 
 router = APIRouter()
 
 @router.post("/bias-check", response_model=FAResult)
-def evaluate(user_input: FARequest):
-    return evaluate_fairness(user_input)
\ No newline at end of file
+def evaluate(user_input: FARequest, x_deadline_budget_ms: Optional[str] = Header(None)):
+    return evaluate_fairness(user_input, Deadline.from_header(x_deadline_budget_ms))
\ No newline at end of file
@@ -0,0 +1,52 @@
+import time
+from fastapi import HTTPException
+
+# Remaining time budget of a request in milliseconds, passed from service to service
+DEADLINE_HEADER = "X-Deadline-Budget-Ms"
+
+
+class Deadline:
+    """End-to-end time budget for one request. A Deadline without a budget never expires."""
+
+    def __init__(self, budget_seconds: float = None):
+        self.expires_at = None if budget_seconds is None else time.monotonic() + budget_seconds
+
+    @classmethod
+    def from_header(cls, value):
+        """Build a deadline from the X-Deadline-Budget-Ms header value (missing or invalid means unbounded)."""
+        try:
+            return cls(max(0.0, float(value)) / 1000.0)
+        except (TypeError, ValueError):
+            return cls()
+
+    def remaining(self):
+        """Seconds left, or None when unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: float) -> float:
+        """Timeout for the next step: the remaining budget, never more than cap."""
+        remaining = self.remaining()
+        return cap if remaining is None else min(cap, remaining)
+
+    def earliest(self, other: "Deadline") -> "Deadline":
+        """Return whichever of the two deadlines expires first."""
+        if other is None or other.expires_at is None:
+            return self
+        if self.expires_at is None or other.expires_at < self.expires_at:
+            return other
+        return self
+
+    def headers(self) -> dict:
+        """Headers that forward the remaining budget to a downstream service."""
+        remaining = self.remaining()
+        return {} if remaining is None else {DEADLINE_HEADER: str(int(remaining * 1000))}
+
+    def check(self, stage: str):
+        """Give up early with a 504 when the budget is already spent."""
+        if self.expired():
+            raise HTTPException(status_code=504, detail=f"Deadline exceeded before {stage}")
\ No newline at end of file
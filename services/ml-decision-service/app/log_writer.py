@@ -0,0 +1,188 @@
+import os
+import time
+import atexit
+import asyncio
+import threading
+from concurrent.futures import Future, InvalidStateError
+from psycopg2.extras import execute_values
+from db import get_connection
+from logger import logger
+from metrics import observe_stage, count_outcome
+
+# A flush starts once this many rows are buffered, or once the oldest buffered row has waited
+# LOG_WRITER_MAX_DELAY_MS; rows arriving while a flush runs join the next one (group commit)
+LOG_WRITER_BATCH_SIZE = int(os.getenv("LOG_WRITER_BATCH_SIZE", 500))
+LOG_WRITER_MAX_DELAY_MS = float(os.getenv("LOG_WRITER_MAX_DELAY_MS", 2.0))
+# How long a caller waits for its rows to be committed
+LOG_WRITER_ACK_TIMEOUT_SECONDS = float(os.getenv("LOG_WRITER_ACK_TIMEOUT_SECONDS", 10.0))
+
+# Columns per log table, in the order rows are given. Tables are written in this order within a
+# flush, so a row may reference another row submitted earlier (e.g. decision_log -> fairness_audit_log)
+LOG_TABLE_COLUMNS = {
+    "rule_evaluation_log": ("id", "user_id", "document_id", "rule_values", "rule_status", "evaluated_at", "rule_set_version"),
+    "ml_prediction_results": ("id", "user_id", "document_id", "predicted_decision", "confidence_score", "shap_summary", "evaluated_at"),
+    "fairness_audit_log": ("id", "ml_result_id", "bias_detected", "flagged_fields", "audit_summary", "audited_at"),
+    "decision_log": ("type", "borrower_id", "document_id", "final_decision", "explanation", "rule_result_id",
+                     "ml_result_id", "fairness_audit_log_id", "created_at"),
+}
+
+
+def _insert_sql(table: str) -> str:
+    return f"INSERT INTO {table} ({', '.join(LOG_TABLE_COLUMNS[table])}) VALUES %s"
+
+
+def _resolve(future: Future, error: Exception = None):
+    # A waiter that gave up (timeout, cancelled request) may have cancelled its future already
+    try:
+        if error is None:
+            future.set_result(True)
+        else:
+            future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+class LogWriter:
+    """
+    Buffers rows for the evaluation and decision log tables and writes them from one background
+    thread, many rows per multi-row INSERT and one commit per flush instead of one per row.
+    Each submitted row gets a Future that resolves once its flush has committed.
+    """
+
+    def __init__(self, batch_size: int = LOG_WRITER_BATCH_SIZE, max_delay_ms: float = LOG_WRITER_MAX_DELAY_MS):
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max(0.0, max_delay_ms) / 1000
+        self._pending = []  # (table, row, future)
+        self._oldest_pending_at = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._conn = None
+
+    def submit(self, rows: list) -> list:
+        """Queue (table, row) pairs and return one Future per row. Rows from one call share a flush."""
+        for table, _ in rows:
+            if table not in LOG_TABLE_COLUMNS:
+                raise ValueError(f"{table} is not a log table")
+        futures = [Future() for _ in rows]
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Log writer is stopped")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+            if self._oldest_pending_at is None:
+                self._oldest_pending_at = time.monotonic()
+            self._pending.extend((table, row, future) for (table, row), future in zip(rows, futures))
+            self._cond.notify()
+        return futures
+
+    def stop(self):
+        """Flush whatever is buffered and stop the writer thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=LOG_WRITER_ACK_TIMEOUT_SECONDS)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _next_batch(self):
+        """Block until a flush is due; None once stopped with nothing left to write."""
+        with self._cond:
+            while True:
+                if self._pending:
+                    if self._stopping or len(self._pending) >= self.batch_size:
+                        break
+                    wait = self._oldest_pending_at + self.max_delay - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._oldest_pending_at = time.monotonic() if self._pending else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Never let the writer thread die with callers waiting on it
+                logger.exception("Log writer flush failed: %s", e)
+                for _, _, future in batch:
+                    _resolve(future, e)
+
+    def _connection(self):
+        # One dedicated connection, so a busy request pool can never starve the writer
+        if self._conn is None or self._conn.closed:
+            self._conn = get_connection()
+        return self._conn
+
+    def _write(self, items: list):
+        """Insert the items in one transaction, tables in LOG_TABLE_COLUMNS order."""
+        conn = self._connection()
+        try:
+            with conn.cursor() as cur:
+                for table in LOG_TABLE_COLUMNS:
+                    rows = [row for t, row, _ in items if t == table]
+                    if rows:
+                        execute_values(cur, _insert_sql(table), rows, page_size=len(rows))
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+    def _flush(self, batch: list):
+        try:
+            with observe_stage("log_writer_flush"):
+                self._write(batch)
+            count_outcome("log_writer_flush", "ok")
+            for _, _, future in batch:
+                _resolve(future)
+            return
+        except Exception as e:
+            count_outcome("log_writer_flush", "failed")
+            if len(batch) == 1:
+                _resolve(batch[0][2], e)
+                return
+            logger.warning("Log writer batch of %d rows failed (%s); writing them one at a time", len(batch), e)
+        # One bad row must not fail everyone else's: retry each row in its own transaction, in table order
+        order = list(LOG_TABLE_COLUMNS)
+        for item in sorted(batch, key=lambda item: order.index(item[0])):
+            try:
+                self._write([item])
+                _resolve(item[2])
+            except Exception as e:
+                _resolve(item[2], e)
+
+
+_writer = LogWriter()
+atexit.register(_writer.stop)
+
+
+def write_log_rows(rows: list, timeout: float = LOG_WRITER_ACK_TIMEOUT_SECONDS):
+    """Queue (table, row) pairs and block until they are committed; raises if any row failed."""
+    for future in _writer.submit(rows):
+        future.result(timeout=timeout)
+
+
+async def write_log_rows_async(rows: list, timeout: float = LOG_WRITER_ACK_TIMEOUT_SECONDS):
+    """Queue (table, row) pairs and wait, without blocking the event loop, until they are committed."""
+    futures = [asyncio.wrap_future(future) for future in _writer.submit(rows)]
+    await asyncio.wait_for(asyncio.gather(*futures), timeout)
+
+
+def stop_log_writer():
+    """Flush buffered rows and stop the writer. Called on application shutdown."""
+    _writer.stop()
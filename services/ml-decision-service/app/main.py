@@ -1,9 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routes import router
+from metrics import MetricsMiddleware, metrics_router
+from db import close_pools
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the database connection pools
+    await close_pools()
 
 app = FastAPI(
     title="ML Decision Service",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
-app.include_router(router)
\ No newline at end of file
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(router)
+app.include_router(metrics_router)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import time
+from contextlib import contextmanager
+from fastapi import APIRouter, Response
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and outcome", ["method", "route", "outcome"]
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_duration_seconds", "Latency of each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGES_IN_FLIGHT = Gauge("pipeline_stage_in_flight", "Pipeline stages currently running", ["stage"])
+STAGE_OUTCOMES = Counter("pipeline_outcomes_total", "Pipeline results by stage and outcome", ["stage", "outcome"])
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a pipeline stage (DB query, model call, downstream HTTP call) into pipeline_stage_duration_seconds."""
+    in_flight = STAGES_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def count_outcome(stage: str, outcome: str):
+    """Count one result of a stage, e.g. ("decision", "approved") or ("rules", "fail")."""
+    STAGE_OUTCOMES.labels(stage, outcome).inc()
+
+
+def _outcome(status_code: int) -> str:
+    if status_code >= 500:
+        return "server_error"
+    if status_code >= 400:
+        return "client_error"
+    return "success"
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording latency, outcome and in-flight count for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            # Label by route template (/decision-jobs/{job_id}), not the raw path, to bound cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], route).observe(elapsed)
+            REQUESTS.labels(scope["method"], route, _outcome(status["code"])).inc()
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
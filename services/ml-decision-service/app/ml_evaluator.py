@@ -1,33 +1,61 @@
-from db import get_connection
+from db import db_connection
 from models import MLRequest, MLResult
 from logger import logger
+from deadline import Deadline
+from metrics import observe_stage, count_outcome
+from log_writer import write_log_rows
 import json
 from datetime import datetime
 import uuid
+import os
+import hashlib
 import joblib
 import shap
 import numpy as np
 import pandas as pd
 
 
-def predict_from_parsed_data(parsed_data: dict):
-    model = joblib.load("ml_model.pkl")
-    explainer = shap.TreeExplainer(model)
+MODEL_FILE = "ml_model.pkl"
+# Model inputs, in training_data column order; typed at upload into document_features (migration 009)
+MODEL_FEATURES = ("salary", "credit_score", "employment_years", "loan_amount")
+
+_model_version = {"stamp": None, "version": None}
+
+
+def get_model_version() -> str:
+    """Content hash of the current model file; recomputed only when the file changes on disk."""
+    stat = os.stat(MODEL_FILE)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    if _model_version["stamp"] != stamp:
+        digest = hashlib.sha256()
+        with open(MODEL_FILE, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        _model_version["stamp"] = stamp
+        _model_version["version"] = digest.hexdigest()[:16]
+    return _model_version["version"]
+
+
+def predict_from_features(document_features: dict):
+    missing = [name for name in MODEL_FEATURES if document_features.get(name) is None]
+    if missing:
+        raise Exception(f"Document is missing model features: {', '.join(missing)}")
+
+    with observe_stage("model_load"):
+        model = joblib.load(MODEL_FILE)
+        explainer = shap.TreeExplainer(model)
 
     # Build DataFrame with proper feature names
-    features = pd.DataFrame([[
-        format_amount(parsed_data["annual_salary"]),
-        parsed_data["credit_score"],
-        parsed_data["employment_years"],
-        format_amount(parsed_data["loan_amount"])
-    ]], columns=["salary", "credit_score", "employment_years", "loan_amount"])
+    features = pd.DataFrame([[document_features[name] for name in MODEL_FEATURES]], columns=list(MODEL_FEATURES))
 
     # Predict probabilities
-    prob = model.predict_proba(features)[0]
+    with observe_stage("predict_proba"):
+        prob = model.predict_proba(features)[0]
     decision = "accepted" if prob[1] > 0.5 else "rejected"
 
     # SHAP values
-    shap_output = explainer.shap_values(features)
+    with observe_stage("shap"):
+        shap_output = explainer.shap_values(features)
     if isinstance(shap_output, list):
         shap_values = shap_output[1]  # Class 1 = accepted
     else:
@@ -44,27 +72,31 @@ def predict_from_parsed_data(parsed_data: dict):
         "shap_summary": shap_summary
     }
 
-def evaluate_ml_decision(request: MLRequest) -> dict:
+def evaluate_ml_decision(request: MLRequest, deadline: Deadline = None) -> dict:
+    deadline = deadline or Deadline()
     logger.info(f"🔍 Evaluating ML decision for user {request.user_id}, document {request.document_id}")
-    conn = get_connection()
-    cur = conn.cursor()
 
     try:
-        # Step 1: Fetch parsed_data from documents
-        cur.execute("""
-            SELECT parsed_data FROM documents 
-            WHERE id = %s AND user_id = %s
-        """, (request.document_id, request.user_id))
-
-        row = cur.fetchone()
-        if not row:
-            raise Exception("Document not found.")
-
-        parsed_data = row[0]  # JSONB from Postgres
-        logger.info(f"Fetched parsed data for ML evaluation: {parsed_data}")
+        # Step 1: Use the inline features, or fetch the document's typed features
+        deadline.check("document fetch")
+        document_features = request.features
+        if document_features is None:
+            with db_connection() as conn, conn.cursor() as cur, observe_stage("document_fetch"):
+                cur.execute("""
+                    SELECT features FROM document_inputs
+                    WHERE document_id = %s AND user_id = %s
+                """, (request.document_id, request.user_id))
+
+                row = cur.fetchone()
+            if not row:
+                raise Exception("Document not found.")
+
+            document_features = row[0]  # JSONB from Postgres
+        logger.info(f"Fetched features for ML evaluation: {document_features}")
 
         # Step 2: Based on the document which contains name, personal details, salary and many more, Execute ML decision
-        ml_result = predict_from_parsed_data(parsed_data)
+        deadline.check("ML prediction")
+        ml_result = predict_from_features(document_features)
 
         prediction_decision = ml_result["predicted_decision"]
         confidence_score = ml_result["confidence"]
@@ -75,42 +107,35 @@ def evaluate_ml_decision(request: MLRequest) -> dict:
         ml_result_id = str(uuid.uuid4())
         evaluated_at = datetime.now()
 
-        cur.execute("""
-            INSERT INTO ml_prediction_results (id, user_id, document_id, predicted_decision, confidence_score, shap_summary, evaluated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            ml_result_id,
-            request.user_id,
-            request.document_id,
-            prediction_decision,
-            confidence_score,
-            json.dumps(shap_summary),
-            evaluated_at
-        ))
-
-        conn.commit()
+        deadline.check("ml_prediction_results insert")
+        # Group-committed with other requests' rows; returns once durable, because the fairness
+        # audit and decision_log rows reference it
+        with observe_stage("ml_prediction_results_insert"):
+            write_log_rows([("ml_prediction_results", (
+                ml_result_id,
+                request.user_id,
+                request.document_id,
+                prediction_decision,
+                confidence_score,
+                json.dumps(shap_summary),
+                evaluated_at
+            ))])
+        count_outcome("ml", prediction_decision)
         logger.info(f"Inserted ML log {ml_result_id}")
 
         return {
             "status": prediction_decision,
             "confidence": str(confidence_score),
-            "ml_result_id": str(ml_result_id)
+            "ml_result_id": str(ml_result_id),
+            "shap_summary": shap_summary
         }
 
     except Exception as e:
         logger.error(f"Error in evaluate_ml: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
-
-def format_amount(value: str):
-    return float(value.replace("$", "").replace(",", "").strip())
 
 if __name__ == "__main__":
-    parsed_data = {'ssn': 'XXX-XX-1234', 'date': '2025-10-28', 'email': 'john.doe@example.com', 'phone': '(123) 456-7890', 'assets': 'Checking Account-$20,000,  Retirement Fund-$85,000,Vehicle-2021 Toyota Camry ($18,000)', 'address': '123 Main Street, XYZ, NY 23456', 'purpose': 'Purchase of Primary Residence', 'employer': 'ABC Corp', 'position': 'Senior Software Engineer', 'loan_term': '30 years', 'liabilities': 'Credit Card Debt-$2,500,Auto Loan-$10,000', 'credit_score': '600', 'annual_salary': '$145,000', 'date_of_birth': '1984-09-12', 'interest_rate': '6.25%', 'applicant_name': 'John Doe', 'employment_years': '10', 'property_address': '', 'applicant_signature': '________________________', 'loan_amount_requested': '$400,000'}
-
-    ml_result = predict_from_parsed_data(parsed_data)
+    ml_result = predict_from_features({"salary": 145000, "credit_score": 600, "employment_years": 10, "loan_amount": 400000})
     prediction_decision = ml_result["predicted_decision"]
     confidence_score = ml_result["confidence"]
     shap_summary = ml_result["shap_summary"]
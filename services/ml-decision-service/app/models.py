@@ -1,11 +1,13 @@
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 class MLRequest(BaseModel):
     user_id: str
     document_id: str
+    features: Optional[Dict[str, Any]] = None  # document_inputs features sent inline; skips the documents read
 
 class MLResult(BaseModel):
     status: str  # "accepted" or "rejected"
     confidence: Optional[str] = None  
-    ml_result_id: Optional[str] = None
\ No newline at end of file
+    ml_result_id: Optional[str] = None
+    shap_summary: Optional[Dict[str, float]] = None  # lets the fairness check run without re-reading it
\ No newline at end of file
@@ -1,13 +1,21 @@
 from fastapi import APIRouter,Header
+from typing import Optional
 from models import MLRequest, MLResult
-from ml_evaluator import evaluate_ml_decision
+from ml_evaluator import evaluate_ml_decision, get_model_version
 from train_ml_model import train_model_from_db
+from deadline import Deadline
 
 router = APIRouter()
 
 @router.post("/evaluate-ml-decision", response_model=MLResult)
-def evaluate(user_input: MLRequest):
-    return evaluate_ml_decision(user_input)
+def evaluate(user_input: MLRequest, x_deadline_budget_ms: Optional[str] = Header(None)):
+    return evaluate_ml_decision(user_input, Deadline.from_header(x_deadline_budget_ms))
+
+
+@router.get("/model-version")
+def model_version():
+    # Lets callers key cached decisions on the model that produced them
+    return {"model_version": get_model_version()}
 
 
 @router.post("/train-ml-model")
@@ -0,0 +1,211 @@
+import ast
+import operator
+import numpy as np
+import pandas as pd
+from logger import logger
+
+MAX_EXPRESSION_LENGTH = 200
+
+
+def clean_value(value):
+    """Strip currency formatting from strings ("$145,000" -> "145000"); other values pass through."""
+    if isinstance(value, str):
+        return value.replace("$", "").replace(",", "").strip()
+    return value
+
+
+def to_text(value) -> str:
+    return str(clean_value(value)).lower()
+
+
+def to_number(value) -> float:
+    """The value as a float, or NaN if it does not parse; NaN fails every numeric comparison."""
+    try:
+        return float(clean_value(value))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _divide(a: float, b: float) -> float:
+    # Division by zero gives NaN, so the rule fails instead of raising
+    return a / b if b else np.nan
+
+
+def _divide_columns(a, b):
+    return np.where(b == 0, np.nan, a / b)
+
+
+# Arithmetic a rule's field may use over document fields, e.g. "loan_amount/salary", as
+# (one document, whole column) implementations. Anything else (calls, attributes, subscripts,
+# comparisons, ...) is not an expression, and the field stays a plain key.
+BINARY_OPERATORS = {
+    ast.Add: (operator.add, operator.add),
+    ast.Sub: (operator.sub, operator.sub),
+    ast.Mult: (operator.mul, operator.mul),
+    ast.Div: (_divide, _divide_columns),
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class FieldColumn:
+    """
+    One document field across a batch of documents, as the raw values plus the cleaned forms the
+    checks compare against. Each form is computed once per batch, however many rules read the field.
+    """
+
+    def __init__(self, values: pd.Series):
+        self.values = values
+        self.missing = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        self._numbers = None
+        self._text = None
+
+    @property
+    def numbers(self) -> np.ndarray:
+        if self._numbers is None:
+            self._numbers = np.fromiter(map(to_number, self.values), dtype=float, count=len(self.values))
+        return self._numbers
+
+    @property
+    def text(self) -> pd.Series:
+        if self._text is None:
+            self._text = self.values.map(to_text)
+        return self._text
+
+
+def _is_expression(tree) -> bool:
+    """True when tree is arithmetic over names and numbers with at least one operator."""
+    has_operator = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in BINARY_OPERATORS:
+                return False
+            has_operator = True
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in UNARY_OPERATORS:
+                return False
+            has_operator = True
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                return False
+        elif not isinstance(node, (ast.Expression, ast.Name, ast.Load, ast.operator, ast.unaryop)):
+            return False
+    return has_operator
+
+
+def _compile_node(node) -> tuple:
+    """
+    (scalar, vector) evaluators for one whitelisted node. scalar(data) gives a float, or None when an
+    operand is missing from the document. vector(column) gives (floats, missing) for a batch, where
+    column(name) returns the FieldColumn of a document field.
+    """
+    if isinstance(node, ast.Name):
+        name = node.id
+
+        def scalar(data):
+            value = data.get(name)
+            return None if value is None else to_number(value)
+
+        def vector(column):
+            field = column(name)
+            return field.numbers, field.missing
+        return scalar, vector
+
+    if isinstance(node, ast.Constant):
+        constant = float(node.value)
+        return (lambda data: constant), (lambda column: (constant, False))
+
+    if isinstance(node, ast.UnaryOp):
+        apply = UNARY_OPERATORS[type(node.op)]
+        operand_scalar, operand_vector = _compile_node(node.operand)
+
+        def scalar(data):
+            value = operand_scalar(data)
+            return None if value is None else apply(value)
+
+        def vector(column):
+            values, missing = operand_vector(column)
+            return apply(values), missing
+        return scalar, vector
+
+    apply, apply_columns = BINARY_OPERATORS[type(node.op)]
+    left_scalar, left_vector = _compile_node(node.left)
+    right_scalar, right_vector = _compile_node(node.right)
+
+    def scalar(data):
+        left = left_scalar(data)
+        if left is None:
+            return None
+        right = right_scalar(data)
+        return None if right is None else apply(left, right)
+
+    def vector(column):
+        left, left_missing = left_vector(column)
+        right, right_missing = right_vector(column)
+        # inf - inf, x / 0 and the like give NaN or inf silently, as they do for one document
+        with np.errstate(all="ignore"):
+            return apply_columns(left, right), np.logical_or(left_missing, right_missing)
+    return scalar, vector
+
+
+def _parse(field: str):
+    """The AST of field if it is an arithmetic expression, else None (a plain key)."""
+    if len(field) > MAX_EXPRESSION_LENGTH:
+        return None
+    try:
+        tree = ast.parse(field.strip(), mode="eval")
+    except (SyntaxError, ValueError):
+        return None
+    if isinstance(tree.body, (ast.Name, ast.Constant)):
+        return None
+    if not _is_expression(tree):
+        logger.warning(f"Rule field {field!r} is not a supported expression; reading it as a document key")
+        return None
+    return tree
+
+
+class FieldReader:
+    """
+    How a rule reads its field from a document: a plain key lookup, or an arithmetic expression over
+    document fields, parsed and compiled into closures once per rule set (no eval). read(data) serves
+    one document and column(column) a batch; both give the same value per document.
+    """
+    __slots__ = ("field", "names", "read", "column")
+
+    def __init__(self, field: str):
+        self.field = field
+        tree = _parse(field)
+        if tree is None:
+            self.names = (field,)
+            self.read = lambda data: data.get(field)
+            self.column = lambda column: column(field)
+            return
+
+        expression_scalar, expression_vector = _compile_node(tree.body)
+        operands = (node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+        self.names = tuple(dict.fromkeys((field, *operands)))
+
+        # A document that has the whole string as a key (e.g. "debt-to-income") keeps using it
+        def read(data):
+            value = data.get(field)
+            return value if value is not None else expression_scalar(data)
+
+        def read_column(column):
+            literal = column(field)
+            numbers, missing = expression_vector(column)
+            shape = literal.missing.shape
+            fill = literal.missing & ~np.broadcast_to(missing, shape)
+            if not fill.any():
+                return literal
+            values = literal.values.copy()
+            values[fill] = np.broadcast_to(numbers, shape)[fill].tolist()
+            return FieldColumn(values)
+
+        self.read = read
+        self.column = read_column
+
+
+def compile_field(field: str) -> FieldReader:
+    return FieldReader(field)
@@ -1,11 +1,62 @@
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 
 class RuleRequest(BaseModel):
     user_id: str
     document_id: str
+    features: Optional[Dict[str, Any]] = None  # document_inputs features sent inline; skips the documents read
+    fail_fast: bool = False  # stop at the first failed rule; reasons then only has the rules checked
 
 class RuleResult(BaseModel):
     status: str  # "pass" or "fail"
     reasons: Dict[str, str]  # {"rule_name": "Passed/Failed: Reason"}
-    rule_result_id: Optional[str] = None
\ No newline at end of file
+    rule_result_id: Optional[str] = None
+    rule_set_version: Optional[str] = None  # rules_config version the evaluation used
+
+class RuleBatchRequest(BaseModel):
+    document_ids: List[str]
+    log_results: bool = True  # False evaluates without writing rule_evaluation_log rows
+    fail_fast: bool = False  # as in RuleRequest, per document
+
+class RuleBatchItem(BaseModel):
+    document_id: str
+    user_id: str
+    status: str
+    reasons: Dict[str, str]
+    rule_result_id: Optional[str] = None
+
+class RuleBatchResult(BaseModel):
+    rule_set_version: str
+    results: List[RuleBatchItem]
+    unevaluated_document_ids: List[str]  # not found, or with no parsed_data
+
+
+class RuleStatsItem(BaseModel):
+    name: str
+    field: str
+    operator: str
+    value: str
+    evaluations: int
+    failures: int
+    skips: int
+    failure_rate: float  # smoothed failures / evaluations, as fail-fast ordering uses it
+    mean_microseconds: float
+    total_seconds: float
+    fail_fast_position: int  # 0 is checked first
+
+class RuleStatsResult(BaseModel):
+    rule_set_version: str
+    rules: List[RuleStatsItem]  # in table order
+
+
+class RuleDefinition(BaseModel):
+    name: str
+    field: str  # a document field, or arithmetic over fields such as loan_amount/salary
+    operator: str
+    value: str
+    message: Optional[str] = None
+
+class RuleSimulationRequest(BaseModel):
+    rules: List[RuleDefinition]  # the candidate rule set, in evaluation order
+    limit: Optional[int] = None  # most documents to replay; all by default
+    sample_size: Optional[int] = None  # flipped document ids returned per direction
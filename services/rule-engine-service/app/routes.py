@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException
-from models import RuleRequest, RuleResult
-from rule_evaluator import evaluate_rules
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
+from models import RuleRequest, RuleResult, RuleBatchRequest, RuleBatchResult, RuleSimulationRequest, RuleStatsResult
+from rule_evaluator import evaluate_rules, evaluate_rules_batch, get_rule_stats
+from rule_simulation import simulate_rules
+from deadline import Deadline
 
 router = APIRouter()
 
 @router.post("/evaluate-rules", response_model=RuleResult)
-def evaluate(user_input: RuleRequest):
-    return evaluate_rules(user_input)
\ No newline at end of file
+def evaluate(user_input: RuleRequest, x_deadline_budget_ms: Optional[str] = Header(None)):
+    return evaluate_rules(user_input, Deadline.from_header(x_deadline_budget_ms))
+
+@router.post("/evaluate-rules/batch", response_model=RuleBatchResult)
+def evaluate_batch(request: RuleBatchRequest):
+    return evaluate_rules_batch(request)
+
+@router.get("/rule-stats", response_model=RuleStatsResult)
+def rule_stats():
+    return get_rule_stats()
+
+@router.post("/simulate-rules")
+def simulate(request: RuleSimulationRequest):
+    return simulate_rules(request)
\ No newline at end of file
@@ -1,119 +1,187 @@
-from db import get_connection
-from models import RuleRequest, RuleResult
+from db import db_connection
+from models import RuleRequest, RuleResult, RuleBatchRequest
 from logger import logger
+from deadline import Deadline
+from metrics import observe_stage, count_outcome
+from log_writer import write_log_rows, LOG_TABLE_COLUMNS
+from rule_set import rule_set_cache, compile_condition
+from rule_stats import rule_stats
+from psycopg2.extras import execute_values
+from fastapi import HTTPException
+import os
 import json
 from datetime import datetime
 import uuid
 
+# Most documents one /evaluate-rules/batch request may name
+RULE_BATCH_MAX_DOCUMENTS = int(os.getenv("RULE_BATCH_MAX_DOCUMENTS", 5000))
 
-def evaluate_rules(request: RuleRequest) -> dict:
-    logger.info(f"🔍 Evaluating rules for user {request.user_id}, document {request.document_id}")
-    conn = get_connection()
-    cur = conn.cursor()
 
-    try:
-        # Step 1: Fetch parsed_data from documents
+def fetch_features(user_id: str, document_id: str) -> dict:
+    """The document's parsed_data with its typed features (migration 009) laid over it."""
+    with db_connection() as conn, conn.cursor() as cur:
         cur.execute("""
-            SELECT parsed_data FROM documents 
-            WHERE id = %s AND user_id = %s
-        """, (request.document_id, request.user_id))
-
+            SELECT features FROM document_inputs
+            WHERE document_id = %s AND user_id = %s
+        """, (document_id, user_id))
         row = cur.fetchone()
-        if not row:
-            raise Exception("Document not found.")
-
-        parsed_data = row[0]  # JSONB from Postgres
-
-        logger.info(f"Fetched parsed data for rule evaluation: {parsed_data}")
+    if not row:
+        raise Exception("Document not found.")
+    return row[0]  # JSONB from Postgres
 
-        # Step 2: Fetch all active rules
-        cur.execute("SELECT name, field, operator, value, message FROM rules_config")
-        rules = cur.fetchall()
 
-        reasons = {}
-        passed = True
-
-        for rule in rules:
-            name, field, operator, expected_value, message = rule
-            actual_value = parsed_data.get(field)
-
-            if actual_value is None:
-                reasons[name] = f"Skipped: {field} not found in document"
-                continue
+def evaluate_rules(request: RuleRequest, deadline: Deadline = None) -> dict:
+    deadline = deadline or Deadline()
+    logger.info(f"🔍 Evaluating rules for user {request.user_id}, document {request.document_id}")
+    try:
+        # Step 1: Use the inline features, or fetch them from document_inputs
+        deadline.check("document fetch")
+        parsed_data = request.features
+        if parsed_data is None:
+            with observe_stage("document_fetch"):
+                parsed_data = fetch_features(request.user_id, request.document_id)
 
-            result = evaluate_condition(actual_value, operator, expected_value)
+        logger.info(f"Fetched parsed data for rule evaluation: {parsed_data}")
 
-            if result:
-                reasons[name] = "Passed"
-            else:
-                passed = False
-                reasons[name] = f"Failed: {message or f'{field} {operator} {expected_value}'}"
+        # Step 2: Evaluate the compiled rule set (recompiled only when rules_config changes)
+        deadline.check("rule evaluation")
+        with observe_stage("rules_config_fetch"):
+            rule_set = rule_set_cache.get()
+        with observe_stage("rule_evaluation"):
+            passed, reasons = rule_set.evaluate(parsed_data, fail_fast=request.fail_fast)
 
         # Step 3: Insert into rule_evaluation_log
+        deadline.check("rule_evaluation_log insert")
         rule_result_id = str(uuid.uuid4())
         rule_status = "pass" if passed else "fail"
         evaluated_at = datetime.now()
 
-        cur.execute("""
-            INSERT INTO rule_evaluation_log (id, user_id, document_id, rule_values, rule_status, evaluated_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (
-            rule_result_id,
-            request.user_id,
-            request.document_id,
-            json.dumps(reasons),
-            rule_status,
-            evaluated_at
-        ))
-
-        conn.commit()
+        # Group-committed with other requests' rows; returns once the row is durable,
+        # because the coordinator's decision_log row references it
+        with observe_stage("rule_evaluation_log_insert"):
+            write_log_rows([("rule_evaluation_log", (
+                rule_result_id,
+                request.user_id,
+                request.document_id,
+                json.dumps(reasons),
+                rule_status,
+                evaluated_at,
+                rule_set.version
+            ))])
+        count_outcome("rules", rule_status)
         logger.info(f"Inserted rule log {rule_result_id}")
 
         return {
             "status": rule_status,
             "reasons": reasons,
-            "rule_result_id": rule_result_id
+            "rule_result_id": rule_result_id,
+            "rule_set_version": rule_set.version
         }
 
     except Exception as e:
         logger.error(f"Error in evaluate_rules: {e}")
         raise
-    finally:
-        cur.close()
-        conn.close()
 
 
-def evaluate_condition(actual, operator, expected):
+def fetch_documents(cur, document_ids: list) -> list:
+    """(document id, user id, features) for the given documents that exist, in the order given."""
+    cur.execute("""
+        SELECT document_id::text, user_id::text, features FROM document_inputs
+        WHERE document_id = ANY(%s::uuid[])
+    """, (document_ids,))
+    found = {row[0]: row for row in cur.fetchall()}
+    return [found[document_id] for document_id in document_ids if document_id in found]
+
+
+def evaluate_documents(document_ids: list, log_results: bool = True, fail_fast: bool = False) -> dict:
+    """
+    Evaluate the current rule set against many stored documents at once: one read for all their
+    parsed_data, one column operation per rule, and (with log_results) one multi-row insert into
+    rule_evaluation_log. Per document, status and reasons are what evaluate_rules returns for it.
+    """
     try:
-        def clean_number(val):
-            if isinstance(val, str):
-                val = val.replace("$", "").replace(",", "").strip()
-            return val
-        
-        actual = clean_number(actual)
-        expected = clean_number(expected)
-        if operator in [">", ">=", "<", "<="]:
-            actual = float(actual)
-            expected = float(expected)
-
-        if operator == ">":
-            return actual > expected
-        elif operator == ">=":
-            return actual >= expected
-        elif operator == "<":
-            return actual < expected
-        elif operator == "<=":
-            return actual <= expected
-        elif operator == "=":
-            return str(actual).lower() == str(expected).lower()
-        elif operator == "!=":
-            return str(actual).lower() != str(expected).lower()
-        elif operator == "in":
-            return str(actual).lower() in [e.strip().lower() for e in expected.split(",")]
-        elif operator == "not in":
-            return str(actual).lower() not in [e.strip().lower() for e in expected.split(",")]
-        else:
-            return False
-    except Exception as e:
-        logger.warning(f"Error evaluating rule {operator} on {actual} vs {expected}: {e}")
-        return False
\ No newline at end of file
+        document_ids = list(dict.fromkeys(str(uuid.UUID(str(document_id))) for document_id in document_ids))
+    except ValueError:
+        raise ValueError("document_ids must be UUIDs")
+    if len(document_ids) > RULE_BATCH_MAX_DOCUMENTS:
+        raise ValueError(f"At most {RULE_BATCH_MAX_DOCUMENTS} documents per batch")
+
+    with observe_stage("batch_document_fetch"), db_connection() as conn, conn.cursor() as cur:
+        documents = fetch_documents(cur, document_ids)
+    # A document without parsed_data cannot be evaluated, by evaluate_rules either
+    evaluable = [document for document in documents if isinstance(document[2], dict)]
+    evaluated_ids = {document[0] for document in evaluable}
+
+    rule_set = rule_set_cache.get()
+    with observe_stage("batch_rule_evaluation"):
+        passed, reasons = rule_set.evaluate_batch([document[2] for document in evaluable], fail_fast=fail_fast)
+
+    evaluated_at = datetime.now()
+    results = [
+        {
+            "document_id": document_id,
+            "user_id": user_id,
+            "status": "pass" if document_passed else "fail",
+            "reasons": document_reasons,
+            "rule_result_id": str(uuid.uuid4()) if log_results else None
+        }
+        for (document_id, user_id, _), document_passed, document_reasons in zip(evaluable, passed, reasons)
+    ]
+
+    if log_results and results:
+        columns = LOG_TABLE_COLUMNS["rule_evaluation_log"]
+        rows = [
+            (result["rule_result_id"], result["user_id"], result["document_id"], json.dumps(result["reasons"]),
+             result["status"], evaluated_at, rule_set.version)
+            for result in results
+        ]
+        with observe_stage("batch_rule_evaluation_log_insert"), db_connection() as conn, conn.cursor() as cur:
+            execute_values(cur, f"INSERT INTO rule_evaluation_log ({', '.join(columns)}) VALUES %s",
+                           rows, page_size=len(rows))
+            conn.commit()
+
+    for result in results:
+        count_outcome("rules", result["status"])
+    logger.info(f"Evaluated rule set {rule_set.version} against {len(results)} of {len(document_ids)} documents")
+
+    return {
+        "rule_set_version": rule_set.version,
+        "results": results,
+        "unevaluated_document_ids": [document_id for document_id in document_ids if document_id not in evaluated_ids]
+    }
+
+
+def evaluate_rules_batch(request: RuleBatchRequest) -> dict:
+    try:
+        return evaluate_documents(request.document_ids, request.log_results, request.fail_fast)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def get_rule_stats() -> dict:
+    """How often each rule of the current rule set ran, failed and was skipped in this process, and its cost."""
+    rule_set = rule_set_cache.get()
+    positions = {index: position for position, index in enumerate(rule_set.fail_fast_order())}
+    rules = []
+    for index, rule in enumerate(rule_set.rules):
+        counters = rule_stats.counters(rule)
+        name, field, operator, value, _ = rule.definition
+        rules.append({
+            "name": name,
+            "field": field,
+            "operator": operator,
+            "value": value,
+            "evaluations": counters.evaluations,
+            "failures": counters.failures,
+            "skips": counters.skips,
+            "failure_rate": round(counters.failure_rate, 4),
+            "mean_microseconds": round(counters.mean_seconds * 1e6, 3),
+            "total_seconds": round(counters.seconds, 6),
+            "fail_fast_position": positions[index]
+        })
+    return {"rule_set_version": rule_set.version, "rules": rules}
+
+
+def evaluate_condition(actual, operator, expected):
+    """Evaluate one condition ad hoc; rule evaluation uses the compiled checks of rule_set instead."""
+    return compile_condition(operator, expected)(actual)
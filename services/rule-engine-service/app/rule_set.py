@@ -0,0 +1,385 @@
+import os
+import time
+import select
+import threading
+import numpy as np
+import pandas as pd
+from db import db_connection, get_connection
+from logger import logger
+from metrics import observe_stage, count_outcome
+from field_expressions import FieldColumn, clean_value, compile_field, to_text
+from rule_stats import FAILED, PASSED, SKIPPED, RULE_ORDER_REFRESH_SECONDS, rule_stats
+
+# Channel the rules_config trigger notifies on (migration 008), and the listener's reconnect delay
+RULES_CHANGED_CHANNEL = "rules_changed"
+LISTENER_RETRY_SECONDS = float(os.getenv("RULE_SET_LISTENER_RETRY_SECONDS", 5.0))
+
+NUMERIC_OPERATORS = {
+    ">": lambda actual, threshold: actual > threshold,
+    ">=": lambda actual, threshold: actual >= threshold,
+    "<": lambda actual, threshold: actual < threshold,
+    "<=": lambda actual, threshold: actual <= threshold,
+}
+OPERATORS = (*NUMERIC_OPERATORS, "=", "==", "!=", "in", "not in")
+
+
+def _never(actual) -> bool:
+    return False
+
+
+def compile_condition(operator: str, expected):
+    """
+    A one-argument check for `actual <operator> expected`, with expected parsed once. Like the
+    interpreter it replaces, a value that cannot be compared makes the check fail rather than raise.
+    """
+    if operator in NUMERIC_OPERATORS:
+        compare = NUMERIC_OPERATORS[operator]
+        try:
+            threshold = float(clean_value(expected))
+        except (TypeError, ValueError):
+            logger.warning(f"Rule threshold {expected!r} for {operator} is not a number; the rule always fails")
+            return _never
+
+        def check(actual):
+            try:
+                return compare(float(clean_value(actual)), threshold)
+            except (TypeError, ValueError):
+                logger.warning(f"Error evaluating rule {operator} on {actual} vs {expected}: not a number")
+                return False
+        return check
+
+    if operator in ("=", "==", "!="):
+        target = to_text(expected)
+        if operator != "!=":
+            return lambda actual: to_text(actual) == target
+        return lambda actual: to_text(actual) != target
+
+    if operator in ("in", "not in"):
+        # Split the list before cleaning: cleaning strips commas
+        members = frozenset(to_text(item) for item in str(expected).split(","))
+        if operator == "in":
+            return lambda actual: to_text(actual) in members
+        return lambda actual: to_text(actual) not in members
+
+    logger.warning(f"Unknown rule operator {operator!r}; the rule always fails")
+    return _never
+
+
+def _never_vector(column) -> np.ndarray:
+    return np.zeros(len(column.values), dtype=bool)
+
+
+def compile_vector_condition(operator: str, expected):
+    """
+    compile_condition over a whole column: a check taking a FieldColumn and returning one bool per
+    document, equal to what compile_condition's check returns for each value.
+    """
+    if operator in NUMERIC_OPERATORS:
+        compare = NUMERIC_OPERATORS[operator]
+        try:
+            threshold = float(clean_value(expected))
+        except (TypeError, ValueError):
+            return _never_vector
+        return lambda column: compare(column.numbers, threshold)
+
+    if operator in ("=", "==", "!="):
+        target = to_text(expected)
+        if operator != "!=":
+            return lambda column: (column.text == target).to_numpy()
+        return lambda column: (column.text != target).to_numpy()
+
+    if operator in ("in", "not in"):
+        members = list(frozenset(to_text(item) for item in str(expected).split(",")))
+        if operator == "in":
+            return lambda column: column.text.isin(members).to_numpy()
+        return lambda column: ~column.text.isin(members).to_numpy()
+
+    return _never_vector
+
+
+class CompiledRule:
+    __slots__ = ("definition", "name", "field", "reader", "check", "vector_check", "reasons")
+
+    def __init__(self, name: str, field: str, operator: str, value: str, message: str):
+        self.definition = (name, field, operator, value, message)
+        self.name = name
+        self.field = field
+        self.reader = compile_field(field)
+        self.check = compile_condition(operator, value)
+        self.vector_check = compile_vector_condition(operator, value)
+        self.reasons = {
+            PASSED: "Passed",
+            FAILED: f"Failed: {message or f'{field} {operator} {value}'}",
+            SKIPPED: f"Skipped: {field} not found in document",
+        }
+
+    def outcome(self, parsed_data: dict) -> str:
+        actual = self.reader.read(parsed_data)
+        if actual is None:
+            return SKIPPED
+        return PASSED if self.check(actual) else FAILED
+
+
+class RuleSet:
+    """One version of rules_config, compiled: evaluating it does no parsing and no database work."""
+
+    def __init__(self, version: str, rules: list):
+        self.version = version
+        self.rules = rules
+        self._order = (float("-inf"), list(range(len(rules))))
+
+    def fail_fast_order(self) -> list:
+        """Rule indexes in the order fail-fast evaluation checks them, re-ranked from rule_stats now and then."""
+        ranked_at, order = self._order
+        now = time.monotonic()
+        if now - ranked_at >= RULE_ORDER_REFRESH_SECONDS:
+            order = rule_stats.fail_fast_order(self.rules)
+            self._order = (now, order)
+        return order
+
+    def evaluate(self, parsed_data: dict, fail_fast: bool = False) -> tuple:
+        """
+        (passed, reasons) with reasons[rule name] = "Passed" / "Failed: ..." / "Skipped: ...", in table
+        order. fail_fast checks the rules likeliest to fail cheaply first and stops at the first failure,
+        so reasons then only has the rules it checked.
+        """
+        order = self.fail_fast_order() if fail_fast else range(len(self.rules))
+        outcomes = [None] * len(self.rules)
+        checks = []
+        passed = True
+        clock = time.perf_counter
+        start = clock()
+        for index in order:
+            rule = self.rules[index]
+            outcome = outcomes[index] = rule.outcome(parsed_data)
+            end = clock()
+            checks.append((rule, outcome, end - start))
+            start = end
+            if outcome == FAILED:
+                passed = False
+                if fail_fast:
+                    break
+        rule_stats.record_outcomes(checks)
+        # A repeated rule name keeps its first position and its last outcome
+        reasons = {}
+        for rule, outcome in zip(self.rules, outcomes):
+            if outcome is not None:
+                reasons[rule.name] = rule.reasons[outcome]
+        return passed, reasons
+
+    @classmethod
+    def from_definitions(cls, version: str, definitions: list) -> "RuleSet":
+        """Compile (name, field, operator, value, message) rows, in evaluation order."""
+        return cls(version, [CompiledRule(*definition) for definition in definitions])
+
+    @property
+    def definitions(self) -> list:
+        return [rule.definition for rule in self.rules]
+
+    def _frame(self, documents: list) -> pd.DataFrame:
+        names = list(dict.fromkeys(name for rule in self.rules for name in rule.reader.names))
+        # dtype=object keeps the values as they are (5 stays 5, not 5.0), so text checks see what evaluate() sees
+        return pd.DataFrame({name: [document.get(name) for document in documents] for name in names},
+                            index=range(len(documents)), dtype=object)
+
+    @staticmethod
+    def _check_column(rule, frame: pd.DataFrame, document_fields: dict) -> tuple:
+        """(failed, skipped) bool arrays of one rule over frame's rows; document_fields caches the columns read."""
+        def document_field(name):
+            if name not in document_fields:
+                document_fields[name] = FieldColumn(frame[name])
+            return document_fields[name]
+        column = rule.reader.column(document_field)
+        return ~rule.vector_check(column) & ~column.missing, column.missing
+
+    def evaluate_columns(self, documents: list, record_stats: bool = False) -> tuple:
+        """
+        Per-rule outcomes over many parsed_data dicts, one column operation per rule: (failed, skipped),
+        two lists with one bool array per rule, in rule order. record_stats counts them in rule_stats.
+        """
+        frame = self._frame(documents)
+        document_fields = {}
+        failed, skipped = [], []
+        for rule in self.rules:
+            start = time.perf_counter()
+            rule_failed, rule_skipped = self._check_column(rule, frame, document_fields)
+            if record_stats:
+                rule_stats.record(rule, len(documents), int(rule_failed.sum()), int(rule_skipped.sum()),
+                                  time.perf_counter() - start)
+            failed.append(rule_failed)
+            skipped.append(rule_skipped)
+        return failed, skipped
+
+    def _evaluate_columns_fail_fast(self, documents: list) -> list:
+        """
+        One outcome array per rule in table order, checking each rule in fail-fast order only against
+        the documents that have not failed yet; None marks a document the rule was not checked for.
+        """
+        frame = self._frame(documents)
+        remaining = np.arange(len(documents))
+        document_fields = {}
+        outcomes = [np.full(len(documents), None, dtype=object) for _ in self.rules]
+        for index in self.fail_fast_order():
+            if not len(remaining):
+                break
+            rule = self.rules[index]
+            start = time.perf_counter()
+            rule_failed, rule_skipped = self._check_column(rule, frame, document_fields)
+            rule_stats.record(rule, len(remaining), int(rule_failed.sum()), int(rule_skipped.sum()),
+                              time.perf_counter() - start)
+            outcome = np.full(len(remaining), PASSED, dtype=object)
+            outcome[rule_failed] = FAILED
+            outcome[rule_skipped] = SKIPPED
+            outcomes[index][remaining] = outcome
+            if rule_failed.any():
+                # Later rules only read the documents still passing
+                remaining = remaining[~rule_failed]
+                frame = frame.iloc[~rule_failed]
+                document_fields = {}
+        return outcomes
+
+    def evaluate_batch(self, documents: list, fail_fast: bool = False) -> tuple:
+        """
+        evaluate() over many parsed_data dicts at once (see evaluate_columns). Returns (passed, reasons):
+        a bool array and a list of reasons dicts, in the order of documents and equal to what evaluate()
+        returns for each with the same fail_fast.
+        """
+        if fail_fast:
+            outcomes = self._evaluate_columns_fail_fast(documents)
+        else:
+            failed, skipped = self.evaluate_columns(documents, record_stats=True)
+            outcomes = []
+            for rule_failed, rule_skipped in zip(failed, skipped):
+                outcome = np.full(len(documents), PASSED, dtype=object)
+                outcome[rule_failed] = FAILED
+                outcome[rule_skipped] = SKIPPED
+                outcomes.append(outcome)
+
+        failed_any = np.zeros(len(documents), dtype=bool)
+        texts = []
+        for rule, outcome in zip(self.rules, outcomes):
+            failed_any |= outcome == FAILED
+            text = np.full(len(documents), None, dtype=object)
+            for code, reason in rule.reasons.items():
+                text[outcome == code] = reason
+            texts.append(text)
+
+        names = [rule.name for rule in self.rules]
+        if not texts:
+            reasons = [{} for _ in documents]
+        elif fail_fast:
+            reasons = [{name: reason for name, reason in zip(names, row) if reason is not None} for row in zip(*texts)]
+        else:
+            # dict() keeps the first position and last value of a repeated rule name, like evaluate()
+            reasons = [dict(zip(names, row)) for row in zip(*texts)]
+        return ~failed_any, reasons
+
+
+def load_rule_set(cur) -> RuleSet:
+    # One statement, so the version matches the rules read with it
+    cur.execute("""
+        SELECT v.version, r.name, r.field, r.operator, r.value, r.message
+        FROM rule_set_version v LEFT JOIN rules_config r ON TRUE
+        ORDER BY r.id
+    """)
+    rows = cur.fetchall()
+    if not rows:
+        raise Exception("rule_set_version is empty; run database/migrate.py")
+    return RuleSet.from_definitions(rows[0][0], [row[1:] for row in rows if row[1] is not None])
+
+
+def current_rule_set_version(cur) -> str:
+    cur.execute("SELECT version FROM rule_set_version")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+class RuleSetCache:
+    """
+    The compiled current rule set, recompiled when Postgres announces a rules_config change. While the
+    LISTEN connection is down, the version is checked on every request instead.
+    """
+
+    def __init__(self):
+        self._rule_set = None
+        self._generation = 0  # bumped by every notification, so a reload that raced one is not trusted
+        self._loaded_generation = -1
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listening = False
+        self._listener = None
+
+    def _ensure_listener(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="rule-set-listener", daemon=True)
+                    self._listener.start()
+
+    def get(self) -> RuleSet:
+        self._ensure_listener()
+        with self._lock:
+            rule_set, fresh = self._rule_set, self._listening and self._loaded_generation == self._generation
+        if rule_set is not None and fresh:
+            count_outcome("rule_set_cache", "hit")
+            return rule_set
+        if rule_set is not None and not self._listening:
+            with db_connection() as conn, conn.cursor() as cur:
+                if current_rule_set_version(cur) == rule_set.version:
+                    count_outcome("rule_set_cache", "hit")
+                    return rule_set
+        return self._reload()
+
+    def _reload(self) -> RuleSet:
+        # One compile at a time; callers that queued behind it reuse its result if nothing changed since
+        with self._reload_lock:
+            with self._lock:
+                generation = self._generation
+                if self._rule_set is not None and self._listening and self._loaded_generation == generation:
+                    return self._rule_set
+            count_outcome("rule_set_cache", "reload")
+            with observe_stage("rule_set_compile"), db_connection() as conn, conn.cursor() as cur:
+                rule_set = load_rule_set(cur)
+            with self._lock:
+                self._rule_set = rule_set
+                self._loaded_generation = generation
+            logger.info(f"Compiled rule set {rule_set.version} ({len(rule_set.rules)} rules)")
+            return rule_set
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+    def _set_listening(self, listening: bool):
+        with self._lock:
+            self._generation += 1
+            self._listening = listening
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = get_connection()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {RULES_CHANGED_CHANNEL}")
+                # A change may have been missed before this point
+                self._set_listening(True)
+                logger.info("Rule set cache listening on %s", RULES_CHANGED_CHANNEL)
+                while True:
+                    if select.select([conn], [], [], 60.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        logger.info("Rule set changed to %s", conn.notifies.pop(0).payload)
+                        self.invalidate()
+            except Exception as e:
+                logger.warning("Rule set listener lost its connection (%s); checking the version per request until it reconnects", e)
+                self._set_listening(False)
+                time.sleep(LISTENER_RETRY_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+rule_set_cache = RuleSetCache()
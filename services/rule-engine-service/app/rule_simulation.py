@@ -0,0 +1,188 @@
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from fastapi import HTTPException
+from db import read_db_connection
+from logger import logger
+from metrics import observe_stage
+from rule_set import OPERATORS, RuleSet, rule_set_cache
+from models import RuleSimulationRequest
+
+# Documents read per server-side cursor fetch and handed to a worker at a time, worker processes
+# (0 evaluates in the calling process), and flipped document ids kept per direction
+SIMULATION_CHUNK_SIZE = int(os.getenv("SIMULATION_CHUNK_SIZE", 5000))
+SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", min(4, os.cpu_count() or 1)))
+SIMULATION_SAMPLE_SIZE = int(os.getenv("SIMULATION_SAMPLE_SIZE", 10))
+# Chunks queued per worker; with the chunk size this bounds the documents held in memory at once
+SIMULATION_CHUNKS_PER_WORKER = 2
+
+PASS_TO_FAIL = "pass_to_fail"
+FAIL_TO_PASS = "fail_to_pass"
+
+
+def rule_set_fingerprint(definitions: list) -> str:
+    """The version rules_config would have with these rules (rule_set_fingerprint() in migration 008)."""
+    lines = ("|".join(str(part) for part in definition if part is not None) for definition in definitions)
+    return hashlib.md5("\n".join(lines).encode()).hexdigest()
+
+
+def validate_definitions(definitions: list):
+    if not definitions:
+        raise ValueError("The candidate rule set has no rules")
+    for name, field, operator, value, _ in definitions:
+        if not name or not field or value is None:
+            raise ValueError(f"Rule {name!r} needs a name, a field and a value")
+        if operator not in OPERATORS:
+            raise ValueError(f"Rule {name!r} has unknown operator {operator!r}")
+
+
+# Compiled once per worker process by _init_worker
+_worker_rule_sets = None
+
+
+def _compile(current: tuple, candidate: tuple) -> tuple:
+    return RuleSet.from_definitions(*current), RuleSet.from_definitions(*candidate)
+
+
+def _init_worker(current: tuple, candidate: tuple):
+    global _worker_rule_sets
+    _worker_rule_sets = _compile(current, candidate)
+
+
+def _simulate_chunk(document_ids: list, documents: list, sample_size: int, rule_sets: tuple = None) -> dict:
+    """Counts for one chunk, under both rule sets. Only counts and a few ids go back to the caller."""
+    stats = {"documents": len(documents), "passed": {}, "failed": {}, "skipped": {}}
+    passed = {}
+    for label, rule_set in zip(("current", "candidate"), rule_sets or _worker_rule_sets):
+        failed, skipped = rule_set.evaluate_columns(documents)
+        failed_any = np.logical_or.reduce(failed) if failed else np.zeros(len(documents), dtype=bool)
+        passed[label] = ~failed_any
+        stats["passed"][label] = int(passed[label].sum())
+        stats["failed"][label] = [int(rule_failed.sum()) for rule_failed in failed]
+        stats["skipped"][label] = [int(rule_skipped.sum()) for rule_skipped in skipped]
+
+    ids = np.array(document_ids, dtype=object)
+    flips = {
+        PASS_TO_FAIL: passed["current"] & ~passed["candidate"],
+        FAIL_TO_PASS: ~passed["current"] & passed["candidate"],
+    }
+    stats["flips"] = {direction: int(mask.sum()) for direction, mask in flips.items()}
+    stats["samples"] = {direction: ids[mask][:sample_size].tolist() for direction, mask in flips.items()}
+    return stats
+
+
+def _merge(total: dict, stats: dict, sample_size: int):
+    total["documents"] += stats["documents"]
+    for label in ("current", "candidate"):
+        total["passed"][label] += stats["passed"][label]
+        total["failed"][label] += np.array(stats["failed"][label], dtype=np.int64)
+        total["skipped"][label] += np.array(stats["skipped"][label], dtype=np.int64)
+    for direction in (PASS_TO_FAIL, FAIL_TO_PASS):
+        total["flips"][direction] += stats["flips"][direction]
+        room = sample_size - len(total["samples"][direction])
+        total["samples"][direction] += stats["samples"][direction][:max(0, room)]
+
+
+def _chunks(limit: int, chunk_size: int):
+    """(document ids, features) chunks of historical documents, streamed through a server-side cursor."""
+    sql = "SELECT document_id::text, features FROM document_inputs WHERE features IS NOT NULL"
+    params = []
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with read_db_connection() as conn, conn.cursor(name="rule_simulation") as cur:
+        cur.itersize = chunk_size
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            rows = [row for row in rows if isinstance(row[1], dict)]
+            yield [row[0] for row in rows], [row[1] for row in rows]
+
+
+def _rule_report(definitions: list, failed: np.ndarray, skipped: np.ndarray, documents: int) -> list:
+    return [
+        {
+            "name": name,
+            "field": field,
+            "operator": operator,
+            "value": value,
+            "failed": int(rule_failed),
+            "skipped": int(rule_skipped),
+            "failure_rate": round(float(rule_failed) / documents, 4) if documents else 0.0
+        }
+        for (name, field, operator, value, _), rule_failed, rule_skipped in zip(definitions, failed, skipped)
+    ]
+
+
+def simulate_rule_set(candidate_definitions: list, limit: int = None, workers: int = SIMULATION_WORKERS,
+                      chunk_size: int = SIMULATION_CHUNK_SIZE, sample_size: int = SIMULATION_SAMPLE_SIZE) -> dict:
+    """
+    Evaluate the current rule set and a candidate side by side over stored documents (limit caps how
+    many) and report how many outcomes would flip, with sample document ids, and each rule's failure
+    rate under both. Nothing is written. Chunks are evaluated in a pool of worker processes, at most
+    SIMULATION_CHUNKS_PER_WORKER per worker in flight, so memory stays bounded however many documents
+    there are.
+    """
+    candidate_definitions = [tuple(definition) for definition in candidate_definitions]
+    validate_definitions(candidate_definitions)
+    if chunk_size < 1 or workers < 0 or sample_size < 0 or (limit is not None and limit < 1):
+        raise ValueError("chunk_size and limit must be positive, workers and sample_size not negative")
+
+    current_set = rule_set_cache.get()
+    current = (current_set.version, current_set.definitions)
+    candidate = (rule_set_fingerprint(candidate_definitions), candidate_definitions)
+    total = {
+        "documents": 0,
+        "passed": {"current": 0, "candidate": 0},
+        "failed": {"current": np.zeros(len(current[1]), dtype=np.int64), "candidate": np.zeros(len(candidate[1]), dtype=np.int64)},
+        "skipped": {"current": np.zeros(len(current[1]), dtype=np.int64), "candidate": np.zeros(len(candidate[1]), dtype=np.int64)},
+        "flips": {PASS_TO_FAIL: 0, FAIL_TO_PASS: 0},
+        "samples": {PASS_TO_FAIL: [], FAIL_TO_PASS: []},
+    }
+
+    logger.info(f"Simulating rule set {candidate[0]} against {current[0]} with {workers} worker(s)")
+    with observe_stage("rule_simulation"):
+        if workers == 0:
+            rule_sets = _compile(current, candidate)
+            for document_ids, documents in _chunks(limit, chunk_size):
+                _merge(total, _simulate_chunk(document_ids, documents, sample_size, rule_sets), sample_size)
+        else:
+            # spawn, not fork: the service has threads (rule set listener, log writer) running
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker, initargs=(current, candidate))
+            with pool:
+                in_flight = set()
+                for document_ids, documents in _chunks(limit, chunk_size):
+                    if len(in_flight) >= workers * SIMULATION_CHUNKS_PER_WORKER:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            _merge(total, future.result(), sample_size)
+                    in_flight.add(pool.submit(_simulate_chunk, document_ids, documents, sample_size))
+                for future in in_flight:
+                    _merge(total, future.result(), sample_size)
+
+    documents = total["documents"]
+    report = {"documents": documents}
+    for label, (version, definitions) in (("current", current), ("candidate", candidate)):
+        report[label] = {
+            "rule_set_version": version,
+            "passed": total["passed"][label],
+            "failed": documents - total["passed"][label],
+            "rules": _rule_report(definitions, total["failed"][label], total["skipped"][label], documents)
+        }
+    report["flips"] = total["flips"]
+    report["samples"] = total["samples"]
+    return report
+
+
+def simulate_rules(request: RuleSimulationRequest) -> dict:
+    definitions = [(rule.name, rule.field, rule.operator, rule.value, rule.message) for rule in request.rules]
+    sample_size = SIMULATION_SAMPLE_SIZE if request.sample_size is None else request.sample_size
+    try:
+        return simulate_rule_set(definitions, limit=request.limit, sample_size=sample_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,113 @@
+import os
+import threading
+from prometheus_client.core import REGISTRY, CounterMetricFamily
+
+# How often a rule set re-ranks its rules for fail-fast evaluation from the counters below
+RULE_ORDER_REFRESH_SECONDS = float(os.getenv("RULE_ORDER_REFRESH_SECONDS", 10.0))
+
+PASSED = "passed"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class RuleCounters:
+    """Evaluations, outcomes and time spent of one rule, in this process, since it started."""
+    __slots__ = ("name", "evaluations", "failures", "skips", "seconds")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.evaluations = 0
+        self.failures = 0
+        self.skips = 0
+        self.seconds = 0.0
+
+    @property
+    def failure_rate(self) -> float:
+        # Smoothed, so a rule seen a few times is neither certain to fail nor certain to pass
+        return (self.failures + 1) / (self.evaluations + 2)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.evaluations if self.evaluations else 0.0
+
+    @property
+    def rank(self) -> float:
+        """
+        Expected cost per failure found. Checking rules in increasing rank reaches the first failure
+        soonest on average; a rule never seen yet ranks 0, so it is checked first until it has counts.
+        """
+        return self.mean_seconds / self.failure_rate
+
+
+class RuleStats:
+    """
+    Per-rule counters behind fail-fast ordering and GET /rule-stats. Keyed by rule definition, so a
+    rule keeps its counts across rule set versions until it is edited. Prometheus reads them when it
+    scrapes (collect), so checking a rule costs a few additions rather than a metric update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def _get(self, rule) -> RuleCounters:
+        counters = self._counters.get(rule.definition)
+        if counters is None:
+            counters = self._counters.setdefault(rule.definition, RuleCounters(rule.name))
+        return counters
+
+    def counters(self, rule) -> RuleCounters:
+        with self._lock:
+            return self._get(rule)
+
+    def record(self, rule, evaluations: int, failures: int, skips: int, seconds: float):
+        if not evaluations:
+            return
+        with self._lock:
+            counters = self._get(rule)
+            counters.evaluations += evaluations
+            counters.failures += failures
+            counters.skips += skips
+            counters.seconds += seconds
+
+    def record_outcomes(self, checks: list):
+        """Count (rule, outcome, seconds) checks of one evaluation."""
+        with self._lock:
+            for rule, outcome, seconds in checks:
+                counters = self._get(rule)
+                counters.evaluations += 1
+                counters.seconds += seconds
+                if outcome == FAILED:
+                    counters.failures += 1
+                elif outcome == SKIPPED:
+                    counters.skips += 1
+
+    def fail_fast_order(self, rules: list) -> list:
+        """Indexes of rules, cheapest expected failure first; ties keep table order."""
+        with self._lock:
+            ranks = [self._get(rule).rank for rule in rules]
+        return sorted(range(len(rules)), key=ranks.__getitem__)
+
+    def collect(self):
+        evaluations = CounterMetricFamily("rule_evaluations", "Rule checks by rule and outcome", labels=["rule", "outcome"])
+        seconds = CounterMetricFamily("rule_check_seconds", "Time spent reading fields and checking each rule", labels=["rule"])
+        totals = {}
+        with self._lock:
+            # Rules edited since keep their old counters under the same name; sum them so counters never go down
+            for counters in self._counters.values():
+                total = totals.setdefault(counters.name, [0, 0, 0, 0.0])
+                total[0] += counters.evaluations - counters.failures - counters.skips
+                total[1] += counters.failures
+                total[2] += counters.skips
+                total[3] += counters.seconds
+        for name, (passed, failed, skipped, spent) in totals.items():
+            evaluations.add_metric([name, PASSED], passed)
+            evaluations.add_metric([name, FAILED], failed)
+            evaluations.add_metric([name, SKIPPED], skipped)
+            seconds.add_metric([name], spent)
+        yield evaluations
+        yield seconds
+
+
+rule_stats = RuleStats()
+REGISTRY.register(rule_stats)
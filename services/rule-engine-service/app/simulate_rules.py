@@ -0,0 +1,45 @@
+"""
+Replay stored documents through the current rule set and a candidate one, side by side, and report how
+many outcomes would flip and how often each rule fails. Nothing is written. The candidate is a CSV in
+the dataset/rules_config.csv layout (name,field,operator,value,message) or a JSON list of such objects:
+
+    docker-compose exec rule-engine-service python simulate_rules.py --rules-file candidate_rules.csv
+    docker-compose exec rule-engine-service python simulate_rules.py --rules-file - --limit 100000 < rules.json
+"""
+import sys
+import csv
+import json
+import argparse
+from rule_simulation import simulate_rule_set, SIMULATION_CHUNK_SIZE, SIMULATION_SAMPLE_SIZE, SIMULATION_WORKERS
+
+RULE_COLUMNS = ("name", "field", "operator", "value", "message")
+
+
+def read_rules(path: str) -> list:
+    with (sys.stdin if path == "-" else open(path, newline="")) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        rules = json.loads(text)
+    else:
+        rules = list(csv.DictReader(text.splitlines()))
+    return [tuple(rule.get(column) or None for column in RULE_COLUMNS) for rule in rules]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a candidate rule set with the current one over stored documents")
+    parser.add_argument("--rules-file", required=True, metavar="PATH", help="CSV or JSON candidate rules; - reads stdin")
+    parser.add_argument("--limit", type=int, help="Most documents to replay (default: all)")
+    parser.add_argument("--workers", type=int, default=SIMULATION_WORKERS, help="Worker processes; 0 runs in this process")
+    parser.add_argument("--chunk-size", type=int, default=SIMULATION_CHUNK_SIZE)
+    parser.add_argument("--samples", type=int, default=SIMULATION_SAMPLE_SIZE, help="Flipped document ids to list per direction")
+    args = parser.parse_args()
+
+    try:
+        report = simulate_rule_set(read_rules(args.rules_file), args.limit, args.workers, args.chunk_size, args.samples)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
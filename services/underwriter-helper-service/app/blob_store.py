@@ -0,0 +1,137 @@
+import os
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+from logger import logger
+
+# Which BLOB_STORES backend holds uploaded documents, and where the filesystem backend keeps them
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "filesystem")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "/data/blobs")
+# Uploads are hashed and written this many bytes at a time, so memory use does not grow with file size
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE", 1024 * 1024))
+# First key of the per-blob advisory locks (lock_blob); the second is hashtext(sha256)
+BLOB_LOCK_NAMESPACE = 15_004
+
+
+class StagedBlob:
+    """
+    An upload written to a local file and hashed, not yet in the store. path can be parsed in the
+    meantime; commit() stores it under sha256, and leaving the with block without committing discards it.
+    """
+
+    def __init__(self, store, path: str, sha256: str, size: int):
+        self.store = store
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+
+    def commit(self):
+        self.store._commit(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed storage for uploaded documents: a blob's key is the SHA-256 of its bytes,
+    so storing the same file twice keeps one copy.
+    """
+
+    @abstractmethod
+    def stage(self, stream, suffix: str = "") -> StagedBlob:
+        """Write everything read from a binary file object to a local file (named with suffix) while hashing it."""
+
+    @abstractmethod
+    def _commit(self, staged: StagedBlob):
+        """Store a staged blob under its sha256, keeping an existing copy."""
+
+    @abstractmethod
+    def delete(self, sha256: str) -> bool:
+        """Remove a blob; False if it was not stored."""
+
+    def put_stream(self, stream) -> tuple:
+        """Store everything read from a binary file object. Returns (sha256 hex digest, size in bytes)."""
+        with self.stage(stream) as staged:
+            staged.commit()
+            return staged.sha256, staged.size
+
+
+class FilesystemBlobStore(BlobStore):
+    """Blobs as files under root/ab/cd/<sha256>, two directory levels to keep directories small."""
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    def _path(self, sha256: str) -> str:
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            raise ValueError(f"Not a SHA-256 hex digest: {sha256!r}")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def stage(self, stream, suffix: str = "") -> StagedBlob:
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Staged in the store's own filesystem, so committing is a rename
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-", suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(BLOB_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return StagedBlob(self, tmp_path, digest.hexdigest(), size)
+
+    def _commit(self, staged: StagedBlob):
+        path = self._path(staged.sha256)
+        if os.path.exists(path):
+            logger.info("Blob %s already stored; keeping the existing copy", staged.sha256)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staged.path, path)
+        staged.path = None
+
+    def delete(self, sha256: str) -> bool:
+        try:
+            os.remove(self._path(sha256))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+def lock_blob(cur, sha256: str, shared: bool = False):
+    """
+    Transaction-level advisory lock on one blob. An upload holds it shared from storing the blob until
+    its documents row commits; the purge holds it exclusively while it checks that no documents row
+    refers to the blob and deletes it, so it never deletes a blob an upload is about to refer to.
+    """
+    lock = "pg_advisory_xact_lock_shared" if shared else "pg_advisory_xact_lock"
+    cur.execute(f"SELECT {lock}(%s, hashtext(%s))", (BLOB_LOCK_NAMESPACE, sha256))
+
+
+# Backends by BLOB_STORE_BACKEND name; register others (e.g. object storage) here
+BLOB_STORES = {
+    "filesystem": FilesystemBlobStore,
+}
+
+_blob_store = None
+
+
+def get_blob_store() -> BlobStore:
+    """The configured blob store, created on first use."""
+    global _blob_store
+    if _blob_store is None:
+        if BLOB_STORE_BACKEND not in BLOB_STORES:
+            raise ValueError(f"Unknown BLOB_STORE_BACKEND {BLOB_STORE_BACKEND!r}; expected one of {sorted(BLOB_STORES)}")
+        _blob_store = BLOB_STORES[BLOB_STORE_BACKEND]()
+    return _blob_store
@@ -0,0 +1,127 @@
+import os
+import time
+import select
+import threading
+from collections import OrderedDict
+from db import get_connection
+from logger import logger
+from metrics import count_outcome
+
+# Explanations kept per borrower (keyed by the decision_log id they explain), and for how long at most
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv("EXPLANATION_CACHE_MAX_ENTRIES", 10000))
+EXPLANATION_CACHE_TTL_SECONDS = float(os.getenv("EXPLANATION_CACHE_TTL_SECONDS", 300.0))
+# Channel the current_decision trigger notifies on (migration 005), and the listener's reconnect delay
+DECISION_CHANGED_CHANNEL = "decision_changed"
+LISTENER_RETRY_SECONDS = float(os.getenv("EXPLANATION_CACHE_LISTENER_RETRY_SECONDS", 5.0))
+
+
+class ExplanationCache:
+    """
+    borrower_id -> (decision_id, explanation), evicted when Postgres announces a new current decision
+    for that borrower. Entries are only served while the LISTEN connection is up, because a
+    notification missed during an outage would otherwise leave a stale explanation behind.
+    """
+
+    def __init__(self, max_entries: int = EXPLANATION_CACHE_MAX_ENTRIES, ttl: float = EXPLANATION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # borrower_id -> (decision_id, explanation, expires_at)
+        # borrower_id -> (sequence, monotonic time) of its last invalidation, to drop fills that raced one.
+        # Bounded like _entries; the newest invalidation dropped from it stands in for every borrower not in it
+        self._invalidations = OrderedDict()
+        self._sequence = 0
+        self._forgotten = (0, float("-inf"))
+        self._epoch = 0  # bumped on every (re)connect of the listener
+        self._reset_at = float("-inf")
+        self._lock = threading.Lock()
+        self._listening = False
+        self._listener = None
+
+    def _ensure_listener(self):
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="explanation-cache-listener", daemon=True)
+                    self._listener.start()
+
+    def _last_invalidation(self, borrower_id: str):
+        return self._invalidations.get(borrower_id, self._forgotten)
+
+    def token(self, borrower_id: str):
+        """Taken before reading the database; put() ignores the result if an invalidation happened since."""
+        self._ensure_listener()
+        with self._lock:
+            return self._epoch, self._last_invalidation(borrower_id)[0]
+
+    def get(self, borrower_id: str):
+        with self._lock:
+            entry = self._entries.get(borrower_id) if self._listening else None
+            if entry is None or entry[2] < time.monotonic():
+                count_outcome("explanation_cache", "miss")
+                return None
+            self._entries.move_to_end(borrower_id)
+        count_outcome("explanation_cache", "hit")
+        return entry[1]
+
+    def put(self, borrower_id: str, decision_id: str, explanation, token, staleness: float = 0.0):
+        """
+        staleness bounds how far behind the primary the read was (a replica read). A notification can
+        arrive before the replica has the change, so such fills are dropped for borrowers invalidated
+        within that window.
+        """
+        with self._lock:
+            sequence, invalidated_at = self._last_invalidation(borrower_id)
+            if not self._listening or token != (self._epoch, sequence):
+                return
+            last_invalidated = max(invalidated_at, self._reset_at)
+            if staleness and time.monotonic() - last_invalidated < staleness:
+                return
+            self._entries[borrower_id] = (decision_id, explanation, time.monotonic() + self.ttl)
+            self._entries.move_to_end(borrower_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, borrower_id: str):
+        with self._lock:
+            self._entries.pop(borrower_id, None)
+            self._sequence += 1
+            self._invalidations[borrower_id] = (self._sequence, time.monotonic())
+            self._invalidations.move_to_end(borrower_id)
+            while len(self._invalidations) > self.max_entries:
+                _, self._forgotten = self._invalidations.popitem(last=False)
+
+    def _reset(self, listening: bool):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations.clear()
+            self._epoch += 1
+            self._reset_at = time.monotonic()
+            self._listening = listening
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = get_connection()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {DECISION_CHANGED_CHANNEL}")
+                # Anything cached before this point may have missed a notification
+                self._reset(listening=True)
+                logger.info("Explanation cache listening on %s", DECISION_CHANGED_CHANNEL)
+                while True:
+                    if select.select([conn], [], [], 60.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.invalidate(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Explanation cache listener lost its connection (%s); cache bypassed until it reconnects", e)
+                self._reset(listening=False)
+                time.sleep(LISTENER_RETRY_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+explanation_cache = ExplanationCache()
@@ -1,107 +1,123 @@
-from db import get_connection
+from db import read_db_connection, max_staleness
 from logger import logger
+from explanation_cache import explanation_cache
 import json
+import os
 from fastapi import HTTPException
 from models import ExplanationResponse, ExplanationDetails, ExplanationWithCases, ManualDecisionUpdateRequest
 
+# The results behind an automatic decision are written just before it, so they are first looked up in
+# the partitions covering this many hours either side of the decision (allowing for clock skew) (the log tables are partitioned by month,
+# migration 007). Overrides reuse older results; those fall back to a lookup across all partitions.
+EXPLANATION_RESULT_LOOKBACK_HOURS = float(os.getenv("EXPLANATION_RESULT_LOOKBACK_HOURS", 24))
+
+EXPLANATION_SQL = """
+    SELECT cd.decision_id, cd.final_decision,
+           r.rule_status, r.rule_values,
+           m.predicted_decision, m.confidence_score, m.shap_summary,
+           f.id IS NOT NULL, f.bias_detected, f.audit_summary
+    FROM current_decision cd
+    LEFT JOIN rule_evaluation_log r ON r.id = cd.rule_result_id {rule_window}
+    LEFT JOIN ml_prediction_results m ON m.id = cd.ml_result_id {ml_window}
+    LEFT JOIN fairness_audit_log f ON f.id = cd.fairness_audit_log_id {fairness_window}
+    WHERE cd.borrower_id = %(user_id)s
+"""
+RESULT_WINDOW = (
+    "AND {column} BETWEEN cd.created_at - make_interval(secs => %(lookback)s)"
+    " AND cd.created_at + make_interval(secs => %(lookback)s)"
+)
+RECENT_EXPLANATION_SQL = EXPLANATION_SQL.format(
+    rule_window=RESULT_WINDOW.format(column="r.evaluated_at"),
+    ml_window=RESULT_WINDOW.format(column="m.evaluated_at"),
+    fairness_window=RESULT_WINDOW.format(column="f.audited_at"),
+)
+FULL_EXPLANATION_SQL = EXPLANATION_SQL.format(rule_window="", ml_window="", fairness_window="")
+
+
+def _fetch_explanation_row(cur, user_id: str):
+    """The borrower's current decision with its rule, ML and fairness results, in one round trip."""
+    params = {"user_id": user_id, "lookback": EXPLANATION_RESULT_LOOKBACK_HOURS * 3600}
+    cur.execute(RECENT_EXPLANATION_SQL, params)
+    row = cur.fetchone()
+    if row is not None and (row[2] is None or row[4] is None or not row[7]):
+        # Some result is older than the window (or missing): look across all partitions
+        cur.execute(FULL_EXPLANATION_SQL, params)
+        row = cur.fetchone()
+    return row
+
+
+def _build_explanation(row) -> ExplanationResponse:
+    (decision_id, final_decision, rule_status, rule_values, predicted_decision, confidence_score, shap_summary,
+     has_audit, bias_detected, audit_summary) = row
+    logger.info(f"Decision fetched: {decision_id} {final_decision}, rule status: {rule_status}, "
+                f"ML decision: {predicted_decision}, audit found: {has_audit}")
+    if rule_status is None:
+        raise Exception("Rule evaluation not found for the current decision.")
+    if predicted_decision is None:
+        raise Exception("ML prediction not found for the current decision.")
+    if not has_audit:
+        raise Exception("Fairness audit not found for the current decision.")
+    rule_values = rule_values if isinstance(rule_values, dict) else json.loads(rule_values)
+    shap_summary = shap_summary if isinstance(shap_summary, dict) else json.loads(shap_summary)
+
+    # Prepare explanations
+    status = final_decision.lower()
+
+    rule_factors_passed = [k for k, v in rule_values.items() if v.lower().startswith("passed")]
+    ml_factors_passed = [k for k, v in shap_summary.items() if v > 0]
+    rule_factors_failed = [k for k, v in rule_values.items() if not v.lower().startswith("passed")]
+    ml_factors_failed = [k for k, v in shap_summary.items() if v < 0]
+
+
+    rule_positive_explanation = f"{', '.join(rule_factors_passed)}"
+    ml_positive_explanation = f"ML model predicted confidence score of {confidence_score}. " \
+                         f"Best positive contributors were: {', '.join(ml_factors_passed)}"
+
+    rule_failed_explanation = f"{', '.join(rule_factors_failed)}"
+    ml_failed_explanation = f"Key failed contributors were: {', '.join(ml_factors_failed)}"
+
+
+    fairness_explanation = f"Fairness bias {bias_detected} and audit result: {audit_summary}"
+
+    rule_explanation = ExplanationWithCases(
+        passed_cases=rule_positive_explanation,
+        failed_cases=rule_failed_explanation,
+        result=rule_status
+    )
+
+    ml_explanation = ExplanationWithCases(
+        passed_cases=ml_positive_explanation,
+        failed_cases=ml_failed_explanation,
+        result=predicted_decision
+    )
+
+    return ExplanationResponse(
+        status=status,
+        explanation=ExplanationDetails(
+            rule_explanation=rule_explanation,
+            ml_explanation=ml_explanation,
+            fairness_explanation=fairness_explanation
+        )
+    )
+
+
 def explain_borrower_application(user_id: str):
     logger.info(f"Generating explanation for borrower {user_id}")
-    conn = get_connection()
-    cur = conn.cursor()
-
+    # Explanations are cached per current decision and evicted when a new decision lands for the borrower
+    cached = explanation_cache.get(user_id)
+    if cached is not None:
+        return cached
+    token = explanation_cache.token(user_id)
     try:
-        # Step 1: Get decision record
-        cur.execute("""
-            SELECT final_decision, ml_result_id, rule_result_id, fairness_audit_log_id 
-            FROM decision_log 
-            WHERE borrower_id = %s ORDER BY created_at DESC LIMIT 1 
-        """, (user_id,))
-        decision_row = cur.fetchone()
-        if not decision_row:
+        with read_db_connection() as conn, conn.cursor() as cur:
+            row = _fetch_explanation_row(cur, user_id)
+            staleness = max_staleness(conn)
+        if not row:
             raise Exception("Decision log not found for user.")
-
-        final_decision, ml_result_id, rule_result_id, audit_id = decision_row
-        logger.info(f"Decision fetched: {final_decision}, ML Result ID: {ml_result_id}, Rule Result ID: {rule_result_id}, Audit ID: {audit_id}")
-
-        # Step 2: Get rule evaluation result
-        cur.execute("""
-            SELECT rule_status, rule_values 
-            FROM rule_evaluation_log 
-            WHERE id = %s
-        """, (rule_result_id,))
-        rule_row = cur.fetchone()
-        rule_status = rule_row[0]
-        rule_values = rule_row[1] if isinstance(rule_row[1], dict) else json.loads(rule_row[1])
-        logger.info(f"rule_evaluation fetched:" f" Status: {rule_status}, Values: {rule_values}")
-
-        # Step 3: Get ML prediction result
-        cur.execute("""
-            SELECT predicted_decision, confidence_score, shap_summary 
-            FROM ml_prediction_results 
-            WHERE id = %s
-        """, (ml_result_id,))
-        ml_row = cur.fetchone()
-        predicted_decision = ml_row[0]
-        confidence_score = ml_row[1]
-        shap_summary = ml_row[2] if isinstance(ml_row[2], dict) else json.loads(ml_row[2])
-        logger.info(f"ML prediction fetched:" f" Predicted Decision: {predicted_decision}, Confidence Score: {confidence_score}, SHAP Summary: {shap_summary}")
-
-        # Step 4: Get Fairness audit
-        cur.execute("""
-            SELECT bias_detected, audit_summary 
-            FROM fairness_audit_log 
-            WHERE id = %s
-        """, (audit_id,))
-        audit_row = cur.fetchone()
-        bias_detected, audit_summary = audit_row
-
-        logger.info(f"Fairness audit fetched:" f" Bias Detected: {bias_detected}, Audit Summary: {audit_summary}")
-
-        # Prepare explanations
-        status = final_decision.lower()
-
-        rule_factors_passed = [k for k, v in rule_values.items() if v.lower().startswith("passed")]
-        ml_factors_passed = [k for k, v in shap_summary.items() if v > 0]
-        rule_factors_failed = [k for k, v in rule_values.items() if not v.lower().startswith("passed")]
-        ml_factors_failed = [k for k, v in shap_summary.items() if v < 0]
-
-
-        rule_positive_explanation = f"{', '.join(rule_factors_passed)}"
-        ml_positive_explanation = f"ML model predicted confidence score of {confidence_score}. " \
-                             f"Best positive contributors were: {', '.join(ml_factors_passed)}"
-        
-        rule_failed_explanation = f"{', '.join(rule_factors_failed)}"
-        ml_failed_explanation = f"Key failed contributors were: {', '.join(ml_factors_failed)}"
-
-
-        fairness_explanation = f"Fairness bias {bias_detected} and audit result: {audit_summary}"
-
-        rule_explanation = ExplanationWithCases(
-            passed_cases=rule_positive_explanation,
-            failed_cases=rule_failed_explanation,
-            result=rule_status
-        )
-
-        ml_explanation = ExplanationWithCases(
-            passed_cases=ml_positive_explanation,
-            failed_cases=ml_failed_explanation,
-            result=predicted_decision
-        )
-
-        explanation = ExplanationResponse(
-            status=status,
-            explanation=ExplanationDetails(
-                rule_explanation=rule_explanation,
-                ml_explanation=ml_explanation,
-                fairness_explanation=fairness_explanation
-            )
-        )
-        logger.info(f"Explanation generated for borrower {user_id}: {explanation}")
-        return explanation
-
+        explanation = _build_explanation(row)
     except Exception as e:
         logger.error(f"Error in explanation generation: {e}")
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+    explanation_cache.put(user_id, row[0], explanation, token, staleness)
+    logger.info(f"Explanation generated for borrower {user_id}: {explanation}")
+    return explanation
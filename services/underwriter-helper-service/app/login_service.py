@@ -1,12 +1,9 @@
 from fastapi import HTTPException
-from db import get_connection
+from db import db_connection
 import bcrypt
 
 def authenticate(email: str, password: str):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    try:
+    with db_connection() as conn, conn.cursor() as cur:
         cur.execute("SELECT id, full_name, password_hash, role FROM users WHERE email = %s", (email,))
         user = cur.fetchone()
 
@@ -23,8 +20,4 @@ def authenticate(email: str, password: str):
             "full_name": full_name,
             "email": email,
             "role": role
-        }
-
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        }
\ No newline at end of file
@@ -34,4 +34,10 @@ class UserRead(BaseModel):
     id: str
     full_name: str
     email: EmailStr
-    role: str
\ No newline at end of file
+    role: str
+class PurgeApplicationsRequest(BaseModel):
+    # Exactly one of borrower_ids / older_than_days selects the borrowers
+    borrower_ids: Optional[list[str]] = None
+    older_than_days: Optional[int] = None
+    batch_size: Optional[int] = None
+    dry_run: bool = False
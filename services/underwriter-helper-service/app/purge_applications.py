@@ -0,0 +1,42 @@
+"""
+Purge borrower applications (documents, evaluations, decisions and pipeline bookkeeping) in bulk,
+one transaction per batch of borrowers. The borrowers' user accounts are kept. For the nightly job:
+
+    docker-compose exec underwriter-helper-service python purge_applications.py --older-than-days 90
+    docker-compose exec underwriter-helper-service python purge_applications.py --ids-file ids.txt --dry-run
+"""
+import sys
+import json
+import argparse
+from db import get_connection
+from purge_service import purge_applications, PURGE_BATCH_SIZE
+
+
+def read_ids(path: str) -> list:
+    with (sys.stdin if path == "-" else open(path)) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete borrower applications across all dependent tables")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--borrower-ids", nargs="+", metavar="ID")
+    selection.add_argument("--ids-file", metavar="PATH", help="One borrower id per line; - reads stdin")
+    selection.add_argument("--older-than-days", type=int, help="Borrowers with no upload or decision for this many days")
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted, then roll back")
+    args = parser.parse_args()
+
+    borrower_ids = args.borrower_ids or (read_ids(args.ids_file) if args.ids_file else None)
+    conn = get_connection()
+    try:
+        result = purge_applications(conn, borrower_ids, args.older_than_days, args.batch_size, args.dry_run)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
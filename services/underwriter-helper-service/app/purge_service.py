@@ -0,0 +1,242 @@
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from db import get_connection
+from logger import logger
+from metrics import observe_stage
+from explanation_cache import explanation_cache
+from blob_store import get_blob_store, lock_blob
+
+# Borrowers purged per transaction; each batch commits on its own so a long purge can be stopped and re-run
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 500))
+PURGE_MAX_BATCH_SIZE = int(os.getenv("PURGE_MAX_BATCH_SIZE", 5000))
+# Finished purge jobs kept in memory for GET /applications/purge/{job_id}, oldest dropped first
+PURGE_JOB_HISTORY = int(os.getenv("PURGE_JOB_HISTORY", 100))
+
+# (table, DELETE statement) in foreign-key order: every table is emptied of a borrower's rows before
+# the tables it references. current_decision is kept in step by the decision_log triggers (migration 002);
+# its explicit delete only finds rows whose decision_log partition was archived (migration 007).
+# Each statement takes the batch as one uuid[] parameter.
+PURGE_STATEMENTS = (
+    ("decision_log", """
+        DELETE FROM decision_log t USING unnest(%s::uuid[]) AS b(id) WHERE t.borrower_id = b.id
+    """),
+    ("current_decision", """
+        DELETE FROM current_decision t USING unnest(%s::uuid[]) AS b(id) WHERE t.borrower_id = b.id
+    """),
+    ("decision_jobs", """
+        DELETE FROM decision_jobs t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+    """),
+    ("decision_cache", """
+        DELETE FROM decision_cache t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+    """),
+    ("decision_idempotency_keys", """
+        DELETE FROM decision_idempotency_keys t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+    """),
+    ("fairness_audit_log", """
+        DELETE FROM fairness_audit_log t USING ml_prediction_results m, unnest(%s::uuid[]) AS b(id)
+        WHERE t.ml_result_id = m.id AND m.user_id = b.id
+    """),
+    ("ml_prediction_results", """
+        DELETE FROM ml_prediction_results t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+    """),
+    ("rule_evaluation_log", """
+        DELETE FROM rule_evaluation_log t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+    """),
+    ("document_features", """
+        DELETE FROM document_features t USING documents d, unnest(%s::uuid[]) AS b(id)
+        WHERE t.document_id = d.id AND d.user_id = b.id
+    """),
+    ("documents", """
+        DELETE FROM documents t USING unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id
+        RETURNING t.content_sha256
+    """),
+)
+
+
+def purge_batch(cur, borrower_ids: list) -> tuple:
+    """
+    Delete every application row of the given borrowers inside the caller's transaction.
+    The borrowers themselves (users rows) are kept. Returns rows deleted per table, and the blobs
+    of the deleted documents that no other document refers to; the caller deletes those once the
+    transaction has committed (delete_unreferenced_blobs).
+    """
+    # Lock the documents first: pipeline writes for these borrowers reference them, so they wait
+    # for this transaction instead of adding rows behind the deletes
+    cur.execute("""
+        SELECT 1 FROM documents t, unnest(%s::uuid[]) AS b(id) WHERE t.user_id = b.id FOR UPDATE OF t
+    """, (borrower_ids,))
+    counts = {}
+    for table, sql in PURGE_STATEMENTS:
+        cur.execute(sql, (borrower_ids,))
+        counts[table] = cur.rowcount
+    blobs = list({row[0] for row in cur.fetchall() if row[0]})
+    cur.execute("""
+        SELECT h FROM unnest(%s::text[]) AS h WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.content_sha256 = h)
+    """, (blobs,))
+    return counts, [row[0] for row in cur.fetchall()]
+
+
+def delete_unreferenced_blobs(conn, blobs: list) -> int:
+    """
+    Delete the given blobs from the blob store unless a documents row refers to them again, e.g. an
+    identical file uploaded since. Returns the number of blobs deleted.
+    """
+    if not blobs:
+        return 0
+    blob_store = get_blob_store()
+    deleted = 0
+    try:
+        with conn.cursor() as cur:
+            # Sorted, so two purges lock shared blobs in the same order
+            for sha256 in sorted(blobs):
+                lock_blob(cur, sha256)
+            cur.execute("""
+                SELECT DISTINCT content_sha256 FROM documents WHERE content_sha256 = ANY(%s)
+            """, (blobs,))
+            referenced = {row[0] for row in cur.fetchall()}
+            for sha256 in blobs:
+                if sha256 not in referenced and blob_store.delete(sha256):
+                    deleted += 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return deleted
+
+
+def _expired_borrowers(cur, cutoff: datetime, after: str, limit: int) -> list:
+    """Borrowers, in id order after `after`, with no document upload and no decision since `cutoff`."""
+    cur.execute("""
+        SELECT d.user_id FROM documents d
+        WHERE d.user_id > COALESCE(%s::uuid, '00000000-0000-0000-0000-000000000000'::uuid)
+        GROUP BY d.user_id
+        HAVING max(d.uploaded_at) < %s
+           AND NOT EXISTS (
+               SELECT 1 FROM current_decision cd WHERE cd.borrower_id = d.user_id AND cd.created_at >= %s
+           )
+        ORDER BY d.user_id
+        LIMIT %s
+    """, (after, cutoff, cutoff, limit))
+    return [str(row[0]) for row in cur.fetchall()]
+
+
+def _batches(conn, borrower_ids: list, older_than_days: int, batch_size: int):
+    if borrower_ids is not None:
+        # Parsed up front so a malformed id fails before anything is deleted
+        ids = list(dict.fromkeys(str(uuid.UUID(str(borrower_id))) for borrower_id in borrower_ids))
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+        return
+    # The cutoff is fixed, on the database clock, when the purge starts, so rows written while it
+    # runs are never picked up
+    with conn.cursor() as cur:
+        cur.execute("SELECT LOCALTIMESTAMP - make_interval(days => %s)", (older_than_days,))
+        cutoff = cur.fetchone()[0]
+    after = None
+    while True:
+        with conn.cursor() as cur:
+            batch = _expired_borrowers(cur, cutoff, after, batch_size)
+        conn.commit()
+        if not batch:
+            return
+        yield batch
+        after = batch[-1]
+
+
+def purge_applications(conn, borrower_ids: list = None, older_than_days: int = None,
+                       batch_size: int = None, dry_run: bool = False) -> dict:
+    """
+    Purge the applications of an explicit list of borrowers, or of every borrower whose last
+    upload and decision are more than older_than_days old, batch_size borrowers per transaction.
+    With dry_run each batch is rolled back, so the counts show what would be deleted.
+    """
+    if (borrower_ids is None) == (older_than_days is None):
+        raise ValueError("Give either borrower_ids or older_than_days")
+    if older_than_days is not None and older_than_days < 0:
+        raise ValueError("older_than_days must not be negative")
+    batch_size = max(1, min(batch_size or PURGE_BATCH_SIZE, PURGE_MAX_BATCH_SIZE))
+
+    deleted = {table: 0 for table, _ in PURGE_STATEMENTS}
+    borrowers = batches = blobs_deleted = 0
+    for batch in _batches(conn, borrower_ids, older_than_days, batch_size):
+        try:
+            with observe_stage("purge_batch"), conn.cursor() as cur:
+                counts, blobs = purge_batch(cur, batch)
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if dry_run:
+            blobs_deleted += len(blobs)
+        else:
+            for borrower_id in batch:
+                explanation_cache.invalidate(borrower_id)
+            with observe_stage("purge_blobs"):
+                blobs_deleted += delete_unreferenced_blobs(conn, blobs)
+        for table, count in counts.items():
+            deleted[table] += count
+        borrowers += len(batch)
+        batches += 1
+        logger.info("Purge batch %d: %d borrowers, %s, %d blobs%s", batches, len(batch), counts, len(blobs),
+                    " (dry run)" if dry_run else "")
+    return {"dry_run": dry_run, "batches": batches, "borrowers": borrowers, "deleted": deleted, "blobs_deleted": blobs_deleted}
+
+
+class PurgeJobs:
+    """
+    Purges that need more than one batch, run one at a time in a background thread on their own
+    connection, so an HTTP request does not hold a pooled connection or a request thread while they
+    run. Jobs are kept in memory only; a purge cut short by a restart can simply be started again.
+    """
+
+    def __init__(self, history: int = PURGE_JOB_HISTORY):
+        self.history = history
+        self._jobs = OrderedDict()  # job_id -> job dict
+        self._running = None
+        self._lock = threading.Lock()
+
+    def start(self, borrower_ids: list = None, older_than_days: int = None, batch_size: int = None,
+              dry_run: bool = False, requested_by: str = None) -> dict:
+        with self._lock:
+            if self._running is not None:
+                raise RuntimeError(f"Purge job {self._running} is still running")
+            job_id = str(uuid.uuid4())
+            job = {"job_id": job_id, "status": "running", "requested_by": requested_by,
+                   "started_at": datetime.now(), "finished_at": None, "result": None, "error": None}
+            self._jobs[job_id] = job
+            self._running = job_id
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job, borrower_ids, older_than_days, batch_size, dry_run),
+                         name=f"purge-{job_id}", daemon=True).start()
+        return dict(job)
+
+    def _run(self, job: dict, *args):
+        result = error = None
+        try:
+            conn = get_connection()
+            try:
+                result = purge_applications(conn, *args)
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.exception("Purge job %s failed: %s", job["job_id"], e)
+            error = str(e)
+        with self._lock:
+            job.update(status="failed" if error else "completed", finished_at=datetime.now(), result=result, error=error)
+            self._running = None
+        logger.info("Purge job %s %s: %s", job["job_id"], job["status"], result)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+purge_jobs = PurgeJobs()
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Header
-from models import LoginRequest,ExplanationResponse,ManualDecisionUpdateRequest, UserCreate, UserRead
+from fastapi import APIRouter, HTTPException, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from models import LoginRequest,ExplanationResponse,ManualDecisionUpdateRequest, UserCreate, UserRead, PurgeApplicationsRequest
 from explanation_service import explain_borrower_application
 from override_decision_service import update_decision_by_underwriter
-from underwriter_service import get_users, get_user_by_id, create_user, delete_borrower_application, send_ml_model_train_request, generate_decision_exp_letter
+from underwriter_service import get_users, stream_users, get_user_by_id, create_user, delete_borrower_application, purge_borrower_applications, get_purge_job, send_ml_model_train_request, generate_decision_exp_letter, USER_PAGE_SIZE, USER_PAGE_MAX_SIZE
 from login_service import authenticate
 
 router = APIRouter(prefix="/underwriter-helper-service")
@@ -12,8 +14,8 @@ def explain_usr_application(user_id: str):
     return explain_borrower_application(user_id)
 
 @router.get("/generate-decision-letter/{user_id}")
-def generate_decision_letter(user_id: str):
-    return generate_decision_exp_letter(user_id)
+def get_decision_letter(user_id: str, x_underwriter_id: str = Header(...)):
+    return generate_decision_exp_letter(user_id, x_underwriter_id)
     
 
 @router.post("/manual-decision-update")
@@ -22,8 +24,15 @@ def manual_decision_update(request: ManualDecisionUpdateRequest):
 
 
 @router.get("/underwriters", response_model=list[UserRead])
-def list_users():
-    return get_users()
+def list_users(response: Response, limit: int = Query(USER_PAGE_SIZE, ge=1, le=USER_PAGE_MAX_SIZE),
+               cursor: Optional[str] = None, format: str = Query("json", pattern="^(json|ndjson)$")):
+    # One page per call; X-Next-Cursor is absent on the last page. ndjson streams every match from the cursor on.
+    if format == "ndjson":
+        return StreamingResponse(stream_users(cursor), media_type="application/x-ndjson")
+    users, next_cursor = get_users(limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return users
 
 @router.get("/underwriter/{user_id}", response_model=UserRead)
 def get_user( user_id: str):
@@ -38,6 +47,18 @@ def add_user(user: UserCreate):
 def delete_application(user_id: str):
     return delete_borrower_application(user_id)
 
+# Bulk delete by borrower ids or age; returns rows deleted per table, or 202 and a job for larger purges
+@router.post("/applications/purge")
+def purge_applications(request: PurgeApplicationsRequest, response: Response, x_underwriter_id: str = Header(...)):
+    result = purge_borrower_applications(request, x_underwriter_id)
+    if "job_id" in result:
+        response.status_code = 202
+    return result
+
+@router.get("/applications/purge/{job_id}")
+def purge_job_status(job_id: str):
+    return get_purge_job(job_id)
+
 @router.post("/request-ml-training")
 def train_ml_model(x_underwriter_id: str = Header(...)):
     return send_ml_model_train_request(x_underwriter_id)
@@ -1,32 +1,74 @@
-from db import get_connection
-from models import UserCreate, UserRead
+from db import db_connection, read_db_connection
+from models import UserCreate, UserRead, PurgeApplicationsRequest
 from logger import logger
+from metrics import observe_stage
+from explanation_cache import explanation_cache
+from explanation_service import explain_borrower_application
+from purge_service import purge_batch, delete_unreferenced_blobs, purge_applications, purge_jobs, PURGE_BATCH_SIZE, PURGE_MAX_BATCH_SIZE
 import os
+import json
+import uuid
 import httpx
 from fastapi import HTTPException
 
 role = "underwriter"
 ML_DECISION_SERVICE_URL = os.getenv("ML_DECISION_SERVICE_URL", "http://ml-decision-service:8000")  
 EXPLANATION_LETTER_SERVICE_URL = os.getenv("EXPLANATION_LETTER_SERVICE_URL", "http://explanation-letter-service:8000")
+# Page size for GET /underwriters, the largest page a client may ask for, and rows fetched per round trip when streaming
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", 100))
+USER_PAGE_MAX_SIZE = int(os.getenv("USER_PAGE_MAX_SIZE", 1000))
+USER_STREAM_FETCH_SIZE = int(os.getenv("USER_STREAM_FETCH_SIZE", 2000))
 
-def get_users():
-    logger.info("Fetching all underwriters")
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, full_name, email, role FROM users WHERE role = %s", (role,))
-    users = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3]) for u in users]
+def _decode_cursor(cursor: str):
+    """Cursors are the id of the last underwriter on the previous page."""
+    if not cursor:
+        return None
+    try:
+        return str(uuid.UUID(cursor))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _underwriters_query(after: str = None, limit: int = None):
+    # Keyset over the primary key, so every page costs the same however deep it is
+    sql = "SELECT id, full_name, email, role FROM users WHERE role = %s"
+    params = [role]
+    if after:
+        sql += " AND id > %s"
+        params.append(after)
+    sql += " ORDER BY id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+def get_users(limit: int = USER_PAGE_SIZE, cursor: str = None):
+    """One page of underwriters and the cursor for the next page (None on the last page)."""
+    logger.info("Fetching underwriters")
+    limit = max(1, min(limit, USER_PAGE_MAX_SIZE))
+    sql, params = _underwriters_query(_decode_cursor(cursor), limit + 1)
+    with read_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        users = cur.fetchall()
+    next_cursor = str(users[limit - 1][0]) if len(users) > limit else None
+    return [UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3]) for u in users[:limit]], next_cursor
+
+def stream_users(cursor: str = None):
+    """Every underwriter from the cursor on as NDJSON lines, read through a server-side cursor."""
+    sql, params = _underwriters_query(_decode_cursor(cursor))
+    return _stream_rows(sql, params)
+
+def _stream_rows(sql: str, params: list):
+    with read_db_connection() as conn, conn.cursor(name=f"underwriters_{uuid.uuid4().hex}") as cur:
+        cur.itersize = USER_STREAM_FETCH_SIZE
+        cur.execute(sql, params)
+        for u in cur:
+            yield json.dumps({"id": str(u[0]), "full_name": u[1], "email": u[2], "role": u[3]}) + "\n"
 
 def get_user_by_id(user_id: str):
     logger.info(f"Fetching underwriter with ID: {user_id}")
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, full_name, email, role FROM users WHERE id = %s AND role = %s", (user_id, role))
-    u = cur.fetchone()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, full_name, email, role FROM users WHERE id = %s AND role = %s", (user_id, role))
+        u = cur.fetchone()
     if not u:
         raise Exception("User not found")
     return UserRead(id=u[0], full_name=u[1], email=u[2], role=u[3])
@@ -35,68 +77,84 @@ def create_user(user: UserCreate):
     logger.info(f"Creating new underwriter: {user.full_name}, {user.email}")
     import bcrypt
     hashed = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode()
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO users (full_name, email, password_hash, role)
-        VALUES (%s, %s, %s, %s)
-        RETURNING id
-    """, (user.full_name, user.email, hashed, role))
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (full_name, email, password_hash, role)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (user.full_name, user.email, hashed, role))
+        new_id = cur.fetchone()[0]
+        conn.commit()
     return UserRead(id=new_id, full_name=user.full_name, email=user.email, role=role)
 
 def delete_borrower_application(user_id: str):
     try:
         logger.info(f"Deleting borrower application for user ID: {user_id}")
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM decision_log WHERE borrower_id = %s", (user_id,))
-        deleted_count = cur.rowcount
-        conn.commit()
-        if deleted_count == 0:
-            raise Exception("No application found for the given user ID")
-        logger.info(f"Deleted {deleted_count} record from decision_log for user ID: {user_id}")
-
-        #for rule_evaluation_log
-        cur.execute("DELETE FROM rule_evaluation_log WHERE user_id = %s", (user_id,))
-        deleted_count = cur.rowcount
-        conn.commit()
-        logger.info(f"Deleted {deleted_count} record from rule_evaluation_log for user ID: {user_id}")
-
-        #for fairness_audit_log
-        cur.execute("DELETE FROM fairness_audit_log WHERE ml_result_id = (select id FROM ml_prediction_results WHERE user_id = %s)", (user_id,))
-        deleted_count = cur.rowcount
-        conn.commit()
-        logger.info(f"Deleted {deleted_count} record from fairness_audit_log for user ID: {user_id}")   
-
-        #do the same for ml_evaluation_log
-        cur.execute("DELETE FROM ml_prediction_results WHERE user_id = %s", (user_id,))
-        deleted_count = cur.rowcount
-        conn.commit()
-        logger.info(f"Deleted {deleted_count} record from ml_evaluation_log for user ID: {user_id}")
-
-        #do the same for documents
-        cur.execute("DELETE FROM documents WHERE user_id = %s", (user_id,))
-        deleted_count = cur.rowcount
-        conn.commit()
-        logger.info(f"Deleted {deleted_count} record from ml_evaluation_log for user ID: {user_id}")
-        cur.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cur:
+            # One transaction: either the whole application goes or nothing does
+            counts, blobs = purge_batch(cur, [user_id])
+            if counts["decision_log"] == 0 and counts["current_decision"] == 0:
+                conn.rollback()
+                raise Exception("No application found for the given user ID")
+            conn.commit()
+            blobs_deleted = delete_unreferenced_blobs(conn, blobs)
+        logger.info(f"Deleted application rows for user ID {user_id}: {counts}, {blobs_deleted} blobs")
+        explanation_cache.invalidate(user_id)
         return {"message": f"Deleted application for user ID: {user_id}"}
     except Exception as e:
         logger.exception(f"Error deleting borrower application for user ID: {user_id}: {e}")
         return {"error": "Error deleting borrower application"} 
-    
+
+def _require_underwriter(underwriter_id: str, action: str):
+    try:
+        underwriter_id = str(uuid.UUID(underwriter_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Underwriter-Id must be a user id")
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT role FROM users WHERE id = %s", (underwriter_id,))
+        user = cur.fetchone()
+    if not user or user[0] != "underwriter":
+        raise HTTPException(status_code=403, detail=f"This user is not allowed to {action}")
+
+def purge_borrower_applications(request: PurgeApplicationsRequest, underwriter_id: str):
+    """
+    A purge of at most one batch of listed borrowers runs inline and returns its counts. Anything
+    larger, and every older_than_days purge, starts a background job and returns its handle.
+    """
+    _require_underwriter(underwriter_id, "purge applications")
+    logger.info(f"Purge requested by underwriter ID {underwriter_id}: {request.model_dump()}")
+    batch_size = max(1, min(request.batch_size or PURGE_BATCH_SIZE, PURGE_MAX_BATCH_SIZE))
+    try:
+        if request.borrower_ids is not None and request.older_than_days is None and len(request.borrower_ids) <= batch_size:
+            with db_connection() as conn:
+                return purge_applications(conn, request.borrower_ids, None, batch_size, request.dry_run)
+        if (request.borrower_ids is None) == (request.older_than_days is None):
+            raise ValueError("Give either borrower_ids or older_than_days")
+        if request.older_than_days is not None and request.older_than_days < 0:
+            raise ValueError("older_than_days must not be negative")
+        if request.borrower_ids is not None:
+            # Fail on a malformed id now rather than in the background job
+            [uuid.UUID(str(borrower_id)) for borrower_id in request.borrower_ids]
+        return purge_jobs.start(request.borrower_ids, request.older_than_days, batch_size, request.dry_run,
+                                requested_by=underwriter_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def get_purge_job(job_id: str):
+    job = purge_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Purge job not found")
+    return job
+
 def send_ml_model_train_request(underwriter_id: str):
     headers = {
         "x-user-id": underwriter_id
     }
 
     try:
-        with httpx.Client() as client:
+        with httpx.Client() as client, observe_stage("http_ml_train"):
             response = client.post(f"{ML_DECISION_SERVICE_URL}/train-ml-model", headers=headers)
             if response.status_code == 200:
                 return response.json()
@@ -110,25 +168,14 @@ def send_ml_model_train_request(underwriter_id: str):
     
 def generate_decision_exp_letter(borrower_id: str, underwriter_id: str):
     logger.info(f"Generating decision explanation letter for borrower ID: {borrower_id} by underwriter ID: {underwriter_id}")
-    # Validate borrower role
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT role FROM users WHERE id = %s", (underwriter_id,))
-        user = cur.fetchone()
-        if not user or user[0] != "underwriter":
-            raise HTTPException(status_code=403, detail="This user is not allowed to generate explanation letters")
-    except HTTPException as he:
-        raise he
-    finally:
-        cur.close()
-        conn.close()
-    explanation = explain_borrower_application(borrower_id)
+    _require_underwriter(underwriter_id, "generate explanation letters")
+    with observe_stage("explanation_fetch"):
+        explanation = explain_borrower_application(borrower_id)
     payload = explanation.model_dump()
     logger.info(f"Explanation fetched for borrower ID {borrower_id}: {payload}")
 
     try:
-        with httpx.Client(timeout=30.0) as client:
+        with httpx.Client(timeout=30.0) as client, observe_stage("http_explanation_letter"):
             response = client.post(
                 f"{EXPLANATION_LETTER_SERVICE_URL}/generate_letter",
                 json=payload